@@ -1,28 +1,69 @@
-from fastapi import APIRouter, Depends, UploadFile, File, HTTPException, Query, BackgroundTasks, Body, Request, Response
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi import APIRouter, Depends, UploadFile, File, HTTPException, Query, Body, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from typing import List, Optional
 import os
-from backend.schemas import MediaOut
-from backend.crud.media import create_media, get_media, list_media, delete_media, update_media
+from sqlalchemy.exc import IntegrityError
+from backend.schemas import MediaOut, MediaCreate, TranscodeJobOut, DownloadJobOut, UploadSessionOut
+from backend.crud.media import create_media, create_media_bulk, set_media_info, get_media, get_media_by_filename, get_media_items, list_media_page, delete_media, update_media
+from backend.crud.search import search_media_ids
+from backend.crud.jobs import get_job, get_active_job_for_output, list_jobs, cancel_queued_jobs, get_download_job, list_download_jobs
 from backend.auth.dependencies import get_db, get_current_user
-from backend.utils.transcoding import transcode_to_hls
-import subprocess
-
-MEDIA_ROOT = os.getenv("MEDIA_ROOT", "media")
+from backend.scheduler import transcode_scheduler, PRIORITY_INTERACTIVE
+from backend.cache import derivative_cache, hls_path, preview_path
+from backend.crud.uploads import get_upload_session, list_upload_sessions
+from backend.downloads import download_manager
+from backend.uploads import upload_sessions, parse_checksum, InvalidChunk, ChunkConflict, ChecksumMismatch, UploadIncomplete
+from backend.live import live_transcoder, LIVE_TRANSCODE, EncoderLimitReached
+from backend.hls_ondemand import hls_on_demand, HLS_ON_DEMAND, ONDEMAND_DIR, SegmentUnavailable, parse_segment_name
+from backend.storage import store_upload, release_blob, derivative_key, media_key
+from backend.utils.file import UploadTooLarge
+from backend.utils.http import send_file, make_etag
+from backend.utils.images import image_renderer, variant_path, IMAGE_MAX_DIMENSION, IMAGE_DEFAULT_QUALITY
+from backend.utils.pagination import InvalidCursor
+from backend.utils.previews import POSTER_NAME, SPRITE_IMAGE, SPRITE_VTT, THUMBNAIL_WIDTHS, thumbnail_name
+from backend.utils.transcoding import HLS_MASTER_PLAYLIST, hls_output_complete, probe_media
 
 router = APIRouter()
 
+# Cache lifetime for posters, sprites and image variants; ETags cover revalidation
+DERIVATIVE_MAX_AGE = 30 * 24 * 3600
+
 @router.get("/media", response_model=List[MediaOut])
-def api_list_media(db: Session = Depends(get_db), current_user = Depends(get_current_user)):
-    media_files = list_media(db)
-    return [MediaOut(
-        id=m.id,
-        filename=m.filename,
-        filepath=m.filepath,
-        genre=m.genre.name if m.genre else None,
-        tags=[t.name for t in m.tags]
-    ) for m in media_files]
+def api_list_media(
+    response: Response,
+    limit: int = Query(100, ge=1, le=1000, description="Page size; follow X-Next-Cursor for the rest"),
+    after: Optional[str] = Query(None, description="Cursor from the X-Next-Cursor header of the previous page"),
+    sort: str = Query("id", pattern="^(id|name)$"),
+    genre: Optional[str] = Query(None),
+    tag: Optional[str] = Query(None),
+    uploader: Optional[int] = Query(None, description="Uploader user id"),
+    media_type: Optional[str] = Query(None, alias="type", pattern="^(video|audio|image)$"),
+    db: Session = Depends(get_db),
+    current_user = Depends(get_current_user)
+):
+    try:
+        items, next_cursor = list_media_page(
+            db, limit=limit, after=after, sort=sort,
+            genre=genre, tag=tag, uploader_id=uploader, media_type=media_type
+        )
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return items
+
+@router.get("/media/search", response_model=List[MediaOut])
+def api_search_media(
+    q: str = Query(..., min_length=1, description="Words to match against filename, genre and tags (prefixes allowed)"),
+    limit: int = Query(50, ge=1, le=200),
+    offset: int = Query(0, ge=0),
+    db: Session = Depends(get_db),
+    current_user = Depends(get_current_user)
+):
+    """Full-text search, best matches first."""
+    return get_media_items(db, search_media_ids(db, q, limit=limit, offset=offset))
 
 @router.post("/media/upload", response_model=MediaOut)
 def api_upload_media(
@@ -30,18 +71,35 @@ def api_upload_media(
     genre: str = None,
     tags: List[str] = [],
     db: Session = Depends(get_db),
-    current_user = Depends(get_current_user),
-    background_tasks: BackgroundTasks = None
+    current_user = Depends(get_current_user)
 ):
-    save_path = os.path.join(MEDIA_ROOT, file.filename)
-    with open(save_path, "wb") as f:
-        f.write(file.file.read())
-    media = create_media(db, file.filename, save_path, genre, tags, current_user.id, user=current_user)
-    # Automatically transcode to HLS in the background if video
-    ext = os.path.splitext(file.filename)[1].lower()
-    if ext in [".mp4", ".mkv", ".mov"] and background_tasks is not None:
-        hls_dir = os.path.join(MEDIA_ROOT, f"hls_{media.id}")
-        background_tasks.add_task(transcode_to_hls, save_path, hls_dir)
+    filename = os.path.basename(file.filename)
+    if get_media_by_filename(db, filename):
+        raise HTTPException(status_code=409, detail=f"A media item named {filename} already exists")
+    try:
+        blob = store_upload(db, file, filename)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    return _add_upload(db, blob, filename, genre, tags, current_user)
+
+def _add_upload(db: Session, blob, filename: str, genre: Optional[str], tags: List[str], user):
+    """Create the media row for a stored upload, probe it and queue its derivatives."""
+    try:
+        media = create_media(db, filename, blob.path, genre, tags, user.id, user=user, blob_id=blob.id)
+    except IntegrityError:
+        # Same name uploaded concurrently
+        db.rollback()
+        release_blob(db, blob.id)
+        raise HTTPException(status_code=409, detail=f"A media item named {filename} already exists")
+    ext = os.path.splitext(filename)[1].lower()
+    if ext in [".mp4", ".mkv", ".mov", ".mp3", ".aac", ".flac"]:
+        # ffprobe only reads the headers; transcode jobs refresh this before encoding
+        info = probe_media(blob.path)
+        if info:
+            set_media_info(db, media.id, info)
+    # Automatically queue an HLS transcode if video (a duplicate finds it done)
+    if ext in [".mp4", ".mkv", ".mov"]:
+        transcode_scheduler.queue_video_derivatives(db, media.id, blob.path, blob.sha256)
     return MediaOut(
         id=media.id,
         filename=media.filename,
@@ -50,78 +108,336 @@ def api_upload_media(
         tags=[t.name for t in media.tags]
     )
 
-@router.post("/media/download")
+@router.post("/media/uploads", response_model=UploadSessionOut, status_code=201)
+def api_create_upload(
+    filename: str = Body(...),
+    size: int = Body(..., ge=1),
+    sha256: Optional[str] = Body(None, pattern="^[0-9a-fA-F]{64}$", description="Whole-file hash, checked on completion"),
+    genre: str = Body(None),
+    tags: List[str] = Body([]),
+    db: Session = Depends(get_db),
+    current_user = Depends(get_current_user)
+):
+    """Start a resumable upload; send chunks with PUT /media/uploads/{session_id}?offset=."""
+    filename = os.path.basename(filename)
+    if not filename:
+        raise HTTPException(status_code=400, detail="Invalid filename")
+    if get_media_by_filename(db, filename):
+        raise HTTPException(status_code=409, detail=f"A media item named {filename} already exists")
+    try:
+        session = upload_sessions.create(db, current_user.id, filename, size, sha256, genre, tags)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    return upload_sessions.describe(db, session)
+
+@router.get("/media/uploads", response_model=List[UploadSessionOut])
+def api_list_uploads(db: Session = Depends(get_db), current_user = Depends(get_current_user)):
+    return [upload_sessions.describe(db, session) for session in list_upload_sessions(db, current_user.id)]
+
+def _upload_session(db: Session, session_id: int, user):
+    session = get_upload_session(db, session_id)
+    if not session or session.user_id != user.id:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    return session
+
+@router.get("/media/uploads/{session_id}", response_model=UploadSessionOut)
+def api_get_upload(session_id: int, db: Session = Depends(get_db), current_user = Depends(get_current_user)):
+    """Received byte ranges ([start, end)); resume by sending the gaps."""
+    return upload_sessions.describe(db, _upload_session(db, session_id, current_user))
+
+@router.put("/media/uploads/{session_id}", response_model=UploadSessionOut)
+async def api_upload_chunk(
+    session_id: int,
+    request: Request,
+    offset: int = Query(..., ge=0),
+    db: Session = Depends(get_db),
+    current_user = Depends(get_current_user)
+):
+    """Write one chunk (raw request body) at `offset`; needs Content-Length and Upload-Checksum: sha256 <base64>."""
+    session = await run_in_threadpool(_upload_session, db, session_id, current_user)
+    try:
+        length = int(request.headers["content-length"])
+    except (KeyError, ValueError):
+        raise HTTPException(status_code=411, detail="Content-Length is required")
+    try:
+        digest = parse_checksum(request.headers.get("upload-checksum"))
+        await upload_sessions.receive(db, session, offset, length, digest, request.stream())
+    except InvalidChunk as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ChunkConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ChecksumMismatch as e:
+        # 460 Checksum Mismatch, as in tus
+        raise HTTPException(status_code=460, detail=str(e))
+    return await run_in_threadpool(upload_sessions.describe, db, session)
+
+@router.post("/media/uploads/{session_id}/complete", response_model=MediaOut)
+def api_complete_upload(session_id: int, db: Session = Depends(get_db), current_user = Depends(get_current_user)):
+    """Add a fully received upload to the library, like /media/upload."""
+    session = _upload_session(db, session_id, current_user)
+    filename, genre = session.filename, session.genre
+    tags = session.tags.split(",") if session.tags else []
+    if get_media_by_filename(db, filename):
+        raise HTTPException(status_code=409, detail=f"A media item named {filename} already exists")
+    try:
+        blob = upload_sessions.complete(db, session)
+    except UploadIncomplete as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ChecksumMismatch as e:
+        raise HTTPException(status_code=460, detail=str(e))
+    return _add_upload(db, blob, filename, genre, tags, current_user)
+
+@router.delete("/media/uploads/{session_id}")
+def api_cancel_upload(session_id: int, db: Session = Depends(get_db), current_user = Depends(get_current_user)):
+    upload_sessions.discard(db, _upload_session(db, session_id, current_user))
+    return {"detail": "Upload cancelled"}
+
+@router.post("/media/bulk")
+def api_bulk_create_media(
+    items: List[MediaCreate],
+    db: Session = Depends(get_db),
+    current_user = Depends(get_current_user)
+):
+    """Register files already on the server in a single transaction."""
+    if current_user.role != 'admin':
+        raise HTTPException(status_code=403, detail="Admin only")
+    missing = [item.filepath for item in items if not os.path.isfile(item.filepath)]
+    if missing:
+        raise HTTPException(status_code=400, detail={"message": "Files not found", "paths": missing[:50]})
+    try:
+        media_ids = create_media_bulk(db, [item.dict() for item in items], current_user.id, user=current_user)
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(status_code=409, detail="Duplicate filename")
+    for item, media_id in zip(items, media_ids):
+        if os.path.splitext(item.filename)[1].lower() in [".mp4", ".mkv", ".mov"]:
+            # Registered in place: derivatives are keyed by media id
+            transcode_scheduler.queue_video_derivatives(db, media_id, item.filepath, media_id)
+    return {"detail": f"{len(media_ids)} media added", "ids": media_ids}
+
+@router.post("/media/download", status_code=202)
 def download_video(
     url: str = Body(...),
     genre: str = Body(None),
     tags: List[str] = Body([]),
     quality: str = Body("best"),
     db: Session = Depends(get_db),
-    current_user = Depends(get_current_user),
-    background_tasks: BackgroundTasks = None
+    current_user = Depends(get_current_user)
 ):
-    # Use yt-dlp to download the video
-    # Save to MEDIA_ROOT, get the filename
-    os.makedirs(MEDIA_ROOT, exist_ok=True)
-    cmd = [
-        "yt-dlp",
-        "-f", quality,
-        "-o", os.path.join(MEDIA_ROOT, "%(title)s.%(ext)s"),
-        url
-    ]
-    result = subprocess.run(cmd, capture_output=True, text=True)
-    if result.returncode != 0:
-        raise HTTPException(status_code=500, detail=f"yt-dlp failed: {result.stderr}")
-    # Find the downloaded file (yt-dlp prints the filename)
-    # We'll look for the newest file in MEDIA_ROOT
-    files = [os.path.join(MEDIA_ROOT, f) for f in os.listdir(MEDIA_ROOT)]
-    latest_file = max(files, key=os.path.getctime)
-    filename = os.path.basename(latest_file)
-    # Add to DB
-    media = create_media(db, filename, latest_file, genre, tags, current_user.id, user=current_user)
-    # Trigger HLS transcoding if video
-    ext = os.path.splitext(filename)[1].lower()
-    if ext in [".mp4", ".mkv", ".mov"] and background_tasks is not None:
-        hls_dir = os.path.join(MEDIA_ROOT, f"hls_{media.id}")
-        background_tasks.add_task(transcode_to_hls, latest_file, hls_dir)
-    return {"detail": "Download started and media added!"}
+    """Queue a yt-dlp download; poll /media/downloads/{job_id} for progress."""
+    job = download_manager.submit(db, url, quality, genre, tags, current_user.id)
+    return {"detail": "Download queued", "job_id": job.id}
 
-@router.api_route("/media/hls/{media_id}/{filename}", methods=["GET", "HEAD"])
-def serve_hls(media_id: int, filename: str, db: Session = Depends(get_db), request: Request = None):
-    hls_dir = os.path.join(MEDIA_ROOT, f"hls_{media_id}")
-    file_path = os.path.join(hls_dir, filename)
-    if not os.path.exists(file_path):
+@router.get("/media/downloads", response_model=List[DownloadJobOut])
+def api_list_downloads(
+    state: Optional[str] = Query(None, pattern="^(queued|running|done|failed)$"),
+    limit: int = Query(100, ge=1, le=1000),
+    db: Session = Depends(get_db),
+    current_user = Depends(get_current_user)
+):
+    # Admins see every download, other users their own
+    user_id = None if current_user.role == 'admin' else current_user.id
+    return list_download_jobs(db, user_id=user_id, state=state, limit=limit)
+
+@router.get("/media/downloads/{job_id}", response_model=DownloadJobOut)
+def api_get_download(job_id: int, db: Session = Depends(get_db), current_user = Depends(get_current_user)):
+    job = get_download_job(db, job_id)
+    if not job or (current_user.role != 'admin' and job.user_id != current_user.id):
+        raise HTTPException(status_code=404, detail="Download not found")
+    return job
+
+@router.get("/media/jobs", response_model=List[TranscodeJobOut])
+def api_list_jobs(
+    state: Optional[str] = Query(None, description="Filter by job state"),
+    media_id: Optional[int] = Query(None),
+    limit: int = Query(100, ge=1, le=1000),
+    db: Session = Depends(get_db),
+    current_user = Depends(get_current_user)
+):
+    # Admins see every job, other users those of the media they uploaded
+    uploader_id = None if current_user.role == 'admin' else current_user.id
+    return list_jobs(db, state=state, media_id=media_id, uploader_id=uploader_id, limit=limit)
+
+@router.get("/media/jobs/{job_id}", response_model=TranscodeJobOut)
+def api_get_job(job_id: int, db: Session = Depends(get_db), current_user = Depends(get_current_user)):
+    job = get_job(db, job_id)
+    if job and current_user.role != 'admin':
+        media = get_media(db, job.media_id)
+        if media is None or media.uploader_id != current_user.id:
+            job = None
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+def _hls_dir(db: Session, media_id: int):
+    key = media_key(db, media_id)
+    if key is None:
+        raise HTTPException(status_code=404, detail="HLS file not found")
+    return hls_path(key)
+
+def _hls_file(hls_dir: str, *parts: str):
+    # Path parameters cannot contain "/", but reject "." and ".." style names too
+    if any(not part or part.startswith(".") for part in parts):
+        raise HTTPException(status_code=404, detail="HLS file not found")
+    if parts == ("playlist.m3u8",):
+        # Ladder output exposes its master playlist under the legacy name too
+        master_path = os.path.join(hls_dir, HLS_MASTER_PLAYLIST)
+        if os.path.isfile(master_path):
+            return master_path
+    file_path = os.path.join(hls_dir, *parts)
+    if not os.path.isfile(file_path):
+        raise HTTPException(status_code=404, detail="HLS file not found")
+    return file_path
+
+def _hls_ready(db: Session, hls_dir: str):
+    """True when a full HLS transcode has finished into this directory."""
+    has_playlist = hls_output_complete(hls_dir) or os.path.isfile(os.path.join(hls_dir, "playlist.m3u8"))
+    return has_playlist and get_active_job_for_output(db, "hls", hls_dir) is None
+
+def _ondemand_media(db: Session, media_id: int):
+    media = get_media(db, media_id)
+    if not media or os.path.splitext(media.filename)[1].lower() not in [".mp4", ".mkv", ".mov"]:
         raise HTTPException(status_code=404, detail="HLS file not found")
-    if request and request.method == "HEAD":
-        return Response(status_code=200)
-    return FileResponse(file_path)
+    return media
+
+@router.api_route("/media/hls/{media_id}/{filename}", methods=["GET", "HEAD"])
+def serve_hls(media_id: int, filename: str, request: Request, db: Session = Depends(get_db)):
+    hls_dir = _hls_dir(db, media_id)
+    if filename == "playlist.m3u8" and HLS_ON_DEMAND and not _hls_ready(db, hls_dir):
+        media = _ondemand_media(db, media_id)
+        try:
+            playlist_path = hls_on_demand.playlist(media.filepath, hls_dir)
+        except SegmentUnavailable as e:
+            raise HTTPException(status_code=503, detail=str(e))
+        derivative_cache.ensure_registered(db, media_id, "hls", hls_dir)
+        return send_file(request, playlist_path)
+    file_path = _hls_file(hls_dir, filename)
+    derivative_cache.hit("hls", hls_dir)
+    return send_file(request, file_path)
+
+@router.api_route("/media/hls/{media_id}/{variant}/{filename}", methods=["GET", "HEAD"])
+def serve_hls_variant(media_id: int, variant: str, filename: str, request: Request, db: Session = Depends(get_db)):
+    hls_dir = _hls_dir(db, media_id)
+    index = parse_segment_name(filename)
+    if variant == ONDEMAND_DIR and HLS_ON_DEMAND and index is not None:
+        media = _ondemand_media(db, media_id)
+        if os.path.exists(hls_on_demand.segment_path(hls_dir, index)):
+            derivative_cache.hit("hls", hls_dir)
+        else:
+            derivative_cache.miss("hls")
+        try:
+            return send_file(request, hls_on_demand.segment(media.filepath, hls_dir, index))
+        except FileNotFoundError:
+            raise HTTPException(status_code=404, detail="HLS file not found")
+        except SegmentUnavailable as e:
+            raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "2"})
+    file_path = _hls_file(hls_dir, variant, filename)
+    derivative_cache.hit("hls", hls_dir)
+    return send_file(request, file_path)
 
 @router.post("/media/hls/{media_id}/trigger")
-def trigger_hls(media_id: int, db: Session = Depends(get_db), background_tasks: BackgroundTasks = None):
+def trigger_hls(media_id: int, db: Session = Depends(get_db)):
     media = get_media(db, media_id)
     if not media:
         raise HTTPException(status_code=404, detail="Media not found")
     ext = os.path.splitext(media.filename)[1].lower()
     if ext not in [".mp4", ".mkv", ".mov"]:
         return {"detail": "Not a video file"}
-    hls_dir = os.path.join(MEDIA_ROOT, f"hls_{media_id}")
-    playlist_path = os.path.join(hls_dir, "playlist.m3u8")
-    if os.path.exists(playlist_path):
+    hls_dir = hls_path(derivative_key(media))
+    if get_active_job_for_output(db, "hls", hls_dir) is None and hls_output_complete(hls_dir):
         return {"detail": "HLS already exists"}
-    if background_tasks is not None:
-        background_tasks.add_task(transcode_to_hls, media.filepath, hls_dir)
-        return {"detail": "HLS transcoding started"}
-    # Fallback: run synchronously (should not happen in normal API usage)
-    transcode_to_hls(media.filepath, hls_dir)
-    return {"detail": "HLS transcoding started (sync)"}
-
-@router.get("/media/stream/{media_id}")
+    job = transcode_scheduler.submit(db, media_id, "hls", media.filepath, hls_dir, priority=PRIORITY_INTERACTIVE)
+    return {"detail": "HLS transcoding started", "job_id": job.id if job else None}
+
+def _video_media(db: Session, media_id: int):
+    media = get_media(db, media_id)
+    if not media or os.path.splitext(media.filename)[1].lower() not in [".mp4", ".mkv", ".mov"]:
+        raise HTTPException(status_code=404, detail="Media not found")
+    return media
+
+def _preview_file(request: Request, db: Session, media, name: str):
+    """Serve a generated preview, queueing generation on first request."""
+    preview_dir = preview_path(derivative_key(media))
+    path = os.path.join(preview_dir, name)
+    if not os.path.isfile(path):
+        if os.path.isdir(preview_dir):
+            raise HTTPException(status_code=404, detail="Preview not found")
+        derivative_cache.miss("preview")
+        job = transcode_scheduler.submit(db, media.id, "preview", media.filepath, preview_dir, priority=PRIORITY_INTERACTIVE)
+        return JSONResponse(status_code=202, headers={"Retry-After": "2"}, content={
+            "detail": "Preview generation in progress. Please retry after a moment.",
+            "job_id": job.id if job else None,
+            "progress": job.progress if job else 0.0
+        })
+    derivative_cache.hit("preview", preview_dir)
+    response = send_file(request, path)
+    response.headers["Cache-Control"] = f"public, max-age={DERIVATIVE_MAX_AGE}"
+    return response
+
+@router.api_route("/media/{media_id}/poster", methods=["GET", "HEAD"])
+def api_media_poster(
+    media_id: int,
+    request: Request,
+    width: Optional[int] = Query(None, ge=1, description="Smallest thumbnail at least this wide; omit for the full-size poster"),
+    db: Session = Depends(get_db)
+):
+    media = _video_media(db, media_id)
+    name = POSTER_NAME
+    if width:
+        larger = [w for w in sorted(THUMBNAIL_WIDTHS) if w >= width]
+        if larger and os.path.isfile(os.path.join(preview_path(derivative_key(media)), thumbnail_name(larger[0]))):
+            name = thumbnail_name(larger[0])
+    return _preview_file(request, db, media, name)
+
+@router.api_route("/media/{media_id}/sprites.vtt", methods=["GET", "HEAD"])
+def api_media_sprites_vtt(media_id: int, request: Request, db: Session = Depends(get_db)):
+    return _preview_file(request, db, _video_media(db, media_id), SPRITE_VTT)
+
+@router.api_route("/media/{media_id}/sprites.jpg", methods=["GET", "HEAD"])
+def api_media_sprites_image(media_id: int, request: Request, db: Session = Depends(get_db)):
+    return _preview_file(request, db, _video_media(db, media_id), SPRITE_IMAGE)
+
+@router.api_route("/media/{media_id}/image", methods=["GET", "HEAD"])
+async def api_media_image(
+    media_id: int,
+    request: Request,
+    w: Optional[int] = Query(None, ge=1, le=IMAGE_MAX_DIMENSION, description="Maximum width"),
+    h: Optional[int] = Query(None, ge=1, le=IMAGE_MAX_DIMENSION, description="Maximum height"),
+    fmt: str = Query("jpeg", alias="format", pattern="^(jpeg|webp)$"),
+    q: int = Query(IMAGE_DEFAULT_QUALITY, ge=1, le=95, description="Encoder quality"),
+    db: Session = Depends(get_db)
+):
+    """A photo resized to fit w x h (aspect ratio kept, never upscaled) and re-encoded; HEIC becomes JPEG/WebP."""
+    media = await run_in_threadpool(get_media, db, media_id)
+    if not media or os.path.splitext(media.filename)[1].lower() not in [".jpg", ".jpeg", ".png", ".heic"]:
+        raise HTTPException(status_code=404, detail="Image not found")
+    try:
+        source = os.stat(media.filepath)
+    except OSError:
+        raise HTTPException(status_code=404, detail="Media file not found")
+    path = variant_path(make_etag(source), w, h, fmt, q)
+    if os.path.isfile(path):
+        derivative_cache.hit("image", path)
+    else:
+        derivative_cache.miss("image")
+        try:
+            await image_renderer.render(media.filepath, path, w, h, fmt, q)
+        except RuntimeError as e:
+            raise HTTPException(status_code=501, detail=str(e))
+        except (ValueError, OSError) as e:
+            raise HTTPException(status_code=415, detail=str(e))
+        await run_in_threadpool(derivative_cache.register, db, media.id, "image", path)
+    response = send_file(request, path)
+    response.headers["Cache-Control"] = f"public, max-age={DERIVATIVE_MAX_AGE}"
+    return response
+
+@router.api_route("/media/stream/{media_id}", methods=["GET", "HEAD"])
 def api_stream_media(
     media_id: int,
+    request: Request,
     db: Session = Depends(get_db),
     # current_user = Depends(get_current_user),  # Removed authentication for streaming
-    quality: Optional[str] = Query(None, description="Set to 'low' for low-bitrate streaming"),
-    background_tasks: BackgroundTasks = None
+    quality: Optional[str] = Query(None, description="Set to 'low' for low-bitrate streaming")
 ):
     media = get_media(db, media_id)
     if not media:
@@ -130,29 +446,50 @@ def api_stream_media(
     # Transcode video/audio on the fly if requested
     if quality == "low" and ext in [".mp4", ".mkv", ".mov", ".mp3", ".aac", ".flac"]:
         low_path = media.filepath + ".low.mp4" if ext in [".mp4", ".mkv", ".mov"] else media.filepath + ".low.mp3"
+        if not os.path.exists(low_path) and LIVE_TRANSCODE and live_transcoder.can_open(low_path):
+            media_type = "video/mp4" if low_path.endswith(".mp4") else "audio/mpeg"
+            headers = {"Cache-Control": "no-store", "X-Transcode": "live"}
+            if request.method == "HEAD":
+                derivative_cache.miss("low")
+                return Response(status_code=200, headers=headers, media_type=media_type)
+            try:
+                encoder, reader = live_transcoder.open(media.id, media.filepath, low_path)
+            except EncoderLimitReached:
+                encoder = None  # Filled up since can_open(); queue it like LIVE_TRANSCODE=0
+            except OSError:
+                raise HTTPException(status_code=503, detail="Transcoder unavailable")
+            if encoder is not None:
+                derivative_cache.miss("low")
+                return StreamingResponse(live_transcoder.stream(encoder, reader), headers=headers, media_type=media_type)
         if not os.path.exists(low_path):
-            def do_transcode():
-                try:
-                    if ext in [".mp4", ".mkv", ".mov"]:
-                        transcode_media(media.filepath, low_path, bitrate="500k", resolution="426x240")
-                    else:
-                        transcode_media(media.filepath, low_path, bitrate="64k")
-                except Exception as e:
-                    # Optionally log error
-                    pass
-            if background_tasks is not None:
-                background_tasks.add_task(do_transcode)
-            return JSONResponse(status_code=202, content={"detail": "Transcoding in progress. Please retry after a moment."})
-        return FileResponse(low_path, filename=os.path.basename(low_path))
-    return FileResponse(media.filepath, filename=media.filename)
+            derivative_cache.miss("low")
+            job = transcode_scheduler.submit(db, media.id, "low", media.filepath, low_path, priority=PRIORITY_INTERACTIVE)
+            return JSONResponse(status_code=202, content={
+                "detail": "Transcoding in progress. Please retry after a moment.",
+                "job_id": job.id if job else None,
+                "progress": job.progress if job else 0.0
+            })
+        derivative_cache.hit("low", low_path)
+        return send_file(request, low_path, filename=os.path.basename(low_path))
+    if not os.path.isfile(media.filepath):
+        raise HTTPException(status_code=404, detail="Media file not found")
+    return send_file(request, media.filepath, filename=media.filename)
 
 @router.delete("/media/{media_id}")
 def api_delete_media(media_id: int, db: Session = Depends(get_db), current_user = Depends(get_current_user)):
     if current_user.role != 'admin':
         raise HTTPException(status_code=403, detail="Admin only")
-    success = delete_media(db, media_id, current_user)
-    if not success:
+    media = get_media(db, media_id)
+    if not media:
         raise HTTPException(status_code=404, detail="Media not found")
+    media_filepath, blob_id, key = media.filepath, media.blob_id, derivative_key(media)
+    delete_media(db, media_id, current_user)
+    if blob_id is not None and not release_blob(db, blob_id, media_id):
+        # Other media share the file and its derivatives
+        return {"detail": "Media deleted"}
+    cancel_queued_jobs(db, media_id)
+    live_transcoder.stop(media_id)
+    derivative_cache.remove_media(db, media_id, key, media_filepath)
     return {"detail": "Media deleted"}
 
 @router.put("/media/{media_id}")
@@ -162,6 +499,9 @@ def api_update_media(media_id: int, data: dict, db: Session = Depends(get_db), c
     media = update_media(db, media_id, data, current_user)
     if not media:
         raise HTTPException(status_code=404, detail="Media not found")
+    return _media_out(media)
+
+def _media_out(media):
     return MediaOut(
         id=media.id,
         filename=media.filename,
@@ -170,6 +510,14 @@ def api_update_media(media_id: int, data: dict, db: Session = Depends(get_db), c
         tags=[t.name for t in media.tags]
     )
 
+# Registered after the fixed /media/<name> routes (jobs, uploads, ...) so it does not shadow them
+@router.get("/media/{media_id}", response_model=MediaOut)
+def api_get_media(media_id: int, db: Session = Depends(get_db), current_user = Depends(get_current_user)):
+    media = get_media(db, media_id)
+    if not media:
+        raise HTTPException(status_code=404, detail="Media not found")
+    return _media_out(media)
+
 @router.get("/media/stat/{media_id}")
 def media_stat(media_id: int, db: Session = Depends(get_db)):
     media = get_media(db, media_id)
@@ -178,5 +526,18 @@ def media_stat(media_id: int, db: Session = Depends(get_db)):
     stat = os.stat(media.filepath)
     return JSONResponse({
         "size": stat.st_size,
-        "mtime": stat.st_mtime
-    }) 
\ No newline at end of file
+        "mtime": stat.st_mtime,
+        "container": media.container,
+        "video_codec": media.video_codec,
+        "audio_codec": media.audio_codec,
+        "duration": media.duration,
+        "width": media.width,
+        "height": media.height,
+        "bitrate": media.bitrate
+    })
+
+@router.get("/admin/cache")
+def api_cache_stats(db: Session = Depends(get_db), current_user = Depends(get_current_user)):
+    if current_user.role != 'admin':
+        raise HTTPException(status_code=403, detail="Admin only")
+    return derivative_cache.stats(db)
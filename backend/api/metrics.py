@@ -0,0 +1,37 @@
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, Query
+from fastapi.responses import PlainTextResponse
+from backend.auth.dependencies import get_current_user
+from backend.metrics import render_metrics, METRICS_TOKEN
+from backend.profiler import profiler
+
+router = APIRouter()
+
+@router.get("/metrics", include_in_schema=False)
+def metrics(request: Request):
+    if METRICS_TOKEN and request.headers.get("authorization") != f"Bearer {METRICS_TOKEN}":
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
+@router.get("/admin/profiler")
+def get_profile(
+    reset: bool = Query(False, description="Clear the collected samples after returning them"),
+    current_user = Depends(get_current_user)
+):
+    """Collected stacks in collapsed format (feed to flamegraph.pl or speedscope)."""
+    if current_user.role != 'admin':
+        raise HTTPException(status_code=403, detail="Admin only")
+    body = profiler.collapsed()
+    if reset:
+        profiler.reset()
+    return PlainTextResponse(body)
+
+@router.post("/admin/profiler")
+def toggle_profiler(enabled: bool = Query(...), current_user = Depends(get_current_user)):
+    if current_user.role != 'admin':
+        raise HTTPException(status_code=403, detail="Admin only")
+    if enabled:
+        profiler.start()
+    else:
+        profiler.stop()
+    return profiler.stats()
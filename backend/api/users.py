@@ -1,14 +1,28 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+import io
+import csv
+import json
+from datetime import datetime
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response
+from fastapi.responses import StreamingResponse
 from fastapi.security import OAuth2PasswordRequestForm
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from backend.schemas import UserCreate, Token
 from backend.crud.users import get_user_by_username, create_user, get_unapproved_users, approve_user, log_login
 from backend.auth.jwt import create_access_token
 from backend.auth.dependencies import get_db, get_current_user
-from backend.models import AuditLog
+from backend.auth.hashing import verify_password_async
+from backend.crud.audit import list_audit_page, AUDIT_FIELDS
+from backend.database import SessionLocal
+from backend.audit import audit_sink
+from backend.utils.pagination import InvalidCursor
 
 router = APIRouter()
 
+# Entries read per query while streaming an export
+AUDIT_EXPORT_BATCH = 1000
+
 @router.post("/register")
 def register(user: UserCreate, db: Session = Depends(get_db)):
     db_user = get_user_by_username(db, user.username)
@@ -18,15 +32,14 @@ def register(user: UserCreate, db: Session = Depends(get_db)):
     return {"detail": "Registration successful! Your account is pending admin approval."}
 
 @router.post("/login", response_model=Token)
-def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user = get_user_by_username(db, form_data.username)
-    from backend.auth.hashing import verify_password
-    if not user or not verify_password(form_data.password, user.hashed_password):
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+    user = await run_in_threadpool(get_user_by_username, db, form_data.username)
+    if not user or not await verify_password_async(form_data.password, user.hashed_password):
         raise HTTPException(status_code=400, detail="Incorrect username or password")
     if not user.is_approved:
         raise HTTPException(status_code=403, detail="Account not approved. Please wait for admin approval.")
-    access_token = create_access_token(data={"sub": user.username, "role": user.role})
-    log_login(db, user)
+    access_token = create_access_token(data={"sub": user.username, "role": user.role, "uid": user.id})
+    await run_in_threadpool(log_login, db, user)
     return {"access_token": access_token, "token_type": "bearer"}
 
 @router.get("/me")
@@ -52,32 +65,55 @@ def approve_user_endpoint(user_id: int, db: Session = Depends(get_db), current_u
 
 @router.get("/admin/audit-logs")
 def get_audit_logs(
+    response: Response,
     db: Session = Depends(get_db),
     current_user = Depends(get_current_user),
     user: str = Query(None),
     action: str = Query(None),
-    target_type: str = Query(None)
+    target_type: str = Query(None),
+    since: Optional[datetime] = Query(None, description="Entries at or after this time (UTC)"),
+    until: Optional[datetime] = Query(None, description="Entries before this time (UTC)"),
+    limit: int = Query(200, ge=1, le=1000),
+    after: Optional[str] = Query(None, description="Cursor from the X-Next-Cursor header of the previous page"),
+    format: str = Query("json", pattern="^(json|ndjson|csv)$", description="ndjson and csv stream every matching entry")
 ):
     if current_user.role != 'admin':
         raise HTTPException(status_code=403, detail="Admin only")
-    q = db.query(AuditLog)
-    if user:
-        q = q.filter(AuditLog.username == user)
-    if action:
-        q = q.filter(AuditLog.action == action)
-    if target_type:
-        q = q.filter(AuditLog.target_type == target_type)
-    logs = q.order_by(AuditLog.timestamp.desc()).limit(200).all()
-    return [
-        {
-            "id": log.id,
-            "user_id": log.user_id,
-            "username": log.username,
-            "action": log.action,
-            "target_type": log.target_type,
-            "target_id": log.target_id,
-            "timestamp": log.timestamp,
-            "details": log.details
-        }
-        for log in logs
-    ] 
\ No newline at end of file
+    # Make entries still buffered by the audit writer visible to this query
+    audit_sink.flush()
+    filters = dict(user=user, action=action, target_type=target_type, since=since, until=until)
+    try:
+        logs, next_cursor = list_audit_page(db, limit if format == "json" else AUDIT_EXPORT_BATCH, after=after, **filters)
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if format != "json":
+        return StreamingResponse(
+            _export_audit_logs(format, logs, next_cursor, filters),
+            media_type="application/x-ndjson" if format == "ndjson" else "text/csv",
+            headers={"Content-Disposition": f'attachment; filename="audit-logs.{format}"'}
+        )
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return logs
+
+def _export_audit_logs(format: str, logs: list, after: Optional[str], filters: dict):
+    """Stream `logs` and every later matching entry, read in keyset batches on a session of its own."""
+    db = SessionLocal()
+    try:
+        header = format == "csv"
+        while True:
+            if format == "csv":
+                buffer = io.StringIO()
+                writer = csv.DictWriter(buffer, fieldnames=AUDIT_FIELDS)
+                if header:
+                    writer.writeheader()
+                    header = False
+                writer.writerows(logs)
+                yield buffer.getvalue()
+            else:
+                yield "".join(json.dumps(log, default=datetime.isoformat) + "\n" for log in logs)
+            if not after:
+                return
+            logs, after = list_audit_page(db, AUDIT_EXPORT_BATCH, after=after, **filters)
+    finally:
+        db.close()
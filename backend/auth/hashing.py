@@ -1,3 +1,6 @@
+import os
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from passlib.context import CryptContext
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -6,4 +9,13 @@ def get_password_hash(password):
     return pwd_context.hash(password)
 
 def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password) 
\ No newline at end of file
+    return pwd_context.verify(plain_password, hashed_password)
+
+# Concurrent bcrypt verifications for /login; extra logins wait without holding request threads
+LOGIN_HASH_CONCURRENCY = int(os.getenv("LOGIN_HASH_CONCURRENCY", "2"))
+_hash_executor = ThreadPoolExecutor(max_workers=LOGIN_HASH_CONCURRENCY, thread_name_prefix="password-hash")
+
+async def verify_password_async(plain_password, hashed_password):
+    """verify_password on a small dedicated pool, off the event loop and the request threadpool."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_hash_executor, verify_password, plain_password, hashed_password)
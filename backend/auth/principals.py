@@ -0,0 +1,85 @@
+import os
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from backend.models import User
+
+# Seconds an authenticated principal is reused before the user table is consulted again.
+# This is also how long a change the cache is not told about (raw SQL, another process)
+# can take before a demoted or deactivated user loses access, so keep it short.
+AUTH_CACHE_TTL = int(os.getenv("AUTH_CACHE_TTL", "5"))
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", "1024"))
+# Build the principal from the token's uid/role claims without any DB lookup.
+# Role changes and deletions then only take effect when the token expires.
+AUTH_TRUST_ROLE_CLAIM = os.getenv("AUTH_TRUST_ROLE_CLAIM", "0") == "1"
+
+# Detached snapshot of the fields request handlers use from the current user
+Principal = namedtuple("Principal", ["id", "username", "role", "is_approved"])
+
+
+def principal_from_user(user: User):
+    return Principal(id=user.id, username=user.username, role=user.role, is_approved=user.is_approved)
+
+
+class PrincipalCache:
+    """Process-local TTL + LRU cache of principals keyed by access token.
+
+    ORM updates and deletes of users made in this process evict entries
+    immediately; any other change is picked up within `ttl` seconds.
+    """
+
+    def __init__(self, maxsize: int = AUTH_CACHE_SIZE, ttl: int = AUTH_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()  # token -> (expires_at, principal)
+        self._lock = threading.Lock()
+
+    def get(self, token: str):
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                return None
+            expires_at, principal = entry
+            if expires_at < time.monotonic():
+                del self._entries[token]
+                return None
+            self._entries.move_to_end(token)
+            return principal
+
+    def put(self, token: str, principal: Principal):
+        if self.maxsize <= 0 or self.ttl <= 0:
+            return
+        with self._lock:
+            self._entries[token] = (time.monotonic() + self.ttl, principal)
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate_user(self, username: str):
+        with self._lock:
+            for token in [t for t, (_, p) in self._entries.items() if p.username == username]:
+                del self._entries[token]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+principal_cache = PrincipalCache()
+
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _invalidate_on_change(mapper, connection, target):
+    # Approval, role changes and deletions must not be served from the cache
+    principal_cache.invalidate_user(target.username)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _invalidate_on_bulk_change(orm_execute_state):
+    # query.update()/delete() and update(User) statements skip the mapper events above
+    if orm_execute_state.is_update or orm_execute_state.is_delete:
+        if any(mapper.class_ is User for mapper in orm_execute_state.all_mappers):
+            principal_cache.clear()
@@ -0,0 +1,13 @@
+"""Performance benchmarks for the media server.
+
+    python -m backend.bench --out results.json
+    python -m backend.bench --out new.json --baseline results.json --threshold 0.2
+    python -m backend.bench --compare new.json --baseline results.json
+
+The app runs in-process under uvicorn against a throwaway SQLite database
+and MEDIA_ROOT, so the benchmark never touches a real library. Synthetic
+video is generated with ffmpeg's lavfi sources; without ffmpeg (or with
+--stub-ffmpeg) a stub binary stands in and the HLS numbers only measure the
+server's own overhead. With --baseline, the exit status is 1 when any metric
+got worse by more than the threshold.
+"""
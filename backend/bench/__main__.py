@@ -0,0 +1,125 @@
+import os
+import sys
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+from types import SimpleNamespace
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m backend.bench", description="Benchmark the media server in-process.")
+    parser.add_argument("--out", help="Write results to this JSON file")
+    parser.add_argument("--baseline", help="Results JSON to compare against")
+    parser.add_argument("--compare", metavar="RESULTS", help="Compare an existing results file with --baseline instead of running")
+    parser.add_argument("--threshold", type=float, default=None, help="Relative change counted as a regression (default 0.2)")
+    parser.add_argument("--scenarios", default="upload,stream,hls,login,listing", help="Comma-separated scenarios to run")
+    parser.add_argument("--sizes", default="1000,10000,100000", help="Catalog sizes for the listing scenario")
+    parser.add_argument("--repeat", type=int, default=20, help="Samples per listing latency measurement")
+    parser.add_argument("--stream-mb", type=int, default=128, help="Size of the file read by the stream scenario")
+    parser.add_argument("--range-requests", type=int, default=400, help="1 MiB range requests in the stream scenario")
+    parser.add_argument("--upload-mb", type=int, default=64, help="Size of each upload")
+    parser.add_argument("--upload-concurrency", type=int, default=8, help="Simultaneous uploads")
+    parser.add_argument("--login-requests", type=int, default=40, help="Logins in the login scenario")
+    parser.add_argument("--stub-ffmpeg", action="store_true", help="Use the stub ffmpeg even if a real one is installed")
+    parser.add_argument("--keep", action="store_true", help="Keep the temporary database and media directory")
+    return parser.parse_args(argv)
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _isolate(workdir: str):
+    """Point the app at a throwaway database and media root; must run before backend modules are imported."""
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ["MEDIA_ROOT"] = os.path.join(workdir, "media")
+    # Measure the app itself: no proxy offload, no profiler, JIT HLS on
+    os.environ["FILE_DELIVERY"] = "app"
+    os.environ["PROFILER_ENABLED"] = "0"
+    os.environ["HLS_ON_DEMAND"] = "1"
+
+
+def run(args, workdir: str):
+    _isolate(workdir)
+    from backend.main import app
+    from backend.bench.fixtures import create_database, ffmpeg_available, install_stub_ffmpeg
+    from backend.bench.harness import BenchServer
+    from backend.bench.scenarios import SCENARIOS, login
+
+    selected = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = [name for name in selected if name not in SCENARIOS]
+    if unknown:
+        raise SystemExit(f"Unknown scenarios: {', '.join(unknown)} (choose from {', '.join(SCENARIOS)})")
+    stub = args.stub_ffmpeg or not ffmpeg_available()
+    if stub:
+        install_stub_ffmpeg(os.path.join(workdir, "bin"))
+    user_id = create_database()
+    metrics = {}
+    with BenchServer(app) as server:
+        client = server.client()
+        ctx = SimpleNamespace(
+            client=client, token=login(client), user_id=user_id, workdir=workdir, stub=stub,
+            sizes=[int(size) for size in args.sizes.split(",") if size.strip()],
+            repeat=args.repeat, stream_mb=args.stream_mb, range_requests=args.range_requests,
+            upload_mb=args.upload_mb, upload_concurrency=args.upload_concurrency, login_requests=args.login_requests,
+        )
+        for name, scenario in SCENARIOS.items():
+            if name not in selected:
+                continue
+            started = time.monotonic()
+            print(f"{name}...", end=" ", flush=True, file=sys.stderr)
+            metrics.update(scenario(ctx))
+            print(f"{time.monotonic() - started:.1f}s", file=sys.stderr)
+    return {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "ffmpeg": "stub" if stub else "real",
+            "scenarios": selected,
+            "options": {k: v for k, v in vars(args).items() if k not in ("out", "baseline", "compare", "keep")},
+        },
+        "metrics": metrics,
+    }
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    from backend.bench.report import DEFAULT_THRESHOLD, compare, format_comparison, load_results, write_results
+    threshold = DEFAULT_THRESHOLD if args.threshold is None else args.threshold
+    if args.compare:
+        if not args.baseline:
+            raise SystemExit("--compare needs --baseline")
+        results = load_results(args.compare)
+    else:
+        workdir = tempfile.mkdtemp(prefix="stream-bench-")
+        try:
+            results = run(args, workdir)
+        finally:
+            if args.keep:
+                print(f"Kept {workdir}", file=sys.stderr)
+            else:
+                shutil.rmtree(workdir, ignore_errors=True)
+        if args.out:
+            write_results(args.out, results)
+        else:
+            for name, entry in sorted(results["metrics"].items()):
+                print(f"{name:<36} {entry['value']:>12.3f} {entry['unit']}")
+    if args.baseline:
+        baseline = load_results(args.baseline)
+        rows = compare(results, baseline, threshold)
+        print(format_comparison(rows, results, baseline))
+        if any(row["regressed"] for row in rows):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
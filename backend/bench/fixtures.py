@@ -0,0 +1,172 @@
+import os
+import sys
+import stat
+import shutil
+import subprocess
+from sqlalchemy import insert
+from backend.database import engine, SessionLocal
+from backend.models import Base, Genre, Media, Tag, User, media_tag
+from backend.migrations import apply_migrations
+from backend.cache import hls_path
+from backend.auth.hashing import get_password_hash
+from backend.utils.file import MEDIA_ROOT
+from backend.utils.transcoding import HLS_MASTER_PLAYLIST
+
+BENCH_USERNAME = "bench"
+BENCH_PASSWORD = "bench-password"
+# Synthetic video length; long enough for a handful of HLS segments
+VIDEO_SECONDS = 60
+# Per-segment encode time of the stub ffmpeg (about 20x realtime for 4 s segments)
+STUB_SEGMENT_DELAY = 0.2
+STUB_SEGMENT_BYTES = 256 * 1024
+GENRES = 20
+TAGS = 50
+SEED_BATCH = 5000
+
+_STUB_SCRIPT = """#!{python}
+# ffmpeg/ffprobe stand-in written by backend.bench; output is random bytes
+import json, math, os, sys, time
+DURATION = {duration}
+args = sys.argv[1:]
+if os.path.basename(sys.argv[0]) == "ffprobe":
+    print(json.dumps({{
+        "streams": [
+            {{"codec_type": "video", "codec_name": "h264", "width": 1280, "height": 720, "pix_fmt": "yuv420p", "profile": "High"}},
+            {{"codec_type": "audio", "codec_name": "aac"}},
+        ],
+        "format": {{"format_name": "mov,mp4,m4a,3gp,3g2,mj2", "duration": str(DURATION), "bit_rate": "2000000"}},
+    }}))
+    sys.exit(0)
+out = args[-1]
+if "-hls_segment_filename" in args:
+    seconds = float(args[args.index("-hls_time") + 1])
+    start = int(args[args.index("-start_number") + 1]) if "-start_number" in args else 0
+    pattern = args[args.index("-hls_segment_filename") + 1].replace("%v", "0")
+    for index in range(start, math.ceil(DURATION / seconds)):
+        time.sleep({delay})
+        path = pattern % index
+        with open(path + ".tmp", "wb") as f:
+            f.write(os.urandom({segment_bytes}))
+        os.replace(path + ".tmp", path)
+elif out.startswith("pipe:"):
+    for _ in range(16):
+        sys.stdout.buffer.write(os.urandom(64 * 1024))
+    sys.exit(0)
+with open(out.replace("%v", "0"), "wb") as f:
+    f.write(b"#EXTM3U\\n" if out.endswith(".m3u8") else os.urandom(1024))
+"""
+
+
+def ffmpeg_available():
+    return shutil.which("ffmpeg") is not None and shutil.which("ffprobe") is not None
+
+
+def install_stub_ffmpeg(bin_dir: str):
+    """Put stub ffmpeg/ffprobe binaries first on PATH."""
+    os.makedirs(bin_dir, exist_ok=True)
+    script = _STUB_SCRIPT.format(
+        python=sys.executable, duration=VIDEO_SECONDS, delay=STUB_SEGMENT_DELAY, segment_bytes=STUB_SEGMENT_BYTES
+    )
+    for name in ("ffmpeg", "ffprobe"):
+        path = os.path.join(bin_dir, name)
+        with open(path, "w") as f:
+            f.write(script)
+        os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+    os.environ["PATH"] = bin_dir + os.pathsep + os.environ.get("PATH", "")
+
+
+def write_random_file(path: str, size: int, block_size: int = 1024 * 1024):
+    """Write `size` bytes of incompressible data (one random block repeated)."""
+    block = os.urandom(block_size)
+    with open(path, "wb") as f:
+        remaining = size
+        while remaining > 0:
+            f.write(block[:remaining])
+            remaining -= block_size
+    return path
+
+
+def write_video(path: str, stub: bool, seconds: int = VIDEO_SECONDS):
+    """A synthetic H.264/AAC test pattern, or random bytes when ffmpeg is stubbed."""
+    if stub:
+        return write_random_file(path, 2 * 1024 * 1024)
+    subprocess.run([
+        "ffmpeg", "-nostdin", "-loglevel", "error",
+        "-f", "lavfi", "-i", f"testsrc2=size=1280x720:rate=30:duration={seconds}",
+        "-f", "lavfi", "-i", f"sine=frequency=440:duration={seconds}",
+        "-c:v", "libx264", "-preset", "ultrafast", "-pix_fmt", "yuv420p",
+        "-c:a", "aac", "-shortest", "-y", path
+    ], check=True)
+    return path
+
+
+def write_hls_output(media_id: int, segments: int, segment_bytes: int):
+    """Lay out a finished single-rendition HLS transcode for a media item."""
+    hls_dir = hls_path(media_id)
+    variant_dir = os.path.join(hls_dir, "480p")
+    os.makedirs(variant_dir, exist_ok=True)
+    lines = ["#EXTM3U", "#EXT-X-VERSION:3", "#EXT-X-TARGETDURATION:4", "#EXT-X-PLAYLIST-TYPE:VOD"]
+    for index in range(segments):
+        name = f"segment_{index:03d}.ts"
+        write_random_file(os.path.join(variant_dir, name), segment_bytes)
+        lines += ["#EXTINF:4.000000,", name]
+    lines.append("#EXT-X-ENDLIST")
+    with open(os.path.join(variant_dir, "index.m3u8"), "w") as f:
+        f.write("\n".join(lines) + "\n")
+    with open(os.path.join(hls_dir, HLS_MASTER_PLAYLIST), "w") as f:
+        f.write("#EXTM3U\n#EXT-X-STREAM-INF:BANDWIDTH=1500000,RESOLUTION=854x480\n480p/index.m3u8\n")
+    return hls_dir
+
+
+def create_database():
+    """Create the schema and the benchmark user; return the user id."""
+    os.makedirs(MEDIA_ROOT, exist_ok=True)
+    Base.metadata.create_all(bind=engine)
+    apply_migrations(engine)
+    db = SessionLocal()
+    try:
+        user = User(username=BENCH_USERNAME, hashed_password=get_password_hash(BENCH_PASSWORD), role="admin", is_approved=1)
+        db.add(user)
+        db.add_all([Genre(name=f"genre-{i}") for i in range(GENRES)])
+        db.add_all([Tag(name=f"tag-{i}") for i in range(TAGS)])
+        db.commit()
+        return user.id
+    finally:
+        db.close()
+
+
+def add_media(filename: str, filepath: str, uploader_id: int):
+    db = SessionLocal()
+    try:
+        media = Media(filename=filename, filepath=filepath, uploader_id=uploader_id)
+        db.add(media)
+        db.commit()
+        return media.id
+    finally:
+        db.close()
+
+
+def seed_catalog(start: int, stop: int, uploader_id: int):
+    """Insert synthetic catalog rows numbered [start, stop), each with a genre and two tags.
+
+    Rows point at files that do not exist; listing never opens them.
+    """
+    with engine.begin() as conn:
+        for batch_start in range(start, stop, SEED_BATCH):
+            numbers = range(batch_start, min(stop, batch_start + SEED_BATCH))
+            result = conn.execute(insert(Media).returning(Media.id), [
+                {
+                    "filename": f"catalog/{n:07d} synthetic clip.mp4",
+                    "filepath": os.path.join(MEDIA_ROOT, "catalog", f"{n:07d}.mp4"),
+                    "genre_id": n % GENRES + 1,
+                    "uploader_id": uploader_id,
+                }
+                for n in numbers
+            ])
+            ids = [row.id for row in result]
+            conn.execute(insert(media_tag), [
+                {"media_id": media_id, "tag_id": tag_id}
+                for media_id in ids
+                # Offsets of 1..TAGS-1 keep the two tags distinct
+                for tag_id in (media_id % TAGS + 1, (media_id + 1 + media_id // TAGS % (TAGS - 1)) % TAGS + 1)
+            ])
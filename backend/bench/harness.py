@@ -0,0 +1,144 @@
+import os
+import math
+import time
+import socket
+import threading
+import http.client
+from concurrent.futures import ThreadPoolExecutor
+
+READ_CHUNK_SIZE = 256 * 1024
+
+
+class BenchServer:
+    """Runs the FastAPI app under uvicorn in a background thread on a free local port."""
+
+    def __init__(self, app):
+        import uvicorn
+        # Port 0: uvicorn binds (and sets TCP_NODELAY on) the socket itself
+        # Long keep-alive: client threads can sit idle while another scenario runs
+        config = uvicorn.Config(
+            app, host="127.0.0.1", port=0, log_level="warning", access_log=False, lifespan="on", timeout_keep_alive=3600
+        )
+        self._server = uvicorn.Server(config)
+        self._thread = threading.Thread(target=self._server.run, name="bench-server", daemon=True)
+        self.host, self.port = None, None
+
+    def __enter__(self):
+        self._thread.start()
+        deadline = time.monotonic() + 30
+        while not self._server.started:
+            if not self._thread.is_alive() or time.monotonic() > deadline:
+                raise RuntimeError("Benchmark server failed to start")
+            time.sleep(0.05)
+        self.host, self.port = self._server.servers[0].sockets[0].getsockname()[:2]
+        return self
+
+    def __exit__(self, *exc):
+        self._server.should_exit = True
+        self._thread.join(timeout=30)
+
+    def client(self):
+        return Client(self.host, self.port)
+
+
+class Client:
+    """Minimal keep-alive HTTP client; bodies are read and discarded chunk by chunk."""
+
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = http.client.HTTPConnection(self.host, self.port, timeout=120)
+            conn.connect()
+            conn.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return conn
+
+    def request(self, method: str, path: str, body=None, headers=None, keep_body: bool = False):
+        """Return (status, response headers (case-insensitive), body bytes or body length)."""
+        conn = self._connection()
+        try:
+            conn.request(method, path, body=body, headers=headers or {})
+            response = conn.getresponse()
+            if keep_body:
+                data = response.read()
+            else:
+                data = 0
+                while True:
+                    chunk = response.read(READ_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    data += len(chunk)
+        except (OSError, http.client.HTTPException):
+            conn.close()
+            self._local.conn = None
+            raise
+        if response.getheader("Connection", "").lower() == "close":
+            conn.close()
+            self._local.conn = None
+        return response.status, response.headers, data
+
+    def timed(self, method: str, path: str, expect=(200,), **kwargs):
+        """Like request(), plus elapsed seconds; raises on an unexpected status."""
+        started = time.perf_counter()
+        status, headers, data = self.request(method, path, **kwargs)
+        elapsed = time.perf_counter() - started
+        if status not in expect:
+            raise RuntimeError(f"{method} {path} returned {status}")
+        return elapsed, headers, data
+
+
+def run_concurrently(fn, items, concurrency: int):
+    """Call fn(item) for every item on `concurrency` threads; return (results, wall seconds)."""
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="bench-client") as pool:
+        results = list(pool.map(fn, items))
+    return results, time.perf_counter() - started
+
+
+def percentile(values, fraction: float):
+    """Nearest-rank percentile of a non-empty sequence."""
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, math.ceil(fraction * len(ordered)) - 1))
+    return ordered[index]
+
+
+def current_rss():
+    """Resident set size of this process in bytes (peak RSS where /proc is unavailable)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        import resource
+        import sys
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in KiB on Linux and bytes on macOS
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+class RssSampler:
+    """Tracks the peak RSS while the with-block runs."""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.baseline = 0
+        self.peak = 0
+        self._stopping = threading.Event()
+        self._thread = threading.Thread(target=self._sample_loop, name="bench-rss", daemon=True)
+
+    def __enter__(self):
+        self.baseline = self.peak = current_rss()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stopping.set()
+        self._thread.join()
+        self.peak = max(self.peak, current_rss())
+
+    def _sample_loop(self):
+        while not self._stopping.wait(self.interval):
+            self.peak = max(self.peak, current_rss())
@@ -0,0 +1,64 @@
+import json
+
+# Changes smaller than this fraction of the baseline are treated as noise
+DEFAULT_THRESHOLD = 0.2
+
+
+def metric(value: float, unit: str, better: str = "lower"):
+    """One result entry; `better` is "lower" or "higher"."""
+    return {"value": round(value, 3), "unit": unit, "better": better}
+
+
+def write_results(path: str, results: dict):
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+def load_results(path: str):
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare(current: dict, baseline: dict, threshold: float = DEFAULT_THRESHOLD):
+    """Compare the metrics present in both runs.
+
+    Returns one row per metric with the relative change (positive = better)
+    and whether it regressed by more than `threshold`.
+    """
+    rows = []
+    for name, entry in sorted(current["metrics"].items()):
+        base = baseline["metrics"].get(name)
+        if base is None:
+            continue
+        old, new = base["value"], entry["value"]
+        if old == 0:
+            change = 0.0 if new == 0 else float("inf")
+        else:
+            change = (new - old) / old
+        if entry["better"] == "lower":
+            change = -change
+        rows.append({
+            "name": name, "unit": entry["unit"], "baseline": old, "current": new,
+            "change": change, "regressed": change < -threshold,
+        })
+    return rows
+
+
+def format_comparison(rows: list, current: dict, baseline: dict):
+    lines = []
+    if current["meta"].get("ffmpeg") != baseline["meta"].get("ffmpeg"):
+        lines.append(
+            f"warning: ffmpeg mode differs (baseline {baseline['meta'].get('ffmpeg')}, "
+            f"current {current['meta'].get('ffmpeg')}); HLS numbers are not comparable"
+        )
+    width = max([len(row["name"]) for row in rows] + [6])
+    lines.append(f"{'metric':<{width}}  {'baseline':>12}  {'current':>12}  {'change':>8}")
+    for row in rows:
+        flag = "  REGRESSION" if row["regressed"] else ""
+        lines.append(
+            f"{row['name']:<{width}}  {row['baseline']:>12.3f}  {row['current']:>12.3f}  {row['change']:>+8.1%}{flag}"
+        )
+    regressions = sum(row["regressed"] for row in rows)
+    lines.append(f"{len(rows)} metrics compared, {regressions} regressed")
+    return "\n".join(lines)
@@ -0,0 +1,210 @@
+import os
+import json
+import time
+import random
+import shutil
+import statistics
+from urllib.parse import quote, urlencode
+from backend.database import SessionLocal
+from backend.models import Media
+from backend.utils.file import MEDIA_ROOT
+from backend.bench.fixtures import (
+    BENCH_USERNAME, BENCH_PASSWORD, add_media, seed_catalog, write_hls_output, write_random_file, write_video
+)
+from backend.bench.harness import RssSampler, percentile, run_concurrently
+from backend.bench.report import metric
+
+MB = 1024 * 1024
+RANGE_CONCURRENCY = 8
+LOGIN_CONCURRENCY = 8
+HLS_SEGMENTS = 10
+HLS_SEGMENT_BYTES = MB
+JIT_COLD_RUNS = 3
+
+
+def _ms(seconds: float):
+    return seconds * 1000
+
+
+def _size_label(n: int):
+    return f"{n // 1000}k" if n % 1000 == 0 else str(n)
+
+
+def login(client):
+    body = urlencode({"username": BENCH_USERNAME, "password": BENCH_PASSWORD})
+    _, _, data = client.timed(
+        "POST", "/login", body=body, keep_body=True,
+        headers={"Content-Type": "application/x-www-form-urlencoded"}
+    )
+    return json.loads(data)["access_token"]
+
+
+def bench_upload(ctx):
+    """Concurrent multipart uploads: peak RSS growth and aggregate throughput."""
+    size = ctx.upload_mb * MB
+    block = os.urandom(MB)
+    boundary = "bench-boundary-7d93f2"
+
+    def upload(i):
+        head = (
+            f"--{boundary}\r\n"
+            f'Content-Disposition: form-data; name="file"; filename="bench-upload-{i}.bin"\r\n'
+            "Content-Type: application/octet-stream\r\n\r\n"
+        ).encode()
+        tail = f"\r\n--{boundary}--\r\n".encode()
+
+        def body():
+            yield head
+            for offset in range(0, size, MB):
+                yield block[:size - offset]
+            yield tail
+
+        ctx.client.timed("POST", "/media/upload", body=body(), headers={
+            "Authorization": f"Bearer {ctx.token}",
+            "Content-Type": f"multipart/form-data; boundary={boundary}",
+            "Content-Length": str(len(head) + size + len(tail)),
+        })
+
+    with RssSampler() as rss:
+        _, wall = run_concurrently(upload, range(ctx.upload_concurrency), ctx.upload_concurrency)
+    return {
+        "upload_peak_rss_delta_mb": metric((rss.peak - rss.baseline) / MB, "MiB"),
+        "upload_throughput_mb_s": metric(ctx.upload_concurrency * size / MB / wall, "MiB/s", "higher"),
+    }
+
+
+def bench_stream(ctx):
+    """Full-file and range reads from /media/stream."""
+    size = ctx.stream_mb * MB
+    path = write_random_file(os.path.join(MEDIA_ROOT, "bench-stream.mp4"), size)
+    media_id = add_media("bench-stream.mp4", path, ctx.user_id)
+    url = f"/media/stream/{media_id}"
+    rng = random.Random(1)
+
+    full = []
+    for _ in range(3):
+        elapsed, _, length = ctx.client.timed("GET", url)
+        assert length == size
+        full.append(elapsed)
+
+    def read_range(length):
+        start = rng.randrange(0, size - length)
+        elapsed, _, _ = ctx.client.timed("GET", url, expect=(206,), headers={"Range": f"bytes={start}-{start + length - 1}"})
+        return elapsed
+
+    large, wall = run_concurrently(lambda _: read_range(MB), range(ctx.range_requests), RANGE_CONCURRENCY)
+    small = [read_range(64 * 1024) for _ in range(ctx.range_requests // 2)]
+    return {
+        "stream_full_mb_s": metric(size / MB / statistics.median(full), "MiB/s", "higher"),
+        "stream_range_1m_mb_s": metric(ctx.range_requests / wall, "MiB/s", "higher"),
+        "stream_range_1m_p95_ms": metric(_ms(percentile(large, 0.95)), "ms"),
+        "stream_range_64k_p50_ms": metric(_ms(percentile(small, 0.5)), "ms"),
+    }
+
+
+def bench_hls(ctx):
+    """Segment latency from a finished transcode and from the just-in-time encoder."""
+    source = write_video(os.path.join(ctx.workdir, "bench-source.mp4"), ctx.stub)
+
+    media_id = add_media("bench-hls-ready.mp4", source, ctx.user_id)
+    write_hls_output(media_id, HLS_SEGMENTS, HLS_SEGMENT_BYTES)
+    ctx.client.timed("GET", f"/media/hls/{media_id}/master.m3u8")
+    ctx.client.timed("GET", f"/media/hls/{media_id}/480p/index.m3u8")
+    ready = [
+        ctx.client.timed("GET", f"/media/hls/{media_id}/480p/segment_{index:03d}.ts")[0]
+        for _ in range(3) for index in range(HLS_SEGMENTS)
+    ]
+
+    cold = []
+    for run in range(JIT_COLD_RUNS):
+        # A fresh path per run, so nothing is cached from the previous one
+        filename = f"bench-hls-jit-{run}.mp4"
+        path = shutil.copyfile(source, os.path.join(MEDIA_ROOT, filename))
+        jit_id = add_media(filename, path, ctx.user_id)
+        started = time.perf_counter()
+        _, _, playlist = ctx.client.timed("GET", f"/media/hls/{jit_id}/playlist.m3u8", keep_body=True)
+        ctx.client.timed("GET", f"/media/hls/{jit_id}/jit/segment_000.ts")
+        cold.append(time.perf_counter() - started)
+    segments = playlist.decode().count(".ts")
+    following = [
+        ctx.client.timed("GET", f"/media/hls/{jit_id}/jit/segment_{index:03d}.ts")[0]
+        for index in range(1, min(6, segments))
+    ]
+    seek, _, _ = ctx.client.timed("GET", f"/media/hls/{jit_id}/jit/segment_{segments - 2:03d}.ts")
+    return {
+        "hls_ready_segment_p50_ms": metric(_ms(percentile(ready, 0.5)), "ms"),
+        "hls_ready_segment_p95_ms": metric(_ms(percentile(ready, 0.95)), "ms"),
+        "hls_jit_first_segment_ms": metric(_ms(statistics.median(cold)), "ms"),
+        "hls_jit_next_segment_p50_ms": metric(_ms(percentile(following, 0.5)), "ms"),
+        "hls_jit_seek_ms": metric(_ms(seek), "ms"),
+    }
+
+
+def bench_login(ctx):
+    """/login under concurrency (dominated by bcrypt and LOGIN_HASH_CONCURRENCY)."""
+    latencies, wall = run_concurrently(lambda _: _timed_login(ctx.client), range(ctx.login_requests), LOGIN_CONCURRENCY)
+    return {
+        "login_per_s": metric(ctx.login_requests / wall, "req/s", "higher"),
+        "login_p95_ms": metric(_ms(percentile(latencies, 0.95)), "ms"),
+    }
+
+
+def _timed_login(client):
+    started = time.perf_counter()
+    login(client)
+    return time.perf_counter() - started
+
+
+def bench_listing(ctx):
+    """GET /media with the catalog grown to each size in turn."""
+    results = {}
+    auth = {"Authorization": f"Bearer {ctx.token}"}
+    for size in sorted(ctx.sizes):
+        db = SessionLocal()
+        try:
+            existing = db.query(Media).count()
+        finally:
+            db.close()
+        if size > existing:
+            seed_catalog(existing, size, ctx.user_id)
+        label = _size_label(size)
+
+        def timed_get(path):
+            return ctx.client.timed("GET", path, headers=auth)
+
+        timed_get("/media?limit=100")
+        first = [timed_get("/media?limit=100")[0] for _ in range(ctx.repeat)]
+        tagged = [timed_get("/media?limit=100&tag=tag-7")[0] for _ in range(ctx.repeat)]
+        by_name = [timed_get("/media?limit=100&sort=name")[0] for _ in range(ctx.repeat)]
+
+        started = time.perf_counter()
+        cursor = ""
+        while True:
+            _, headers, _ = timed_get("/media?limit=1000" + (f"&after={quote(cursor)}" if cursor else ""))
+            cursor = headers.get("X-Next-Cursor")
+            if not cursor:
+                break
+        scan = time.perf_counter() - started
+
+        unpaged = [timed_get("/media")[0] for _ in range(3)]
+        results.update({
+            f"list_{label}_first_page_p50_ms": metric(_ms(percentile(first, 0.5)), "ms"),
+            f"list_{label}_first_page_p95_ms": metric(_ms(percentile(first, 0.95)), "ms"),
+            f"list_{label}_tag_page_p50_ms": metric(_ms(percentile(tagged, 0.5)), "ms"),
+            f"list_{label}_name_page_p50_ms": metric(_ms(percentile(by_name, 0.5)), "ms"),
+            f"list_{label}_paged_scan_ms": metric(_ms(scan), "ms"),
+            f"list_{label}_unpaged_ms": metric(_ms(statistics.median(unpaged)), "ms"),
+        })
+    return results
+
+
+# Run order matters: uploads come first so their RSS is not masked by memory
+# the allocator kept from earlier scenarios, and listing runs last because the
+# catalog it seeds would slow everything else down.
+SCENARIOS = {
+    "upload": bench_upload,
+    "stream": bench_stream,
+    "hls": bench_hls,
+    "login": bench_login,
+    "listing": bench_listing,
+}
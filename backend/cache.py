@@ -0,0 +1,263 @@
+import os
+import shutil
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from backend.database import SessionLocal
+from backend.models import Blob, CacheEntry, Media, TranscodeJob
+from backend.crud.jobs import ACTIVE_STATES
+from backend.hls_ondemand import hls_on_demand
+from backend.utils.file import MEDIA_ROOT, disk_usage
+
+# Appended to a source path to name its low-bitrate derivative
+LOW_SUFFIXES = (".low.mp4", ".low.mp3")
+
+# Disk budget for transcoded derivatives (HLS directories, low-bitrate files and previews)
+CACHE_MAX_BYTES = int(os.getenv("CACHE_MAX_BYTES", str(10 * 1024 ** 3)))
+# Eviction starts above high * budget and stops once usage is below low * budget
+CACHE_HIGH_WATERMARK = float(os.getenv("CACHE_HIGH_WATERMARK", "0.9"))
+CACHE_LOW_WATERMARK = float(os.getenv("CACHE_LOW_WATERMARK", "0.75"))
+# HLS artifacts accessed this recently are assumed to back a stream in progress
+CACHE_ACTIVE_SECONDS = int(os.getenv("CACHE_ACTIVE_SECONDS", "300"))
+# Interval of the background sweep that persists access times and evicts
+CACHE_SWEEP_SECONDS = int(os.getenv("CACHE_SWEEP_SECONDS", "60"))
+
+
+def hls_path(key):
+    """HLS output directory for a derivative key (blob hash or media id, see storage.derivative_key)."""
+    return os.path.join(MEDIA_ROOT, f"hls_{key}")
+
+def preview_path(key):
+    return os.path.join(MEDIA_ROOT, f"preview_{key}")
+
+def _parse_key(value: str):
+    """Media id or blob hash from a derivative directory name, or None."""
+    if value.isdigit():
+        return int(value)
+    if len(value) == 64 and all(c in "0123456789abcdef" for c in value):
+        return value
+    return None
+
+
+class DerivativeCache:
+    """Index of derived artifacts with LRU eviction under a byte budget.
+
+    Access times are recorded in memory on the request path and written to
+    the `cache_entry` table by a periodic sweep, which also refreshes the
+    sizes of artifacts that may have grown and evicts when over budget.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._touched = {}  # path -> last access (datetime)
+        self._hits = {}
+        self._misses = {}
+        self._thread = None
+        self._stopping = threading.Event()
+
+    def start(self):
+        if self._thread is not None:
+            return
+        db = SessionLocal()
+        try:
+            self.scan(db)
+        finally:
+            db.close()
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._sweeper, name="derivative-cache", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        self._thread = None
+        db = SessionLocal()
+        try:
+            self._flush_touches(db)
+        finally:
+            db.close()
+
+    def hit(self, kind: str, path: str):
+        with self._lock:
+            self._hits[kind] = self._hits.get(kind, 0) + 1
+            self._touched[path] = datetime.utcnow()
+
+    def miss(self, kind: str):
+        with self._lock:
+            self._misses[kind] = self._misses.get(kind, 0) + 1
+
+    def register(self, db: Session, media_id: int, kind: str, path: str):
+        """Add or refresh an artifact in the index."""
+        entry = db.query(CacheEntry).filter(CacheEntry.path == path).first()
+        if entry is None:
+            entry = CacheEntry(media_id=media_id, kind=kind, path=path)
+            db.add(entry)
+        entry.size_bytes = disk_usage(path) if os.path.exists(path) else 0
+        entry.last_access = datetime.utcnow()
+        db.commit()
+        return entry
+
+    def ensure_registered(self, db: Session, media_id: int, kind: str, path: str):
+        if db.query(CacheEntry.id).filter(CacheEntry.path == path).first() is None:
+            self.register(db, media_id, kind, path)
+
+    def scan(self, db: Session):
+        """Index derivatives already on disk that are missing from the table."""
+        if not os.path.isdir(MEDIA_ROOT):
+            return
+        known = {path for (path,) in db.query(CacheEntry.path)}
+        for name in os.listdir(MEDIA_ROOT):
+            path = os.path.join(MEDIA_ROOT, name)
+            if path in known:
+                continue
+            prefix, _, key = name.partition("_")
+            key = _parse_key(key)
+            if prefix in ("hls", "preview") and key is not None and os.path.isdir(path):
+                self.register(db, self._key_media_id(db, key), prefix, path)
+        # Low-bitrate files sit next to their source: in the blob store or anywhere in an in-place library
+        found = []
+        for media_id, filepath in db.query(Media.id, Media.filepath).filter(Media.filepath.isnot(None)).order_by(Media.id).all():
+            for suffix in LOW_SUFFIXES:
+                path = filepath + suffix
+                if path not in known and os.path.isfile(path):
+                    # Duplicates share a blob and so its low file; index it once
+                    known.add(path)
+                    found.append((media_id, path))
+        for media_id, path in found:
+            self.register(db, media_id, "low", path)
+
+    def _key_media_id(self, db: Session, key):
+        if isinstance(key, int):
+            return key
+        media = db.query(Media.id).join(Blob, Media.blob_id == Blob.id).filter(Blob.sha256 == key).first()
+        return media.id if media else None
+
+    def in_use(self, db: Session, entry: CacheEntry):
+        # Outputs are shared by duplicates, so the job may belong to another media row
+        if db.query(TranscodeJob.id).filter(
+            TranscodeJob.state.in_(ACTIVE_STATES),
+            TranscodeJob.output_path == entry.path
+        ).first():
+            return True
+        if entry.kind == "hls" and hls_on_demand.is_active(entry.path):
+            return True
+        if entry.kind in ("hls", "low"):
+            # Players keep fetching segments and byte ranges (every range request
+            # reopens the .low file), so a recent access means a live session
+            last_access = self._touched.get(entry.path, entry.last_access)
+            if last_access and datetime.utcnow() - last_access < timedelta(seconds=CACHE_ACTIVE_SECONDS):
+                return True
+        return False
+
+    def usage(self, db: Session):
+        return db.query(func.coalesce(func.sum(CacheEntry.size_bytes), 0)).scalar()
+
+    def evict_if_needed(self, db: Session, max_bytes: int = None):
+        """Evict least recently used artifacts once usage crosses the high watermark."""
+        max_bytes = CACHE_MAX_BYTES if max_bytes is None else max_bytes
+        if max_bytes <= 0:
+            return []
+        total = self.usage(db)
+        if total <= max_bytes * CACHE_HIGH_WATERMARK:
+            return []
+        self._flush_touches(db)
+        target = max_bytes * CACHE_LOW_WATERMARK
+        evicted = []
+        for entry in db.query(CacheEntry).order_by(CacheEntry.last_access).all():
+            if total <= target:
+                break
+            if self.in_use(db, entry):
+                continue
+            total -= entry.size_bytes or 0
+            evicted.append(entry.path)
+            self._remove(db, entry)
+        return evicted
+
+    def remove_media(self, db: Session, media_id: int, key=None, media_filepath: str = None):
+        """Drop every derivative of a media item, indexed or not.
+
+        `key` is its derivative key (see storage.derivative_key); defaults to the media id.
+        """
+        key = media_id if key is None else key
+        hls_on_demand.stop(hls_path(key))
+        for entry in db.query(CacheEntry).filter(CacheEntry.media_id == media_id).all():
+            self._remove(db, entry)
+        paths = [hls_path(key), preview_path(key), preview_path(key) + ".part"]
+        if media_filepath:
+            paths += [media_filepath + suffix for suffix in LOW_SUFFIXES]
+        for path in paths:
+            self.discard(db, path)
+
+    def discard(self, db: Session, path: str):
+        """Delete one derivative and its index entry, if any."""
+        entry = db.query(CacheEntry).filter(CacheEntry.path == path).first()
+        if entry is not None:
+            self._remove(db, entry)
+        else:
+            delete_path(path)
+
+    def stats(self, db: Session):
+        with self._lock:
+            hits = dict(self._hits)
+            misses = dict(self._misses)
+        by_kind = {
+            kind: {"entries": count, "bytes": size or 0}
+            for kind, count, size in db.query(CacheEntry.kind, func.count(CacheEntry.id), func.sum(CacheEntry.size_bytes)).group_by(CacheEntry.kind)
+        }
+        total_hits = sum(hits.values())
+        total_lookups = total_hits + sum(misses.values())
+        return {
+            "bytes": self.usage(db),
+            "max_bytes": CACHE_MAX_BYTES,
+            "high_watermark": CACHE_HIGH_WATERMARK,
+            "low_watermark": CACHE_LOW_WATERMARK,
+            "entries": sum(k["entries"] for k in by_kind.values()),
+            "by_kind": by_kind,
+            "hits": hits,
+            "misses": misses,
+            "hit_ratio": total_hits / total_lookups if total_lookups else None,
+        }
+
+    def sweep(self, db: Session):
+        touched = self._flush_touches(db)
+        if touched:
+            # Artifacts used since the last sweep may have grown (just-in-time segments)
+            for entry in db.query(CacheEntry).filter(CacheEntry.path.in_(touched)).all():
+                entry.size_bytes = disk_usage(entry.path) if os.path.exists(entry.path) else 0
+            db.commit()
+        return self.evict_if_needed(db)
+
+    def _flush_touches(self, db: Session):
+        with self._lock:
+            touched, self._touched = self._touched, {}
+        for path, last_access in touched.items():
+            db.query(CacheEntry).filter(CacheEntry.path == path).update(
+                {CacheEntry.last_access: last_access}, synchronize_session=False
+            )
+        db.commit()
+        return list(touched)
+
+    def _remove(self, db: Session, entry: CacheEntry):
+        delete_path(entry.path)
+        db.delete(entry)
+        db.commit()
+
+    def _sweeper(self):
+        while not self._stopping.wait(CACHE_SWEEP_SECONDS):
+            db = SessionLocal()
+            try:
+                self.sweep(db)
+            except Exception:
+                db.rollback()
+            finally:
+                db.close()
+
+
+def delete_path(path: str):
+    if os.path.isdir(path):
+        shutil.rmtree(path, ignore_errors=True)
+    elif os.path.exists(path):
+        os.remove(path)
+
+
+derivative_cache = DerivativeCache()
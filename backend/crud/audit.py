@@ -0,0 +1,71 @@
+from datetime import datetime
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import Session
+from backend.models import AuditLog
+from backend.utils.pagination import encode_cursor, decode_cursor, InvalidCursor
+
+AUDIT_FIELDS = ["id", "user_id", "username", "action", "target_type", "target_id", "timestamp", "details"]
+
+def audit_log_dict(log: AuditLog):
+    return {field: getattr(log, field) for field in AUDIT_FIELDS}
+
+def list_audit_page(db: Session, limit: int, after: str = None, user: str = None, action: str = None,
+                    target_type: str = None, since: datetime = None, until: datetime = None):
+    """Keyset-paginated audit log, newest first.
+
+    Returns (entries, next_cursor); next_cursor is None on the last page. Pages
+    walk the (timestamp, username, action) index instead of sorting the log.
+    """
+    q = db.query(AuditLog)
+    if user:
+        q = q.filter(AuditLog.username == user)
+    if action:
+        q = q.filter(AuditLog.action == action)
+    if target_type:
+        q = q.filter(AuditLog.target_type == target_type)
+    if since:
+        q = q.filter(AuditLog.timestamp >= since)
+    if until:
+        q = q.filter(AuditLog.timestamp < until)
+    if after:
+        cursor = decode_cursor(after)
+        try:
+            timestamp, last_id = cursor["k"]
+            timestamp = datetime.fromisoformat(timestamp)
+        except (KeyError, TypeError, ValueError):
+            raise InvalidCursor("Invalid cursor")
+        q = q.filter(or_(AuditLog.timestamp < timestamp, and_(AuditLog.timestamp == timestamp, AuditLog.id < last_id)))
+    logs = q.order_by(AuditLog.timestamp.desc(), AuditLog.id.desc()).limit(limit + 1).all()
+    next_cursor = None
+    if len(logs) > limit:
+        logs = logs[:limit]
+        last = logs[-1]
+        next_cursor = encode_cursor({"k": [last.timestamp.isoformat(), last.id]})
+    return [audit_log_dict(log) for log in logs], next_cursor
+
+def prune_audit_logs(db: Session, before: datetime, batch_size: int, archive=None):
+    """Delete entries older than `before`, oldest first, committing every `batch_size` rows.
+
+    `archive` is called with each batch (as dicts) before it is deleted.
+    Returns the number of entries removed.
+    """
+    removed = 0
+    while True:
+        logs = db.query(AuditLog).filter(AuditLog.timestamp < before).order_by(
+            AuditLog.timestamp, AuditLog.id
+        ).limit(batch_size).all()
+        if not logs:
+            break
+        if archive:
+            archive([audit_log_dict(log) for log in logs])
+        # Everything up to the last row of the batch in (timestamp, id) order is exactly this batch
+        last = logs[-1]
+        db.query(AuditLog).filter(
+            AuditLog.timestamp < before,
+            or_(AuditLog.timestamp < last.timestamp, and_(AuditLog.timestamp == last.timestamp, AuditLog.id <= last.id))
+        ).delete(synchronize_session=False)
+        db.commit()
+        removed += len(logs)
+        if len(logs) < batch_size:
+            break
+    return removed
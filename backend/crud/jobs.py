@@ -0,0 +1,107 @@
+from sqlalchemy.orm import Session
+from backend.models import TranscodeJob, DownloadJob, Media
+
+ACTIVE_STATES = ('queued', 'running')
+
+def create_job(db: Session, media_id: int, preset: str, input_path: str, output_path: str, priority: int):
+    job = TranscodeJob(
+        media_id=media_id,
+        preset=preset,
+        input_path=input_path,
+        output_path=output_path,
+        priority=priority,
+        state='queued',
+        progress=0.0
+    )
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    return job
+
+def get_job(db: Session, job_id: int):
+    return db.query(TranscodeJob).filter(TranscodeJob.id == job_id).first()
+
+def get_active_job(db: Session, media_id: int, preset: str):
+    return db.query(TranscodeJob).filter(
+        TranscodeJob.media_id == media_id,
+        TranscodeJob.preset == preset,
+        TranscodeJob.state.in_(ACTIVE_STATES)
+    ).first()
+
+def get_active_job_for_output(db: Session, preset: str, output_path: str):
+    """Queued/running job writing `output_path`, whichever media queued it (outputs are shared by duplicates)."""
+    return db.query(TranscodeJob).filter(
+        TranscodeJob.preset == preset,
+        TranscodeJob.output_path == output_path,
+        TranscodeJob.state.in_(ACTIVE_STATES)
+    ).first()
+
+def get_latest_job(db: Session, media_id: int, preset: str):
+    return db.query(TranscodeJob).filter(
+        TranscodeJob.media_id == media_id,
+        TranscodeJob.preset == preset
+    ).order_by(TranscodeJob.id.desc()).first()
+
+def list_jobs(db: Session, state: str = None, media_id: int = None, uploader_id: int = None, limit: int = 100):
+    q = db.query(TranscodeJob)
+    if uploader_id is not None:
+        q = q.join(Media, Media.id == TranscodeJob.media_id).filter(Media.uploader_id == uploader_id)
+    if state:
+        q = q.filter(TranscodeJob.state == state)
+    if media_id is not None:
+        q = q.filter(TranscodeJob.media_id == media_id)
+    return q.order_by(TranscodeJob.id.desc()).limit(limit).all()
+
+def list_unfinished_jobs(db: Session):
+    return db.query(TranscodeJob).filter(TranscodeJob.state.in_(ACTIVE_STATES)).order_by(TranscodeJob.id).all()
+
+def cancel_queued_jobs(db: Session, media_id: int):
+    db.query(TranscodeJob).filter(
+        TranscodeJob.media_id == media_id,
+        TranscodeJob.state == 'queued'
+    ).update({TranscodeJob.state: 'cancelled'}, synchronize_session=False)
+    db.commit()
+
+def cancel_active_jobs(db: Session, media_id: int, error: str):
+    """Cancel queued and running jobs of a media item; a running job stops at its next progress report."""
+    db.query(TranscodeJob).filter(
+        TranscodeJob.media_id == media_id,
+        TranscodeJob.state.in_(ACTIVE_STATES)
+    ).update({TranscodeJob.state: 'cancelled', TranscodeJob.error: error}, synchronize_session=False)
+    db.commit()
+
+def create_download_job(db: Session, url: str, fmt: str, genre: str, tags: list, user_id: int):
+    job = DownloadJob(
+        url=url,
+        format=fmt,
+        genre=genre,
+        tags=",".join(t for t in tags if t),
+        user_id=user_id,
+        state='queued',
+        progress=0.0
+    )
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    return job
+
+def get_download_job(db: Session, job_id: int):
+    return db.query(DownloadJob).filter(DownloadJob.id == job_id).first()
+
+def get_active_download(db: Session, url: str, user_id: int):
+    return db.query(DownloadJob).filter(
+        DownloadJob.url == url,
+        DownloadJob.user_id == user_id,
+        DownloadJob.state.in_(ACTIVE_STATES)
+    ).first()
+
+def list_download_jobs(db: Session, user_id: int = None, state: str = None, limit: int = 100):
+    q = db.query(DownloadJob)
+    if user_id is not None:
+        q = q.filter(DownloadJob.user_id == user_id)
+    if state:
+        q = q.filter(DownloadJob.state == state)
+    return q.order_by(DownloadJob.id.desc()).limit(limit).all()
+
+def list_unfinished_downloads(db: Session):
+    return db.query(DownloadJob).filter(DownloadJob.state.in_(ACTIVE_STATES)).order_by(DownloadJob.id).all()
@@ -1,54 +1,207 @@
+from sqlalchemy import and_, or_, func, select
+from sqlalchemy.exc import IntegrityError
+from datetime import datetime
 from sqlalchemy.orm import Session, joinedload
-from backend.models import Media, Genre, Tag
+from backend.models import Media, Genre, Tag, media_tag
 from backend.crud.users import log_action
+from backend.crud.search import index_media, remove_media_from_index
+from backend.utils.pagination import encode_cursor, decode_cursor, InvalidCursor
 
-def create_media(db: Session, filename: str, filepath: str, genre: str, tags: list, uploader_id: int, user=None):
-    # Handle genre
-    genre_obj = None
-    if genre:
-        genre_obj = db.query(Genre).filter(Genre.name == genre).first()
-        if not genre_obj:
-            genre_obj = Genre(name=genre)
-            db.add(genre_obj)
-            db.commit()
-            db.refresh(genre_obj)
-    # Handle tags
-    tag_objs = []
-    for tag in tags:
-        tag_obj = db.query(Tag).filter(Tag.name == tag).first()
-        if not tag_obj:
-            tag_obj = Tag(name=tag)
-            db.add(tag_obj)
-            db.commit()
-            db.refresh(tag_obj)
-        tag_objs.append(tag_obj)
-    # Create media entry
+MEDIA_TYPE_EXTENSIONS = {
+    "video": [".mp4", ".mkv", ".mov"],
+    "audio": [".mp3", ".aac", ".flac"],
+    "image": [".jpg", ".jpeg", ".png", ".heic"],
+}
+
+# Stay well below SQLite's bound-parameter limit in IN lists
+IN_CHUNK_SIZE = 500
+
+def _chunks(values: list, size: int = IN_CHUNK_SIZE):
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+def _insert_ignore(db: Session, model, rows: list):
+    dialect = db.get_bind().dialect.name
+    if dialect in ("sqlite", "postgresql"):
+        if dialect == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert
+        db.execute(insert(model).values(rows).on_conflict_do_nothing(index_elements=["name"]))
+        return
+    for row in rows:
+        # Savepoint per row so a concurrent insert of the same name is harmless
+        try:
+            with db.begin_nested():
+                db.add(model(**row))
+        except IntegrityError:
+            pass
+
+def resolve_names(db: Session, model, names):
+    """Return {name: row} for a Genre/Tag model, creating missing names.
+
+    One IN query finds existing rows; missing names are added with a single
+    insert-or-ignore and re-read. Nothing is committed here, so the caller's
+    transaction covers the whole media insert.
+    """
+    names = list(dict.fromkeys(n for n in names if n))
+    found = {}
+    for chunk in _chunks(names):
+        found.update({row.name: row for row in db.query(model).filter(model.name.in_(chunk))})
+    missing = [n for n in names if n not in found]
+    for chunk in _chunks(missing):
+        _insert_ignore(db, model, [{"name": n} for n in chunk])
+        found.update({row.name: row for row in db.query(model).filter(model.name.in_(chunk))})
+    return found
+
+def create_media(db: Session, filename: str, filepath: str, genre: str, tags: list, uploader_id: int, user=None, blob_id: int = None):
+    genres = resolve_names(db, Genre, [genre])
+    tag_objs = resolve_names(db, Tag, tags or [])
     media = Media(
         filename=filename,
         filepath=filepath,
-        genre=genre_obj,
-        tags=tag_objs,
-        uploader_id=uploader_id
+        genre=genres.get(genre),
+        tags=list(tag_objs.values()),
+        uploader_id=uploader_id,
+        blob_id=blob_id
     )
     db.add(media)
+    db.flush()
+    index_media(db, media.id, filename, genre, list(tag_objs))
     db.commit()
     db.refresh(media)
     if user:
         log_action(db, user, 'upload_media', target_type='media', target_id=media.id)
     return media
 
+def create_media_bulk(db: Session, items: list, uploader_id: int = None, user=None):
+    """Insert many media rows in one transaction.
+
+    `items` are dicts with filename, filepath and optional genre/tags. Genres and
+    tags for the whole batch are resolved together with resolve_names. Returns
+    the new media ids in input order.
+    """
+    genres = resolve_names(db, Genre, [item.get("genre") for item in items])
+    tags = resolve_names(db, Tag, [tag for item in items for tag in item.get("tags") or []])
+    media_list = [
+        Media(
+            filename=item["filename"],
+            filepath=item["filepath"],
+            genre=genres.get(item.get("genre")),
+            tags=[tags[t] for t in dict.fromkeys(item.get("tags") or []) if t],
+            uploader_id=uploader_id
+        )
+        for item in items
+    ]
+    db.add_all(media_list)
+    db.flush()
+    # Read ids before commit expires the instances
+    media_ids = [m.id for m in media_list]
+    for item, media_id in zip(items, media_ids):
+        index_media(db, media_id, item["filename"], item.get("genre"), [t for t in item.get("tags") or [] if t])
+    db.commit()
+    if user and media_ids:
+        log_action(db, user, 'bulk_add_media', target_type='media', details=f"{len(media_ids)} items")
+    return media_ids
+
 def get_media(db: Session, media_id: int):
     return db.query(Media).options(joinedload(Media.genre), joinedload(Media.tags)).filter(Media.id == media_id).first()
 
+def get_media_by_filename(db: Session, filename: str):
+    return db.query(Media).filter(Media.filename == filename).first()
+
+MEDIA_INFO_FIELDS = ("container", "video_codec", "audio_codec", "duration", "width", "height", "bitrate")
+
+def set_media_info(db: Session, media_id: int, info: dict):
+    """Store the result of probe_media on a media row."""
+    values = {getattr(Media, field): info.get(field) for field in MEDIA_INFO_FIELDS}
+    values[Media.probed_at] = datetime.utcnow()
+    db.query(Media).filter(Media.id == media_id).update(values, synchronize_session=False)
+    db.commit()
+
+def clear_media_info(db: Session, media_id: int):
+    """Forget probe results, e.g. after the file changed; the next transcode probes again."""
+    values = {getattr(Media, field): None for field in MEDIA_INFO_FIELDS}
+    values[Media.probed_at] = None
+    db.query(Media).filter(Media.id == media_id).update(values, synchronize_session=False)
+    db.commit()
+
 def list_media(db: Session):
     return db.query(Media).options(joinedload(Media.genre), joinedload(Media.tags)).all()
 
+def list_media_page(db: Session, limit: int = None, after: str = None, sort: str = "id",
+                    genre: str = None, tag: str = None, uploader_id: int = None, media_type: str = None):
+    """Keyset-paginated media listing projected to plain dicts.
+
+    Returns (items, next_cursor); next_cursor is None on the last page or when
+    no limit is given. Tags for the whole page are fetched in one IN query.
+    """
+    q = _projected_query(db)
+    if genre:
+        q = q.filter(Genre.name == genre)
+    if tag:
+        q = q.filter(Media.id.in_(
+            select(media_tag.c.media_id).join(Tag, Tag.id == media_tag.c.tag_id).where(Tag.name == tag)
+        ))
+    if uploader_id is not None:
+        q = q.filter(Media.uploader_id == uploader_id)
+    if media_type:
+        extensions = MEDIA_TYPE_EXTENSIONS.get(media_type)
+        if extensions is None:
+            raise ValueError(f"Unknown media type: {media_type}")
+        q = q.filter(or_(*[func.lower(Media.filename).like(f"%{ext}") for ext in extensions]))
+    if after:
+        cursor = decode_cursor(after)
+        if cursor.get("s") != sort or not isinstance(cursor.get("k"), list):
+            raise InvalidCursor("Cursor does not match the requested sort")
+        try:
+            if sort == "name":
+                name, last_id = cursor["k"]
+                q = q.filter(or_(Media.filename > name, and_(Media.filename == name, Media.id > last_id)))
+            else:
+                (last_id,) = cursor["k"]
+                q = q.filter(Media.id > last_id)
+        except ValueError:
+            raise InvalidCursor("Invalid cursor")
+    q = q.order_by(Media.filename, Media.id) if sort == "name" else q.order_by(Media.id)
+    if limit:
+        q = q.limit(limit + 1)
+    rows = q.all()
+    next_cursor = None
+    if limit and len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor({"s": sort, "k": [last.filename, last.id] if sort == "name" else [last.id]})
+    return _with_tags(db, rows), next_cursor
+
+def get_media_items(db: Session, media_ids: list):
+    """Projected media dicts for the given ids, in the same order."""
+    rows = []
+    for chunk in _chunks(media_ids):
+        rows += _projected_query(db).filter(Media.id.in_(chunk)).all()
+    by_id = {item["id"]: item for item in _with_tags(db, rows)}
+    return [by_id[media_id] for media_id in media_ids if media_id in by_id]
+
+def _projected_query(db: Session):
+    return db.query(Media.id, Media.filename, Media.filepath, Genre.name.label("genre")).outerjoin(Genre, Media.genre_id == Genre.id)
+
+def _with_tags(db: Session, rows: list):
+    tags = {}
+    for chunk in _chunks([row.id for row in rows]):
+        for media_id, name in db.query(media_tag.c.media_id, Tag.name).join(Tag, Tag.id == media_tag.c.tag_id).filter(media_tag.c.media_id.in_(chunk)):
+            tags.setdefault(media_id, []).append(name)
+    return [
+        {"id": row.id, "filename": row.filename, "filepath": row.filepath, "genre": row.genre, "tags": tags.get(row.id, [])}
+        for row in rows
+    ]
+
 def delete_media(db: Session, media_id: int, current_user):
     if current_user.role != 'admin':
         return False
     media = db.query(Media).filter(Media.id == media_id).first()
     if media:
         db.delete(media)
+        remove_media_from_index(db, media_id)
         db.commit()
         log_action(db, current_user, 'delete_media', target_type='media', target_id=media_id)
         return True
@@ -62,6 +215,8 @@ def update_media(db: Session, media_id: int, data: dict, current_user):
         return None
     for key, value in data.items():
         setattr(media, key, value)
+    db.flush()
+    index_media(db, media_id)
     db.commit()
     db.refresh(media)
     log_action(db, current_user, 'edit_media', target_type='media', target_id=media_id)
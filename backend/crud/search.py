@@ -0,0 +1,116 @@
+import re
+from sqlalchemy import text, or_, and_, select
+from sqlalchemy.orm import Session
+from backend.models import Media, Genre, Tag, media_tag
+
+# Column weights for bm25(): filename, genre, tags
+RANK_WEIGHTS = (10.0, 3.0, 5.0)
+
+_CREATE_FTS = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS media_fts USING fts5("
+    "filename, genre, tags, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+)
+_REBUILD_FTS = """
+INSERT INTO media_fts (rowid, filename, genre, tags)
+SELECT m.id, m.filename, COALESCE(g.name, ''),
+       COALESCE((SELECT group_concat(t.name, ' ') FROM media_tag mt JOIN tag t ON t.id = mt.tag_id WHERE mt.media_id = m.id), '')
+FROM media m LEFT JOIN genre g ON g.id = m.genre_id
+"""
+
+# None until checked; True once the FTS5 table is known to exist, False without SQLite
+_fts_enabled = None
+
+
+def ensure_search_index(engine):
+    """Create and populate the FTS5 table if missing, on a connection of its own.
+
+    Run at startup and by init_db/reindex; returns False when the database is
+    not SQLite or SQLite was built without FTS5 (search then uses LIKE).
+    """
+    global _fts_enabled
+    if engine.dialect.name != "sqlite":
+        _fts_enabled = False
+        return False
+    try:
+        with engine.begin() as conn:
+            exists = conn.execute(text("SELECT 1 FROM sqlite_master WHERE name = 'media_fts'")).first()
+            if not exists:
+                conn.execute(text(_CREATE_FTS))
+                conn.execute(text(_REBUILD_FTS))
+    except Exception:
+        # SQLite built without FTS5: fall back to LIKE queries
+        return False
+    _fts_enabled = True
+    return True
+
+def _ensure_index(db: Session):
+    """Whether the FTS5 table exists. Only reads, so the caller's transaction is left alone."""
+    global _fts_enabled
+    if _fts_enabled is None:
+        if db.get_bind().dialect.name != "sqlite":
+            _fts_enabled = False
+        elif db.execute(text("SELECT 1 FROM sqlite_master WHERE name = 'media_fts'")).first():
+            _fts_enabled = True
+        else:
+            # Not created yet (ensure_search_index has not run); nothing to keep in sync
+            return False
+    return _fts_enabled
+
+def rebuild_search_index(db: Session):
+    """Re-populate the search index from the catalog; returns the number of rows indexed."""
+    if not ensure_search_index(db.get_bind()):
+        return 0
+    db.execute(text("DELETE FROM media_fts"))
+    db.execute(text(_REBUILD_FTS))
+    db.commit()
+    return db.execute(text("SELECT count(*) FROM media_fts")).scalar()
+
+def index_media(db: Session, media_id: int, filename: str = None, genre: str = None, tags: list = None):
+    """(Re)index one media item inside the caller's transaction.
+
+    Pass filename/genre/tags when already known; otherwise they are read from the
+    database (pending changes must be flushed first).
+    """
+    if not _ensure_index(db):
+        return
+    if filename is None:
+        row = db.query(Media.filename, Genre.name).outerjoin(Genre, Media.genre_id == Genre.id).filter(Media.id == media_id).first()
+        if row is None:
+            remove_media_from_index(db, media_id)
+            return
+        filename, genre = row
+        tags = [name for (name,) in db.query(Tag.name).join(media_tag, Tag.id == media_tag.c.tag_id).filter(media_tag.c.media_id == media_id)]
+    db.execute(text("DELETE FROM media_fts WHERE rowid = :id"), {"id": media_id})
+    db.execute(
+        text("INSERT INTO media_fts (rowid, filename, genre, tags) VALUES (:id, :filename, :genre, :tags)"),
+        {"id": media_id, "filename": filename, "genre": genre or "", "tags": " ".join(tags or [])}
+    )
+
+def remove_media_from_index(db: Session, media_id: int):
+    if _ensure_index(db):
+        db.execute(text("DELETE FROM media_fts WHERE rowid = :id"), {"id": media_id})
+
+def search_media_ids(db: Session, q: str, limit: int = 50, offset: int = 0):
+    """Return media ids matching every word of `q` as a prefix, best match first."""
+    words = re.findall(r"\w+", q.lower())
+    if not words:
+        return []
+    if _ensure_index(db):
+        match = " ".join(f'"{w}"*' for w in words)
+        weights = ", ".join(str(w) for w in RANK_WEIGHTS)
+        rows = db.execute(
+            text(f"SELECT rowid FROM media_fts WHERE media_fts MATCH :match ORDER BY bm25(media_fts, {weights}) LIMIT :limit OFFSET :offset"),
+            {"match": match, "limit": limit, "offset": offset}
+        )
+        return [row[0] for row in rows]
+    # Without FTS5: substring match on filename, genre or tag for each word
+    conditions = []
+    for w in words:
+        pattern = f"%{w}%"
+        conditions.append(or_(
+            Media.filename.ilike(pattern),
+            Genre.name.ilike(pattern),
+            Media.id.in_(select(media_tag.c.media_id).join(Tag, Tag.id == media_tag.c.tag_id).where(Tag.name.ilike(pattern)))
+        ))
+    q = db.query(Media.id).outerjoin(Genre, Media.genre_id == Genre.id).filter(and_(*conditions)).order_by(Media.id)
+    return [media_id for (media_id,) in q.limit(limit).offset(offset)]
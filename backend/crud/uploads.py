@@ -0,0 +1,86 @@
+from datetime import datetime
+from sqlalchemy.orm import Session
+from backend.models import UploadSession, UploadChunk
+
+def create_upload_session(db: Session, user_id: int, filename: str, size: int, sha256: str, genre: str, tags: list, expires_at: datetime):
+    session = UploadSession(
+        user_id=user_id,
+        filename=filename,
+        size=size,
+        sha256=sha256,
+        genre=genre,
+        tags=",".join(tags) if tags else None,
+        state='open',
+        expires_at=expires_at
+    )
+    db.add(session)
+    db.flush()
+    return session
+
+def get_upload_session(db: Session, session_id: int):
+    return db.query(UploadSession).filter(UploadSession.id == session_id).first()
+
+def list_upload_sessions(db: Session, user_id: int):
+    return db.query(UploadSession).filter(UploadSession.user_id == user_id).order_by(UploadSession.id).all()
+
+def list_expired_upload_sessions(db: Session, now: datetime):
+    return db.query(UploadSession).filter(UploadSession.expires_at < now).all()
+
+def list_received_chunks(db: Session, session_id: int):
+    return db.query(UploadChunk).filter(
+        UploadChunk.session_id == session_id, UploadChunk.state == 'received'
+    ).order_by(UploadChunk.offset).all()
+
+def find_overlapping_chunk(db: Session, session_id: int, offset: int, length: int):
+    """A received or in-flight chunk sharing any byte with [offset, offset + length)."""
+    return db.query(UploadChunk).filter(
+        UploadChunk.session_id == session_id,
+        UploadChunk.offset < offset + length,
+        UploadChunk.offset + UploadChunk.length > offset
+    ).first()
+
+def reserve_upload_chunk(db: Session, session_id: int, offset: int, length: int, pid: int, expires_at: datetime):
+    """Insert a 'writing' chunk unless it overlaps another; returns (chunk, None) or (None, overlapping chunk).
+
+    The session row is updated first, so the check and the insert run in one
+    transaction holding the database write lock (a row lock on other databases):
+    reservations for the same upload are serialized across server processes.
+    """
+    db.query(UploadSession).filter(UploadSession.id == session_id).update(
+        {UploadSession.expires_at: expires_at}, synchronize_session=False
+    )
+    existing = find_overlapping_chunk(db, session_id, offset, length)
+    if existing is not None:
+        db.rollback()
+        return None, existing
+    chunk = UploadChunk(session_id=session_id, offset=offset, length=length, state='writing', pid=pid)
+    db.add(chunk)
+    db.commit()
+    return chunk, None
+
+def claim_upload_session(db: Session, session_id: int, pid: int, holder: int = None):
+    """Mark an 'open' session 'completing' by `pid`; returns whether this call won it.
+
+    With `holder`, takes over a session still 'completing' by that (dead)
+    process instead. A conditional UPDATE, so of several requests in any
+    server process only one completes the upload.
+    """
+    q = db.query(UploadSession).filter(UploadSession.id == session_id)
+    if holder is None:
+        q = q.filter(UploadSession.state == 'open')
+    else:
+        q = q.filter(UploadSession.state == 'completing', UploadSession.pid == holder)
+    claimed = q.update({UploadSession.state: 'completing', UploadSession.pid: pid}, synchronize_session=False)
+    db.commit()
+    return bool(claimed)
+
+def release_upload_session(db: Session, session_id: int):
+    db.query(UploadSession).filter(UploadSession.id == session_id).update(
+        {UploadSession.state: 'open', UploadSession.pid: None}, synchronize_session=False
+    )
+    db.commit()
+
+def delete_upload_session(db: Session, session: UploadSession):
+    db.query(UploadChunk).filter(UploadChunk.session_id == session.id).delete(synchronize_session=False)
+    db.delete(session)
+    db.commit()
@@ -1,10 +1,12 @@
 from sqlalchemy.orm import Session
-from backend.models import User, AuditLog
+from backend.models import User
 from backend.auth.hashing import get_password_hash
+from backend.audit import audit_sink
 from datetime import datetime
 
 def log_action(db: Session, user, action, target_type=None, target_id=None, details=None):
-    log = AuditLog(
+    # Queued for a batched write; see AuditSink for flush semantics
+    audit_sink.record(db, dict(
         user_id=user.id if user else None,
         username=user.username if user else None,
         action=action,
@@ -12,9 +14,7 @@ def log_action(db: Session, user, action, target_type=None, target_id=None, deta
         target_id=target_id,
         timestamp=datetime.utcnow(),
         details=details
-    )
-    db.add(log)
-    db.commit()
+    ))
 
 def get_user_by_username(db: Session, username: str):
     return db.query(User).filter(User.username == username).first()
@@ -0,0 +1,236 @@
+import os
+import queue
+import shutil
+import threading
+import time
+import subprocess
+from collections import deque
+from datetime import datetime
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from backend.database import SessionLocal
+from backend.models import DownloadJob, Media, User
+from backend.crud.jobs import create_download_job, get_active_download, list_unfinished_downloads
+from backend.crud.media import create_media, get_media_by_filename, MEDIA_TYPE_EXTENSIONS
+from backend.scheduler import transcode_scheduler, PROGRESS_INTERVAL, _pid_alive
+from backend.storage import store_file, release_blob, derivative_key, INCOMING_DIR
+
+# Concurrent yt-dlp processes per server process
+DOWNLOAD_WORKERS = int(os.getenv("DOWNLOAD_WORKERS", "2"))
+YTDLP_BINARY = os.getenv("YTDLP_BINARY", "yt-dlp")
+# The video id keeps concurrent downloads of same-titled videos apart
+DOWNLOAD_TEMPLATE = "%(title).150B [%(id)s].%(ext)s"
+
+# Line prefixes for the machine-readable output requested from yt-dlp
+PROGRESS_MARKER = "[progress]"
+FILE_MARKER = "[filepath]"
+
+
+def build_command(url: str, fmt: str, output_dir: str):
+    return [
+        YTDLP_BINARY,
+        "-f", fmt,
+        "--no-playlist",
+        "--newline",
+        # --print implies --quiet; keep the progress lines
+        "--progress",
+        "--progress-template",
+        f"download:{PROGRESS_MARKER} %(progress.downloaded_bytes)s %(progress.total_bytes)s %(progress.total_bytes_estimate)s",
+        "--print", f"after_move:{FILE_MARKER} %(filepath)s",
+        "--merge-output-format", "mp4",
+        "-o", os.path.join(output_dir, DOWNLOAD_TEMPLATE),
+        # A URL starting with '-' must not be read as an option
+        "--", url
+    ]
+
+def parse_progress(line: str):
+    """Return (downloaded_bytes, total_bytes or None) from a progress line, or None."""
+    fields = line[len(PROGRESS_MARKER):].split()
+    if len(fields) != 3:
+        return None
+    values = []
+    for field in fields:
+        try:
+            values.append(int(float(field)))
+        except ValueError:
+            values.append(None)  # yt-dlp prints NA for unknown values
+    downloaded, total, estimate = values
+    if downloaded is None:
+        return None
+    return downloaded, total or estimate
+
+
+class DownloadManager:
+    """Runs yt-dlp download jobs on a bounded pool of worker threads.
+
+    Jobs live in the `download_job` table and are processed in FIFO order.
+    Each job learns its result file from yt-dlp itself, is added to the
+    catalog, and has an HLS transcode and previews queued when it is a video.
+    """
+
+    def __init__(self, workers: int = DOWNLOAD_WORKERS):
+        self.workers = workers
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._procs = {}  # job_id -> Popen
+        self._threads = []
+        self._stopping = False
+
+    def start(self):
+        """Requeue unfinished jobs from the database and start the workers."""
+        if self._threads:
+            return
+        self._stopping = False
+        db = SessionLocal()
+        try:
+            for job in list_unfinished_downloads(db):
+                if job.state == 'running':
+                    if _pid_alive(job.pid):
+                        continue
+                    job.state = 'queued'
+                    job.progress = 0.0
+                    job.pid = None
+                self._queue.put(job.id)
+            db.commit()
+        finally:
+            db.close()
+        for i in range(self.workers):
+            t = threading.Thread(target=self._worker, name=f"download-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def stop(self):
+        """Stop the workers and kill running downloads; they are requeued on the next start."""
+        self._stopping = True
+        for _ in self._threads:
+            self._queue.put(None)
+        with self._lock:
+            for proc in self._procs.values():
+                proc.kill()
+        self._threads = []
+
+    def submit(self, db: Session, url: str, fmt: str, genre: str, tags: list, user_id: int):
+        """Queue a download, or return this user's queued/running job for the same URL."""
+        with self._lock:
+            job = get_active_download(db, url, user_id)
+            if job is None:
+                job = create_download_job(db, url, fmt, genre, tags, user_id)
+                self._queue.put(job.id)
+            return job
+
+    def _worker(self):
+        while True:
+            job_id = self._queue.get()
+            if job_id is None or self._stopping:
+                return
+            db = SessionLocal()
+            try:
+                job = self._claim(db, job_id)
+                if job is not None:
+                    self._run(db, job)
+            finally:
+                db.close()
+
+    def _claim(self, db: Session, job_id: int):
+        claimed = db.query(DownloadJob).filter(
+            DownloadJob.id == job_id,
+            DownloadJob.state == 'queued'
+        ).update({
+            DownloadJob.state: 'running',
+            DownloadJob.pid: os.getpid(),
+            DownloadJob.started_at: datetime.utcnow()
+        }, synchronize_session=False)
+        db.commit()
+        if not claimed:
+            return None
+        return db.query(DownloadJob).filter(DownloadJob.id == job_id).first()
+
+    def _run(self, db: Session, job: DownloadJob):
+        output_dir = self._output_dir(job)
+        try:
+            job.filepath = self._download(db, job, output_dir)
+            self._add_to_library(db, job)
+        except Exception as e:
+            db.rollback()
+            if self._stopping:
+                # Killed by stop(); leave it 'running' (and its partial files) so the next start requeues it
+                return
+            job.state = 'failed'
+            job.error = str(e) or e.__class__.__name__
+        else:
+            job.state = 'done'
+            job.progress = 1.0
+        job.finished_at = datetime.utcnow()
+        db.commit()
+        shutil.rmtree(output_dir, ignore_errors=True)
+
+    def _output_dir(self, job: DownloadJob):
+        # One directory per job: users downloading the same URL at once must not share files.
+        # Hidden from the library scanner until the result is moved into the store.
+        return os.path.join(INCOMING_DIR, f"download-{job.id}")
+
+    def _download(self, db: Session, job: DownloadJob, output_dir: str):
+        os.makedirs(output_dir, exist_ok=True)
+        proc = subprocess.Popen(
+            build_command(job.url, job.format, output_dir),
+            stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+            text=True, bufsize=1
+        )
+        with self._lock:
+            self._procs[job.id] = proc
+        tail = deque(maxlen=20)
+        filepath = None
+        last_write = 0.0
+        try:
+            for line in proc.stdout:
+                line = line.strip()
+                if line.startswith(FILE_MARKER):
+                    filepath = line[len(FILE_MARKER):].strip()
+                elif line.startswith(PROGRESS_MARKER):
+                    parsed = parse_progress(line)
+                    now = time.monotonic()
+                    if parsed and now - last_write >= PROGRESS_INTERVAL:
+                        last_write = now
+                        job.downloaded_bytes, job.total_bytes = parsed
+                        if job.total_bytes:
+                            job.progress = min(job.downloaded_bytes / job.total_bytes, 0.99)
+                        db.commit()
+                elif line:
+                    tail.append(line)
+            proc.wait()
+        finally:
+            with self._lock:
+                self._procs.pop(job.id, None)
+        if proc.returncode != 0:
+            raise RuntimeError("yt-dlp failed: " + "\n".join(tail)[-2000:])
+        if not filepath or not os.path.isfile(filepath):
+            raise RuntimeError("yt-dlp did not report a downloaded file")
+        return filepath
+
+    def _add_to_library(self, db: Session, job: DownloadJob):
+        filename = os.path.basename(job.filepath)
+        blob = store_file(db, job.filepath)
+        media = get_media_by_filename(db, filename)
+        if media is not None:
+            # Downloaded before: keep the existing item if it is the same content
+            release_blob(db, blob.id, media.id)
+            if media.blob_id != blob.id:
+                raise RuntimeError(f"A media item named {filename} already exists")
+        else:
+            user = db.query(User).filter(User.id == job.user_id).first()
+            tags = job.tags.split(",") if job.tags else []
+            try:
+                media = create_media(db, filename, blob.path, job.genre, tags, job.user_id, user=user, blob_id=blob.id)
+            except IntegrityError:
+                db.rollback()
+                release_blob(db, blob.id)
+                raise RuntimeError(f"A media item named {filename} already exists")
+        job.media_id = media.id
+        job.filepath = media.filepath
+        if os.path.splitext(filename)[1].lower() in MEDIA_TYPE_EXTENSIONS["video"]:
+            transcode_job = transcode_scheduler.queue_video_derivatives(db, media.id, media.filepath, derivative_key(media))
+            if transcode_job is not None:
+                job.transcode_job_id = transcode_job.id
+
+
+download_manager = DownloadManager()
@@ -0,0 +1,254 @@
+import os
+import math
+import time
+import threading
+import subprocess
+from collections import OrderedDict
+from backend.utils.transcoding import probe_media, HLS_SEGMENT_SECONDS
+
+# Serve a just-in-time playlist for videos that have no finished HLS transcode yet
+HLS_ON_DEMAND = os.getenv("HLS_ON_DEMAND", "1") == "1"
+# Rendition produced on demand (capped at the source height)
+HLS_ON_DEMAND_HEIGHT = int(os.getenv("HLS_ON_DEMAND_HEIGHT", "480"))
+HLS_ON_DEMAND_VIDEO_KBPS = int(os.getenv("HLS_ON_DEMAND_VIDEO_KBPS", "1400"))
+# A request this many segments past the encoder's position restarts it at the new offset
+HLS_ON_DEMAND_SEEK_THRESHOLD = int(os.getenv("HLS_ON_DEMAND_SEEK_THRESHOLD", "5"))
+# Encoders with no segment requests for this many seconds are stopped
+HLS_ON_DEMAND_IDLE_SECONDS = int(os.getenv("HLS_ON_DEMAND_IDLE_SECONDS", "120"))
+# How long a segment request waits for the encoder before giving up
+HLS_ON_DEMAND_WAIT_SECONDS = int(os.getenv("HLS_ON_DEMAND_WAIT_SECONDS", "30"))
+# Concurrent just-in-time encoders per server process; requests for other items get 503 past this.
+# Defaults to TRANSCODE_WORKERS (backend.scheduler imports this module through the cache)
+HLS_ON_DEMAND_MAX_ENCODERS = (
+    int(os.getenv("HLS_ON_DEMAND_MAX_ENCODERS", "0")) or int(os.getenv("TRANSCODE_WORKERS", "0")) or os.cpu_count() or 1
+)
+# Probe results kept in memory (least recently used are dropped)
+HLS_ON_DEMAND_PROBE_CACHE = int(os.getenv("HLS_ON_DEMAND_PROBE_CACHE", "256"))
+# How often an encoder's directory is checked for new segments
+WATCH_SECONDS = 0.1
+
+ONDEMAND_DIR = "jit"
+PLAYLIST_NAME = "playlist.m3u8"
+
+
+class SegmentUnavailable(Exception):
+    pass
+
+
+def segment_name(index: int):
+    return f"segment_{index:03d}.ts"
+
+def parse_segment_name(filename: str):
+    """Return the index encoded in `segment_NNN.ts`, or None."""
+    if not (filename.startswith("segment_") and filename.endswith(".ts")):
+        return None
+    number = filename[len("segment_"):-len(".ts")]
+    return int(number) if number.isdigit() else None
+
+
+class _Encoder:
+    def __init__(self, proc: subprocess.Popen, start_index: int, segment_dir: str):
+        self.proc = proc
+        self.start_index = start_index
+        self.segment_dir = segment_dir
+        self.position = start_index  # first segment not yet seen on disk
+        self.last_request = time.monotonic()
+        # Notified when a segment appears or ffmpeg exits
+        self.changed = threading.Condition()
+        threading.Thread(target=self._watch, name=f"jit-{proc.pid}", daemon=True).start()
+
+    def running(self):
+        return self.proc.poll() is None
+
+    def stop(self):
+        if self.running():
+            self.proc.kill()
+        self.proc.wait()
+
+    def advance(self):
+        """Move `position` past the segments on disk; returns whether it moved."""
+        with self.changed:
+            start = self.position
+            while os.path.exists(os.path.join(self.segment_dir, segment_name(self.position))):
+                self.position += 1
+            return self.position != start
+
+    def wait_for(self, path: str, timeout: float):
+        """Block until `path` exists or ffmpeg exits, for at most `timeout` seconds."""
+        with self.changed:
+            self.changed.wait_for(lambda: os.path.exists(path) or not self.running(), timeout)
+
+    def _watch(self):
+        # ffmpeg has no per-segment callback; one thread per encoder looks for its output
+        while True:
+            try:
+                self.proc.wait(timeout=WATCH_SECONDS)
+                exited = True
+            except subprocess.TimeoutExpired:
+                exited = False
+            with self.changed:
+                if self.advance() or exited:
+                    self.changed.notify_all()
+            if exited:
+                return
+
+
+class OnDemandHLS:
+    """Produces HLS segments lazily, one ffmpeg process per output directory.
+
+    The playlist is computed up front from the probed duration. A segment
+    request reuses the running encoder when it is close enough behind the
+    requested position and otherwise restarts ffmpeg seeked to that segment.
+    Requests wait on the encoder's condition until their segment appears.
+    Finished segments stay in `hls_<key>/jit/` and are served from disk.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._encoders = {}  # output_dir -> _Encoder
+        self._info_lock = threading.Lock()
+        self._info = OrderedDict()  # input_path -> probe result, least recently used first
+
+    def _probe(self, input_path: str):
+        with self._info_lock:
+            info = self._info.get(input_path)
+            if info is not None:
+                self._info.move_to_end(input_path)
+                return info
+        info = probe_media(input_path)
+        if not info or not info.get("duration"):
+            raise SegmentUnavailable("Could not determine media duration")
+        with self._info_lock:
+            self._info[input_path] = info
+            while len(self._info) > HLS_ON_DEMAND_PROBE_CACHE:
+                self._info.popitem(last=False)
+        return info
+
+    def segment_count(self, input_path: str):
+        return math.ceil(self._probe(input_path)["duration"] / HLS_SEGMENT_SECONDS)
+
+    def playlist(self, input_path: str, output_dir: str):
+        """Write the full VOD playlist for a media item and return its path."""
+        path = os.path.join(output_dir, ONDEMAND_DIR, PLAYLIST_NAME)
+        if os.path.exists(path):
+            return path
+        duration = self._probe(input_path)["duration"]
+        count = self.segment_count(input_path)
+        lines = [
+            "#EXTM3U",
+            "#EXT-X-VERSION:3",
+            f"#EXT-X-TARGETDURATION:{HLS_SEGMENT_SECONDS}",
+            "#EXT-X-MEDIA-SEQUENCE:0",
+            "#EXT-X-PLAYLIST-TYPE:VOD",
+        ]
+        for index in range(count):
+            length = min(HLS_SEGMENT_SECONDS, duration - index * HLS_SEGMENT_SECONDS)
+            # URIs are relative to /media/hls/<id>/, where this playlist is served
+            lines += [f"#EXTINF:{length:.6f},", f"{ONDEMAND_DIR}/{segment_name(index)}"]
+        lines.append("#EXT-X-ENDLIST")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp_path, path)
+        return path
+
+    def segment_path(self, output_dir: str, index: int):
+        return os.path.join(output_dir, ONDEMAND_DIR, segment_name(index))
+
+    def segment(self, input_path: str, output_dir: str, index: int):
+        """Return the path of a finished segment, encoding it first if needed."""
+        if index < 0 or index >= self.segment_count(input_path):
+            raise FileNotFoundError(segment_name(index))
+        segment_dir = os.path.join(output_dir, ONDEMAND_DIR)
+        path = self.segment_path(output_dir, index)
+        self.reap_idle()
+        if os.path.exists(path):
+            self._touch(output_dir)
+            return path
+        with self._lock:
+            encoder = self._encoders.get(output_dir)
+            if encoder is not None:
+                encoder.advance()
+            reusable = (
+                encoder is not None and encoder.running()
+                and encoder.start_index <= index <= encoder.position + HLS_ON_DEMAND_SEEK_THRESHOLD
+            )
+            if not reusable:
+                others = sum(1 for key, e in self._encoders.items() if key != output_dir and e.running())
+                if others >= HLS_ON_DEMAND_MAX_ENCODERS:
+                    raise SegmentUnavailable(f"{HLS_ON_DEMAND_MAX_ENCODERS} just-in-time encoders are already running")
+                if encoder is not None:
+                    encoder.stop()
+                encoder = self._start(input_path, segment_dir, index)
+                self._encoders[output_dir] = encoder
+            encoder.last_request = time.monotonic()
+        encoder.wait_for(path, HLS_ON_DEMAND_WAIT_SECONDS)
+        if os.path.exists(path):
+            return path
+        if not encoder.running():
+            raise SegmentUnavailable(f"Encoder stopped before producing {segment_name(index)}")
+        raise SegmentUnavailable(f"Timed out waiting for {segment_name(index)}")
+
+    def stop(self, output_dir: str = None):
+        with self._lock:
+            keys = [output_dir] if output_dir is not None else list(self._encoders)
+            for key in keys:
+                encoder = self._encoders.pop(key, None)
+                if encoder is not None:
+                    encoder.stop()
+
+    def reap_idle(self):
+        now = time.monotonic()
+        with self._lock:
+            for output_dir, encoder in list(self._encoders.items()):
+                if not encoder.running() or now - encoder.last_request > HLS_ON_DEMAND_IDLE_SECONDS:
+                    encoder.stop()
+                    del self._encoders[output_dir]
+
+    def active(self):
+        with self._lock:
+            return sum(1 for encoder in self._encoders.values() if encoder.running())
+
+    def is_active(self, output_dir: str):
+        with self._lock:
+            encoder = self._encoders.get(output_dir)
+            return encoder is not None and encoder.running()
+
+    def _touch(self, output_dir: str):
+        with self._lock:
+            encoder = self._encoders.get(output_dir)
+            if encoder is not None:
+                encoder.last_request = time.monotonic()
+
+    def _start(self, input_path: str, segment_dir: str, index: int):
+        info = self._probe(input_path)
+        height = min(HLS_ON_DEMAND_HEIGHT, info.get("height") or HLS_ON_DEMAND_HEIGHT)
+        height -= height % 2
+        start = index * HLS_SEGMENT_SECONDS
+        os.makedirs(segment_dir, exist_ok=True)
+        cmd = [
+            "ffmpeg", "-nostdin", "-loglevel", "error",
+            "-ss", str(start), "-i", input_path,
+            "-map", "0:v:0", "-map", "0:a:0?",
+            "-vf", f"scale=-2:{height}",
+            "-c:v", "libx264", "-preset", "veryfast",
+            "-b:v", f"{HLS_ON_DEMAND_VIDEO_KBPS}k",
+            "-c:a", "aac", "-b:a", "128k",
+            # Keep timestamps on the source timeline so segments line up with the playlist
+            "-output_ts_offset", str(start),
+            "-force_key_frames", f"expr:gte(t,n_forced*{HLS_SEGMENT_SECONDS})",
+            "-sc_threshold", "0",
+            "-f", "hls",
+            "-hls_time", str(HLS_SEGMENT_SECONDS),
+            "-hls_list_size", "0",
+            "-hls_flags", "temp_file+independent_segments",
+            "-start_number", str(index),
+            "-hls_segment_filename", os.path.join(segment_dir, "segment_%03d.ts"),
+            "-y", os.path.join(segment_dir, "encoder.m3u8")
+        ]
+        proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        return _Encoder(proc, index, segment_dir)
+
+
+hls_on_demand = OnDemandHLS()
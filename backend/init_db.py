@@ -1,5 +1,15 @@
 from backend.models import Base
-from backend.database import engine
+from backend.database import engine, SessionLocal
+from backend.migrations import apply_migrations
+from backend.crud.search import rebuild_search_index
 
+added = apply_migrations(engine)
 Base.metadata.create_all(bind=engine)
-print("Database and tables created!") 
\ No newline at end of file
+db = SessionLocal()
+try:
+    indexed = rebuild_search_index(db)
+finally:
+    db.close()
+if added:
+    print(f"Added columns: {', '.join(added)}")
+print(f"Database and tables created! Search index holds {indexed} media items.")
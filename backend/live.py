@@ -0,0 +1,191 @@
+import os
+import asyncio
+import tempfile
+import threading
+import subprocess
+from collections import deque
+from fastapi.concurrency import run_in_threadpool
+from backend.database import SessionLocal
+from backend.cache import derivative_cache
+from backend.scheduler import TRANSCODE_WORKERS
+from backend.utils.transcoding import live_transcode_command, remux_media
+
+# Stream quality=low while it is being encoded instead of answering 202 until the file exists
+LIVE_TRANSCODE = os.getenv("LIVE_TRANSCODE", "1") == "1"
+# An encoder with no clients left is killed after this many seconds (covers reloads and seeks)
+LIVE_LINGER_SECONDS = float(os.getenv("LIVE_LINGER_SECONDS", "5"))
+# Concurrent live encoders per server process; past this, requests get the queued transcode (202)
+LIVE_MAX_ENCODERS = int(os.getenv("LIVE_MAX_ENCODERS", "0")) or TRANSCODE_WORKERS
+READ_CHUNK_SIZE = 64 * 1024
+# How often a client that has caught up with the encoder checks for more output
+POLL_SECONDS = 0.05
+
+
+class EncoderLimitReached(Exception):
+    pass
+
+
+class _LiveEncoder:
+    def __init__(self, media_id: int, input_path: str, output_path: str):
+        self.media_id = media_id
+        self.output_path = output_path
+        root, ext = os.path.splitext(output_path)
+        self.audio_only = ext == ".mp3"
+        # Unique per encoder, so a restarted encode never truncates a file being streamed;
+        # ".part." keeps the library scanner away from it
+        fd, self.tmp_path = tempfile.mkstemp(
+            dir=os.path.dirname(output_path) or ".", prefix=os.path.basename(root) + ".live.", suffix=f".part{ext}"
+        )
+        self._out = os.fdopen(fd, "wb")
+        self.clients = 0
+        self.eof = False
+        self.killed = False
+        self.stderr_tail = deque(maxlen=20)
+        try:
+            self.proc = subprocess.Popen(
+                live_transcode_command(input_path, self.audio_only),
+                stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+            )
+        except OSError:
+            self._out.close()
+            os.remove(self.tmp_path)
+            raise
+
+    def kill(self):
+        self.killed = True
+        if self.proc.poll() is None:
+            self.proc.kill()
+
+
+class LiveTranscoder:
+    """Pipes ffmpeg's low-bitrate output to HTTP clients while it is produced.
+
+    ffmpeg writes fragmented MP4 (MP3 for audio) to stdout. A writer thread
+    appends it to a temporary file that every client streams from its own
+    position, so clients joining later share the encoder and still start
+    at byte 0. A finished encode is remuxed into a regular (seekable) MP4
+    and becomes the cached `.low` file. When the last client disconnects,
+    the encoder is killed after LIVE_LINGER_SECONDS and its output dropped.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._encoders = {}  # output_path -> _LiveEncoder
+
+    def open(self, media_id: int, input_path: str, output_path: str):
+        """Attach to the encoder for `output_path`, starting one if needed.
+
+        Returns (encoder, reader); pass both to stream(). Raises
+        EncoderLimitReached when a new encoder would exceed LIVE_MAX_ENCODERS.
+        """
+        with self._lock:
+            encoder = self._encoders.get(output_path)
+            if encoder is None or encoder.killed:
+                if self._running() >= LIVE_MAX_ENCODERS:
+                    raise EncoderLimitReached(f"{LIVE_MAX_ENCODERS} live encoders are already running")
+                encoder = _LiveEncoder(media_id, input_path, output_path)
+                self._encoders[output_path] = encoder
+                threading.Thread(target=self._pump, args=(encoder,), name=f"live-{media_id}", daemon=True).start()
+            encoder.clients += 1
+            # Opened under the lock so finishing cannot unlink the file first
+            reader = open(encoder.tmp_path, "rb")
+        return encoder, reader
+
+    def can_open(self, output_path: str):
+        """Whether open() would attach to or start an encoder for `output_path` right now."""
+        with self._lock:
+            encoder = self._encoders.get(output_path)
+            return (encoder is not None and not encoder.killed) or self._running() < LIVE_MAX_ENCODERS
+
+    async def stream(self, encoder: _LiveEncoder, reader):
+        """Yield the encoder's output from the start until it finishes or the client goes away."""
+        try:
+            while True:
+                chunk = await run_in_threadpool(reader.read, READ_CHUNK_SIZE)
+                if chunk:
+                    yield chunk
+                elif encoder.eof:
+                    return
+                else:
+                    await asyncio.sleep(POLL_SECONDS)
+        finally:
+            reader.close()
+            self._detach(encoder)
+
+    def stop(self, media_id: int = None):
+        with self._lock:
+            encoders = [e for e in self._encoders.values() if media_id is None or e.media_id == media_id]
+        for encoder in encoders:
+            encoder.kill()
+
+    def active(self):
+        with self._lock:
+            return len(self._encoders)
+
+    def _running(self):
+        # Killed encoders stay registered until their process has exited
+        return sum(1 for encoder in self._encoders.values() if not encoder.killed)
+
+    def _detach(self, encoder: _LiveEncoder):
+        with self._lock:
+            encoder.clients -= 1
+            if encoder.clients > 0 or encoder.eof:
+                return
+        timer = threading.Timer(LIVE_LINGER_SECONDS, self._reap, args=(encoder,))
+        timer.daemon = True
+        timer.start()
+
+    def _reap(self, encoder: _LiveEncoder):
+        with self._lock:
+            if encoder.clients == 0 and not encoder.eof:
+                encoder.kill()
+
+    def _pump(self, encoder: _LiveEncoder):
+        drain = threading.Thread(target=encoder.stderr_tail.extend, args=(encoder.proc.stderr,), daemon=True)
+        drain.start()
+        try:
+            while True:
+                chunk = encoder.proc.stdout.read1(READ_CHUNK_SIZE)
+                if not chunk:
+                    break
+                encoder._out.write(chunk)
+                encoder._out.flush()
+        finally:
+            encoder._out.close()
+            encoder.proc.wait()
+            drain.join()
+        if encoder.proc.returncode == 0 and not encoder.killed:
+            try:
+                self._finish(encoder)
+            except Exception:
+                pass  # Nothing cached; the next request encodes again
+        with self._lock:
+            encoder.eof = True
+            if self._encoders.get(encoder.output_path) is encoder:
+                del self._encoders[encoder.output_path]
+            # Clients still streaming keep their open descriptors
+            if os.path.exists(encoder.tmp_path):
+                os.remove(encoder.tmp_path)
+
+    def _finish(self, encoder: _LiveEncoder):
+        """Turn the streamed output into the cached `.low` file."""
+        root, ext = os.path.splitext(encoder.output_path)
+        final_tmp = f"{root}.remux.part{ext}"
+        if os.path.exists(final_tmp):
+            os.remove(final_tmp)
+        if encoder.audio_only:
+            # MP3 needs no index; keep the streamed bytes under the final name
+            os.link(encoder.tmp_path, final_tmp)
+        else:
+            # Fragmented MP4 seeks poorly; a copy with a regular moov index is cheap
+            remux_media(encoder.tmp_path, final_tmp)
+        os.replace(final_tmp, encoder.output_path)
+        db = SessionLocal()
+        try:
+            derivative_cache.register(db, encoder.media_id, "low", encoder.output_path)
+            derivative_cache.evict_if_needed(db)
+        finally:
+            db.close()
+
+
+live_transcoder = LiveTranscoder()
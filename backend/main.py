@@ -1,6 +1,19 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from backend.api import users, media
+from backend.api import users, media, metrics as metrics_api
+from backend.scheduler import transcode_scheduler
+from backend.hls_ondemand import hls_on_demand
+from backend.cache import derivative_cache
+from backend.audit import audit_sink, audit_retention
+from backend.utils.images import image_renderer
+from backend.live import live_transcoder
+from backend.downloads import download_manager
+from backend.uploads import upload_sessions
+from backend.database import engine, SessionLocal
+from backend.migrations import apply_migrations
+from backend.crud.search import ensure_search_index
+from backend.metrics import MetricsMiddleware, instrument_database, TRANSCODE_QUEUE_DEPTH, LIVE_ENCODERS
+from backend.profiler import profiler, PROFILER_ENABLED
 
 app = FastAPI()
 
@@ -11,7 +24,46 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
+# Added last so it wraps everything, CORS included
+app.add_middleware(MetricsMiddleware)
 
 app.include_router(users.router)
-app.include_router(media.router) 
\ No newline at end of file
+app.include_router(media.router)
+app.include_router(metrics_api.router)
+
+# Metrics read from the running services at scrape time
+instrument_database(engine, SessionLocal)
+TRANSCODE_QUEUE_DEPTH.set_function(transcode_scheduler.queue_depth)
+LIVE_ENCODERS.labels("low").set_function(live_transcoder.active)
+LIVE_ENCODERS.labels("hls").set_function(hls_on_demand.active)
+
+@app.on_event("startup")
+def upgrade_schema():
+    apply_migrations(engine)
+    ensure_search_index(engine)
+
+@app.on_event("startup")
+def start_background_workers():
+    audit_sink.start()
+    audit_retention.start()
+    derivative_cache.start()
+    transcode_scheduler.start()
+    download_manager.start()
+    upload_sessions.start()
+    if PROFILER_ENABLED:
+        profiler.start()
+
+@app.on_event("shutdown")
+def stop_background_workers():
+    profiler.stop()
+    upload_sessions.stop()
+    download_manager.stop()
+    transcode_scheduler.stop()
+    hls_on_demand.stop()
+    live_transcoder.stop()
+    image_renderer.stop()
+    derivative_cache.stop()
+    audit_retention.stop()
+    audit_sink.stop()
\ No newline at end of file
@@ -0,0 +1,139 @@
+import os
+import time
+from prometheus_client import Counter, Gauge, Histogram, CONTENT_TYPE_LATEST, generate_latest
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import sessionmaker
+
+# Set to require "Authorization: Bearer <token>" on /metrics
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "Time from request start until response headers are sent",
+    ["method", "route", "status"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+)
+REQUESTS_IN_PROGRESS = Gauge("http_requests_in_progress", "Requests being handled or streamed")
+BYTES_SERVED = Counter(
+    "media_bytes_served_total",
+    "Response body bytes sent by the media delivery endpoints (excludes proxy-offloaded bodies)",
+    ["route"]
+)
+
+TRANSCODE_QUEUE_DEPTH = Gauge("transcode_queue_depth", "Transcode jobs waiting for a worker in this process")
+TRANSCODES_RUNNING = Gauge("transcode_jobs_running", "Transcode jobs currently running in this process")
+TRANSCODE_DURATION = Histogram(
+    "transcode_duration_seconds",
+    "Wall time of finished transcode jobs",
+    ["preset", "state"],
+    buckets=(1, 5, 15, 30, 60, 120, 300, 600, 1200, 1800, 3600, 7200)
+)
+TRANSCODE_FAILURES = Counter("transcode_failures_total", "Failed transcode jobs", ["preset"])
+LIVE_ENCODERS = Gauge("live_encoders", "ffmpeg processes serving requests directly", ["kind"])
+
+DB_QUERY_DURATION = Histogram(
+    "db_query_duration_seconds",
+    "SQL statement execution time",
+    ["operation"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+)
+DB_TRANSACTION_DURATION = Histogram(
+    "db_transaction_duration_seconds",
+    "Time from the start of an ORM transaction to its commit or rollback",
+    ["outcome"],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5)
+)
+
+# Routes whose body bytes are counted in media_bytes_served_total
+BYTE_COUNTED_ROUTES = (
+    "/media/stream/{media_id}",
+    "/media/hls/{media_id}/{filename}",
+    "/media/hls/{media_id}/{variant}/{filename}",
+)
+_SQL_OPERATIONS = ("SELECT", "INSERT", "UPDATE", "DELETE")
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording per-route latency and bytes served.
+
+    Latency is measured to the start of the response, so long-running
+    streams do not distort it. The route label is the path template
+    (`/media/stream/{media_id}`), never the raw path.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        state = {"status": "500", "observed": False}
+
+        def observe():
+            if not state["observed"]:
+                state["observed"] = True
+                route = scope.get("route")
+                REQUEST_LATENCY.labels(
+                    scope["method"], route.path if route is not None else "unmatched", state["status"]
+                ).observe(time.perf_counter() - started)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                state["status"] = str(message["status"])
+                observe()
+            elif message["type"] == "http.response.body":
+                route = scope.get("route")
+                body = message.get("body")
+                if body and state["status"][0] == "2" and route is not None and route.path in BYTE_COUNTED_ROUTES:
+                    BYTES_SERVED.labels(route.path).inc(len(body))
+            await send(message)
+
+        REQUESTS_IN_PROGRESS.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            observe()
+            REQUESTS_IN_PROGRESS.dec()
+
+
+def instrument_database(engine: Engine, session_factory: sessionmaker):
+    """Time every SQL statement and ORM transaction."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_execute(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["query_started"].pop()
+        operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "OTHER"
+        DB_QUERY_DURATION.labels(operation if operation in _SQL_OPERATIONS else "OTHER").observe(time.perf_counter() - started)
+
+    @event.listens_for(engine, "handle_error")
+    def _on_error(context):
+        # after_cursor_execute does not run for failed statements
+        started = context.connection.info.get("query_started") if context.connection is not None else None
+        if started:
+            started.pop()
+
+    @event.listens_for(session_factory, "after_begin")
+    def _after_begin(session, transaction, connection):
+        session.info.setdefault("transaction_started", time.perf_counter())
+
+    def _finished(outcome):
+        def listener(session):
+            started = session.info.pop("transaction_started", None)
+            if started is not None:
+                DB_TRANSACTION_DURATION.labels(outcome).observe(time.perf_counter() - started)
+        return listener
+
+    event.listen(session_factory, "after_commit", _finished("commit"))
+    event.listen(session_factory, "after_rollback", _finished("rollback"))
+
+
+def render_metrics():
+    """Return (body, content type) in the Prometheus text exposition format."""
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -0,0 +1,56 @@
+"""Schema changes for databases created by an older version.
+
+`Base.metadata.create_all` only creates missing tables, so columns added to
+existing tables are applied here. Each step checks the live schema first and
+is safe to run repeatedly.
+"""
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Engine
+
+# (table, column, DDL type) added after the table was first released
+ADDED_COLUMNS = [
+    ("media", "container", "VARCHAR"),
+    ("media", "video_codec", "VARCHAR"),
+    ("media", "audio_codec", "VARCHAR"),
+    ("media", "duration", "FLOAT"),
+    ("media", "width", "INTEGER"),
+    ("media", "height", "INTEGER"),
+    ("media", "bitrate", "INTEGER"),
+    ("media", "probed_at", "DATETIME"),
+    ("media", "blob_id", "INTEGER"),
+]
+
+# (index name, table, columns) for indexes added after their table was first released
+ADDED_INDEXES = [
+    ("ix_media_blob_id", "media", ("blob_id",)),
+    ("ix_media_genre_id", "media", ("genre_id",)),
+    ("ix_media_uploader_id", "media", ("uploader_id",)),
+    ("ix_media_tag_media_id_tag_id", "media_tag", ("media_id", "tag_id")),
+    ("ix_media_tag_tag_id_media_id", "media_tag", ("tag_id", "media_id")),
+    ("ix_audit_log_timestamp_username_action", "audit_log", ("timestamp", "username", "action")),
+    ("ix_audit_log_username_timestamp", "audit_log", ("username", "timestamp")),
+    ("ix_audit_log_action_timestamp", "audit_log", ("action", "timestamp")),
+]
+
+
+def apply_migrations(engine: Engine):
+    """Add missing columns and their indexes; returns the list of "table.column" names added."""
+    inspector = inspect(engine)
+    tables = set(inspector.get_table_names())
+    existing = {}
+    added = []
+    with engine.begin() as conn:
+        for table, column, ddl_type in ADDED_COLUMNS:
+            if table not in tables:
+                continue  # create_all will create it with every column
+            if table not in existing:
+                existing[table] = {c["name"] for c in inspector.get_columns(table)}
+            if column in existing[table]:
+                continue
+            conn.execute(text(f'ALTER TABLE "{table}" ADD COLUMN {column} {ddl_type}'))
+            existing[table].add(column)
+            added.append(f"{table}.{column}")
+        for name, table, columns in ADDED_INDEXES:
+            if table in tables:
+                conn.execute(text(f'CREATE INDEX IF NOT EXISTS {name} ON "{table}" ({", ".join(columns)})'))
+    return added
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, Table, DateTime
+from sqlalchemy import Column, Integer, String, ForeignKey, Table, DateTime, Float, Index
 from sqlalchemy.orm import relationship, declarative_base
 from datetime import datetime
 
@@ -8,7 +8,10 @@ Base = declarative_base()
 media_tag = Table(
     'media_tag', Base.metadata,
     Column('media_id', Integer, ForeignKey('media.id')),
-    Column('tag_id', Integer, ForeignKey('tag.id'))
+    Column('tag_id', Integer, ForeignKey('tag.id')),
+    # Tags of a page of media, and media carrying a tag
+    Index('ix_media_tag_media_id_tag_id', 'media_id', 'tag_id'),
+    Index('ix_media_tag_tag_id_media_id', 'tag_id', 'media_id')
 )
 
 class User(Base):
@@ -36,10 +39,31 @@ class Media(Base):
     id = Column(Integer, primary_key=True, index=True)
     filename = Column(String, unique=True)
     filepath = Column(String)
-    genre_id = Column(Integer, ForeignKey('genre.id'))
+    genre_id = Column(Integer, ForeignKey('genre.id'), index=True)
     genre = relationship('Genre', back_populates='media')
     tags = relationship('Tag', secondary=media_tag, back_populates='media')
-    uploader_id = Column(Integer, ForeignKey('user.id')) 
+    uploader_id = Column(Integer, ForeignKey('user.id'), index=True)
+    # Uploads and downloads live in the content-addressed store; null for files registered in place
+    blob_id = Column(Integer, ForeignKey('blob.id'), nullable=True, index=True)
+    blob = relationship('Blob')
+    # Filled in by ffprobe (see set_media_info); null until the file has been probed
+    container = Column(String, nullable=True)
+    video_codec = Column(String, nullable=True)
+    audio_codec = Column(String, nullable=True)
+    duration = Column(Float, nullable=True)  # seconds
+    width = Column(Integer, nullable=True)
+    height = Column(Integer, nullable=True)
+    bitrate = Column(Integer, nullable=True)  # bits per second
+    probed_at = Column(DateTime, nullable=True)
+
+class Blob(Base):
+    __tablename__ = 'blob'
+    id = Column(Integer, primary_key=True, index=True)
+    sha256 = Column(String, unique=True, index=True)
+    path = Column(String)  # MEDIA_ROOT/.blobs/ab/cd/<sha256><ext>
+    size = Column(Integer)
+    refcount = Column(Integer, default=0)  # media rows pointing at this blob
+    created_at = Column(DateTime, default=datetime.utcnow)
 
 class AuditLog(Base):
     __tablename__ = 'audit_log'
@@ -50,4 +74,97 @@ class AuditLog(Base):
     target_type = Column(String)
     target_id = Column(Integer, nullable=True)
     timestamp = Column(DateTime, default=datetime.utcnow)
-    details = Column(String, nullable=True) 
\ No newline at end of file
+    details = Column(String, nullable=True)
+    __table_args__ = (
+        # Newest-first pages (keyset on timestamp, id) with the admin filters checked from the index
+        Index('ix_audit_log_timestamp_username_action', 'timestamp', 'username', 'action'),
+        Index('ix_audit_log_username_timestamp', 'username', 'timestamp'),
+        Index('ix_audit_log_action_timestamp', 'action', 'timestamp'),
+    )
+
+class TranscodeJob(Base):
+    __tablename__ = 'transcode_job'
+    id = Column(Integer, primary_key=True, index=True)
+    media_id = Column(Integer, ForeignKey('media.id'), index=True)
+    preset = Column(String)  # 'hls', 'low' or 'preview'
+    state = Column(String, default='queued', index=True)  # 'queued', 'running', 'done', 'failed' or 'cancelled'
+    priority = Column(Integer, default=10)  # lower runs first
+    progress = Column(Float, default=0.0)  # 0.0-1.0
+    input_path = Column(String)
+    output_path = Column(String)
+    error = Column(String, nullable=True)
+    pid = Column(Integer, nullable=True)  # server process running the job
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    __table_args__ = (
+        # At most one queued/running job per (media, preset)
+        Index('ix_transcode_job_active', 'media_id', 'preset', unique=True,
+              sqlite_where=state.in_(['queued', 'running']),
+              postgresql_where=state.in_(['queued', 'running'])),
+    )
+
+class CacheEntry(Base):
+    __tablename__ = 'cache_entry'
+    id = Column(Integer, primary_key=True, index=True)
+    media_id = Column(Integer, ForeignKey('media.id'), index=True)
+    kind = Column(String)  # 'hls' (hls_<key> directory), 'low' (low-bitrate file), 'preview' (preview_<key> directory) or 'image' (resized photo); see storage.derivative_key
+    path = Column(String, unique=True)
+    size_bytes = Column(Integer, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    last_access = Column(DateTime, default=datetime.utcnow, index=True)
+
+class ScanEntry(Base):
+    __tablename__ = 'scan_entry'
+    id = Column(Integer, primary_key=True, index=True)
+    path = Column(String, unique=True)
+    inode = Column(Integer)
+    size = Column(Integer)
+    mtime_ns = Column(Integer)
+    media_id = Column(Integer, ForeignKey('media.id'), nullable=True)
+    scanned_at = Column(DateTime, default=datetime.utcnow)
+
+class DownloadJob(Base):
+    __tablename__ = 'download_job'
+    id = Column(Integer, primary_key=True, index=True)
+    url = Column(String)
+    format = Column(String, default='best')  # yt-dlp -f selector
+    genre = Column(String, nullable=True)
+    tags = Column(String, nullable=True)  # comma-separated
+    user_id = Column(Integer, ForeignKey('user.id'))
+    state = Column(String, default='queued', index=True)  # 'queued', 'running', 'done' or 'failed'
+    progress = Column(Float, default=0.0)  # 0.0-1.0
+    downloaded_bytes = Column(Integer, nullable=True)
+    total_bytes = Column(Integer, nullable=True)
+    filepath = Column(String, nullable=True)  # final file reported by yt-dlp
+    media_id = Column(Integer, ForeignKey('media.id'), nullable=True)
+    transcode_job_id = Column(Integer, ForeignKey('transcode_job.id'), nullable=True)
+    error = Column(String, nullable=True)
+    pid = Column(Integer, nullable=True)  # server process running the job
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+class UploadSession(Base):
+    __tablename__ = 'upload_session'
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey('user.id'), index=True)
+    filename = Column(String)
+    size = Column(Integer)  # final size in bytes, declared up front
+    sha256 = Column(String, nullable=True)  # optional whole-file hash checked on completion
+    genre = Column(String, nullable=True)
+    tags = Column(String, nullable=True)  # comma-separated
+    path = Column(String)  # sparse file under MEDIA_ROOT/.blobs/incoming
+    state = Column(String, default='open')  # 'open' or 'completing'
+    pid = Column(Integer, nullable=True)  # server process completing it
+    created_at = Column(DateTime, default=datetime.utcnow)
+    expires_at = Column(DateTime, index=True)  # pushed back by every chunk
+
+class UploadChunk(Base):
+    __tablename__ = 'upload_chunk'
+    id = Column(Integer, primary_key=True, index=True)
+    session_id = Column(Integer, ForeignKey('upload_session.id'), index=True)
+    offset = Column(Integer)
+    length = Column(Integer)
+    state = Column(String, default='writing')  # 'writing' or 'received' (checksum verified)
+    pid = Column(Integer, nullable=True)  # server process writing it
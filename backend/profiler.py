@@ -0,0 +1,83 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+# Start sampling at boot; it can also be toggled at runtime through /admin/profiler
+PROFILER_ENABLED = os.getenv("PROFILER_ENABLED", "0") == "1"
+PROFILER_INTERVAL = float(os.getenv("PROFILER_INTERVAL", "0.01"))  # seconds between samples
+PROFILER_MAX_DEPTH = 64
+
+
+class SamplingProfiler:
+    """Periodically records the Python stack of every thread.
+
+    Sampling is cheap enough to leave on in production for a while; results
+    are aggregated in the "collapsed stack" format that flame graph tools
+    (flamegraph.pl, speedscope) read directly.
+    """
+
+    def __init__(self, interval: float = PROFILER_INTERVAL):
+        self.interval = interval
+        self._stacks = Counter()
+        self._samples = 0
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stopping = threading.Event()
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._sample_loop, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stopping.set()
+        self._thread.join()
+        self._thread = None
+
+    def reset(self):
+        with self._lock:
+            self._stacks.clear()
+            self._samples = 0
+
+    def collapsed(self):
+        """One "thread;outer;...;inner count" line per distinct stack, most frequent first."""
+        with self._lock:
+            return "".join(f"{stack} {count}\n" for stack, count in self._stacks.most_common())
+
+    def stats(self):
+        with self._lock:
+            return {"running": self.running, "interval": self.interval, "samples": self._samples, "stacks": len(self._stacks)}
+
+    def _sample_loop(self):
+        own_id = threading.get_ident()
+        while not self._stopping.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            frames = sys._current_frames()
+            sampled = []
+            for thread_id, frame in frames.items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < PROFILER_MAX_DEPTH:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                sampled.append(";".join(reversed(stack)))
+            del frames
+            with self._lock:
+                self._samples += 1
+                self._stacks.update(sampled)
+
+
+profiler = SamplingProfiler()
@@ -0,0 +1,24 @@
+"""Rebuild the full-text search index from the media catalog.
+
+    python -m backend.reindex
+
+Only needed after editing the database by hand; the API and the library
+scanner keep the index up to date.
+"""
+import time
+from backend.database import SessionLocal
+from backend.crud.search import rebuild_search_index
+
+
+def main():
+    started = time.monotonic()
+    db = SessionLocal()
+    try:
+        indexed = rebuild_search_index(db)
+    finally:
+        db.close()
+    print(f"Indexed {indexed} media items in {time.monotonic() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+"""Incremental library scanner for media already stored under MEDIA_ROOT.
+
+    python -m backend.scan [--root DIR] [--workers N] [--interval SECONDS] [--no-transcode]
+
+Every file's (path, inode, size, mtime) is kept in the `scan_entry` table, so a
+re-scan only touches the catalog for files that are new or changed. A changed
+file is probed again and its derivatives are rebuilt.
+"""
+import os
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from sqlalchemy.orm import Session
+from backend.database import SessionLocal
+from backend.models import Media, ScanEntry
+from backend.cache import derivative_cache
+from backend.crud.jobs import cancel_active_jobs
+from backend.crud.media import create_media_bulk, clear_media_info, MEDIA_TYPE_EXTENSIONS
+from backend.scheduler import transcode_scheduler, PRIORITY_BULK
+from backend.storage import media_key
+from backend.utils.file import MEDIA_ROOT
+
+SCAN_WORKERS = int(os.getenv("SCAN_WORKERS", "8"))
+SCAN_BATCH_SIZE = 500
+
+MEDIA_EXTENSIONS = tuple(ext for exts in MEDIA_TYPE_EXTENSIONS.values() for ext in exts)
+VIDEO_EXTENSIONS = tuple(MEDIA_TYPE_EXTENSIONS["video"])
+# Files written by the server itself: transcodes and in-progress uploads
+DERIVED_SUFFIXES = (".low.mp4", ".low.mp3", ".part", ".tmp")
+
+
+def _is_media_file(name: str):
+    lower = name.lower()
+    if name.startswith(".") or lower.endswith(DERIVED_SUFFIXES) or ".part." in lower:
+        return False
+    return lower.endswith(MEDIA_EXTENSIONS)
+
+def _scan_dir(path: str):
+    """List one directory: returns ([(path, inode, size, mtime_ns)], [subdirs])."""
+    files, subdirs = [], []
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        # Skip HLS/preview output directories and hidden directories
+                        if not entry.name.startswith((".", "hls_", "preview_")):
+                            subdirs.append(entry.path)
+                    elif entry.is_file() and _is_media_file(entry.name):
+                        st = entry.stat()
+                        files.append((entry.path, st.st_ino, st.st_size, st.st_mtime_ns))
+                except OSError:
+                    continue
+    except OSError:
+        pass
+    return files, subdirs
+
+def walk_parallel(root: str, workers: int = SCAN_WORKERS):
+    """Walk a directory tree with a pool of threads; yields (path, inode, size, mtime_ns)."""
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = {pool.submit(_scan_dir, root)}
+        while pending:
+            future = pending.pop()
+            files, subdirs = future.result()
+            pending.update(pool.submit(_scan_dir, d) for d in subdirs)
+            yield from files
+
+
+def scan_library(db: Session, root: str = MEDIA_ROOT, workers: int = SCAN_WORKERS, queue_transcodes: bool = True):
+    """Sync the catalog with the files under `root` and return counts of what changed.
+
+    Only index entries under `root` are compared, so scanning a subdirectory
+    never treats the rest of the library as missing.
+    """
+    index = {
+        path: (entry_id, inode, size, mtime_ns, media_id)
+        for entry_id, path, inode, size, mtime_ns, media_id in db.query(
+            ScanEntry.id, ScanEntry.path, ScanEntry.inode, ScanEntry.size, ScanEntry.mtime_ns, ScanEntry.media_id
+        ).filter(ScanEntry.path.startswith(os.path.join(root, ""), autoescape=True))
+    }
+    stats = {"seen": 0, "unchanged": 0, "changed": 0, "added": 0, "linked": 0, "missing": 0, "transcodes_queued": 0}
+    seen = set()
+    new_files = []
+    for path, inode, size, mtime_ns in walk_parallel(root, workers):
+        stats["seen"] += 1
+        seen.add(path)
+        known = index.get(path)
+        if known is None:
+            new_files.append((path, inode, size, mtime_ns))
+            if len(new_files) >= SCAN_BATCH_SIZE:
+                _add_batch(db, root, new_files, stats, queue_transcodes)
+                new_files = []
+        elif known[1:4] != (inode, size, mtime_ns):
+            db.query(ScanEntry).filter(ScanEntry.id == known[0]).update({
+                ScanEntry.inode: inode, ScanEntry.size: size, ScanEntry.mtime_ns: mtime_ns,
+                ScanEntry.scanned_at: datetime.utcnow()
+            }, synchronize_session=False)
+            if known[4] is not None:
+                _invalidate(db, known[4], path, stats, queue_transcodes)
+            stats["changed"] += 1
+        else:
+            stats["unchanged"] += 1
+    if new_files:
+        _add_batch(db, root, new_files, stats, queue_transcodes)
+    # Files that disappeared only leave the index; their catalog rows are kept in
+    # case the share is temporarily unmounted.
+    missing = [entry[0] for path, entry in index.items() if path not in seen]
+    for start in range(0, len(missing), SCAN_BATCH_SIZE):
+        db.query(ScanEntry).filter(ScanEntry.id.in_(missing[start:start + SCAN_BATCH_SIZE])).delete(synchronize_session=False)
+    stats["missing"] = len(missing)
+    db.commit()
+    return stats
+
+def _invalidate(db: Session, media_id: int, path: str, stats: dict, queue_transcodes: bool):
+    """Drop the probe results and derivatives of a file whose content changed, and queue new ones."""
+    key = media_key(db, media_id)
+    if key is None:
+        return
+    # Jobs already running on the old content stop at their next progress report
+    cancel_active_jobs(db, media_id, "Source file changed")
+    clear_media_info(db, media_id)
+    derivative_cache.remove_media(db, media_id, key, path)
+    if queue_transcodes and path.lower().endswith(VIDEO_EXTENSIONS):
+        transcode_scheduler.queue_video_derivatives(db, media_id, path, key, priority=PRIORITY_BULK)
+        stats["transcodes_queued"] += 1
+
+def _add_batch(db: Session, root: str, files: list, stats: dict, queue_transcodes: bool):
+    paths = [f[0] for f in files]
+    # Files already in the catalog (e.g. uploaded through the API) are only indexed
+    existing = dict(db.query(Media.filepath, Media.id).filter(Media.filepath.in_(paths)))
+    new_items = [
+        {"filename": os.path.relpath(path, root), "filepath": path}
+        for path in paths if path not in existing
+    ]
+    taken = {name for (name,) in db.query(Media.filename).filter(Media.filename.in_([i["filename"] for i in new_items]))}
+    new_items = [item for item in new_items if item["filename"] not in taken]
+    media_ids = dict(zip([i["filepath"] for i in new_items], create_media_bulk(db, new_items))) if new_items else {}
+    for path, inode, size, mtime_ns in files:
+        db.add(ScanEntry(path=path, inode=inode, size=size, mtime_ns=mtime_ns,
+                         media_id=media_ids.get(path) or existing.get(path)))
+    db.commit()
+    stats["added"] += len(media_ids)
+    stats["linked"] += sum(1 for path in paths if path in existing)
+    if queue_transcodes:
+        for path, media_id in media_ids.items():
+            if path.lower().endswith(VIDEO_EXTENSIONS):
+                transcode_scheduler.queue_video_derivatives(db, media_id, path, media_id, priority=PRIORITY_BULK)
+                stats["transcodes_queued"] += 1
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Scan MEDIA_ROOT and add new media to the catalog.")
+    parser.add_argument("--root", default=MEDIA_ROOT, help="Directory to scan (default: MEDIA_ROOT)")
+    parser.add_argument("--workers", type=int, default=SCAN_WORKERS, help="Parallel directory walkers")
+    parser.add_argument("--interval", type=int, default=0, help="Re-scan every N seconds instead of exiting")
+    parser.add_argument("--no-transcode", action="store_true", help="Do not queue HLS transcodes and previews for new videos")
+    args = parser.parse_args(argv)
+    while True:
+        started = time.monotonic()
+        db = SessionLocal()
+        try:
+            stats = scan_library(db, args.root, args.workers, queue_transcodes=not args.no_transcode)
+        finally:
+            db.close()
+        print(f"Scanned {args.root} in {time.monotonic() - started:.1f}s: {stats}")
+        if not args.interval:
+            break
+        time.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    main()
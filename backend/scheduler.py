@@ -0,0 +1,344 @@
+import os
+import heapq
+import itertools
+import threading
+import time
+import subprocess
+from datetime import datetime
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from backend.database import SessionLocal
+from backend.models import TranscodeJob, Media
+from backend.cache import derivative_cache, hls_path, preview_path
+from backend.metrics import TRANSCODES_RUNNING, TRANSCODE_DURATION, TRANSCODE_FAILURES
+from backend.crud.jobs import create_job, get_active_job, get_active_job_for_output, get_latest_job, list_unfinished_jobs
+from backend.crud.media import set_media_info
+from backend.utils.previews import generate_previews
+from backend.utils.transcoding import (
+    transcode_to_hls, transcode_media, remux_media, probe_media, hls_copy_compatible, hls_output_complete, track_processes
+)
+
+# Number of concurrent ffmpeg processes per server process; defaults to the core count
+TRANSCODE_WORKERS = int(os.getenv("TRANSCODE_WORKERS", "0")) or os.cpu_count() or 1
+# Minimum seconds between progress writes to the job table
+PROGRESS_INTERVAL = 1.0
+# How often to pick up jobs queued by other processes (e.g. the library scanner)
+JOB_POLL_SECONDS = int(os.getenv("JOB_POLL_SECONDS", "10"))
+
+# Times submit() looks up/creates a job when other processes keep winning the insert
+SUBMIT_ATTEMPTS = 3
+
+# Lower values run first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 10
+
+# Sources at or below these are already "low" and only need a remux
+LOW_VIDEO_MAX_HEIGHT = 240
+LOW_VIDEO_MAX_BITRATE = 700_000
+LOW_AUDIO_MAX_BITRATE = 80_000
+
+
+def _run_hls(job, info, on_progress):
+    transcode_to_hls(job.input_path, job.output_path, on_progress=on_progress, info=info)
+
+def _low_needs_encode(info, ext):
+    bitrate = info.get("bitrate")
+    if not bitrate:
+        return True
+    if ext == ".mp3":
+        return info.get("audio_codec") != "mp3" or info.get("video_codec") or bitrate > LOW_AUDIO_MAX_BITRATE
+    copy_video, copy_audio = hls_copy_compatible(info)
+    return (
+        not copy_video or (info.get("has_audio") and not copy_audio)
+        or (info.get("height") or 0) > LOW_VIDEO_MAX_HEIGHT or bitrate > LOW_VIDEO_MAX_BITRATE
+    )
+
+def _run_low(job, info, on_progress):
+    # Encode to a temp name so the stream endpoint never serves a half-written file.
+    # Unique per job: a cancelled job still shutting down must not share it with its replacement.
+    root, ext = os.path.splitext(job.output_path)
+    tmp_path = f"{root}.part.{job.id}{ext}"
+    try:
+        if not _low_needs_encode(info, ext):
+            remux_media(job.input_path, tmp_path, on_progress=on_progress)
+        elif ext == ".mp3":
+            transcode_media(job.input_path, tmp_path, bitrate="64k", resolution=None, on_progress=on_progress)
+        else:
+            transcode_media(job.input_path, tmp_path, bitrate="500k", resolution="426x240", on_progress=on_progress)
+        os.replace(tmp_path, job.output_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def _run_preview(job, info, on_progress):
+    generate_previews(job.input_path, job.output_path, info, on_progress=on_progress)
+
+PRESETS = {
+    "hls": _run_hls,
+    "low": _run_low,
+    "preview": _run_preview,
+}
+
+
+class JobCancelled(Exception):
+    pass
+
+
+def _pid_alive(pid):
+    if not pid or pid == os.getpid():
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class TranscodeScheduler:
+    """Bounded worker pool running transcode jobs from a priority queue.
+
+    Jobs are persisted in the `transcode_job` table; the in-memory heap only
+    orders job ids. A job is claimed with a conditional UPDATE, so several
+    server processes can share the table without running a job twice.
+    """
+
+    def __init__(self, workers: int = TRANSCODE_WORKERS):
+        self.workers = workers
+        self._queue = []  # heap of (priority, seq, job_id)
+        self._known = set()  # job ids currently in the heap
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._submit_lock = threading.Lock()
+        self._threads = []
+        self._procs = {}  # job_id -> running ffmpeg Popen
+        self._stopping = False
+
+    def start(self):
+        """Requeue unfinished jobs from the database and start the workers."""
+        if self._threads:
+            return
+        self._stopping = False
+        db = SessionLocal()
+        try:
+            for job in list_unfinished_jobs(db):
+                if job.state == 'running':
+                    if _pid_alive(job.pid):
+                        continue
+                    # The process running it went away; start over
+                    job.state = 'queued'
+                    job.progress = 0.0
+                    job.pid = None
+                self._push(job.priority, job.id)
+            db.commit()
+        finally:
+            db.close()
+        for i in range(self.workers):
+            t = threading.Thread(target=self._worker, name=f"transcode-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+        poller = threading.Thread(target=self._poller, name="transcode-poller", daemon=True)
+        poller.start()
+        self._threads.append(poller)
+
+    def stop(self):
+        """Stop taking new work and kill running ffmpeg processes; their jobs are requeued on the next start."""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+            for proc in self._procs.values():
+                proc.kill()
+        self._threads = []
+
+    def queue_depth(self):
+        with self._cond:
+            return len(self._queue)
+
+    def submit(self, db: Session, media_id: int, preset: str, input_path: str, output_path: str, priority: int = PRIORITY_BULK):
+        """Queue a job, or return the queued/running job for the same (media, preset) or output.
+
+        When another server process keeps queueing the job first and it has
+        already finished by the time it is looked up, that finished job is
+        returned; the result is None only if no job for (media, preset) exists.
+        """
+        if preset not in PRESETS:
+            raise ValueError(f"Unknown transcode preset: {preset}")
+        with self._submit_lock:
+            job = None
+            for _ in range(SUBMIT_ATTEMPTS):
+                job = get_active_job(db, media_id, preset) or get_active_job_for_output(db, preset, output_path)
+                if job is not None:
+                    break
+                try:
+                    job = create_job(db, media_id, preset, input_path, output_path, priority)
+                except IntegrityError:
+                    # Another server process queued it first; look again
+                    db.rollback()
+                    continue
+                self._push(job.priority, job.id)
+                return job
+            if job is None:
+                return get_latest_job(db, media_id, preset)
+            if job.state == 'queued' and priority < job.priority:
+                job.priority = priority
+                db.commit()
+                db.refresh(job)
+                self._push(job.priority, job.id)
+            return job
+
+    def queue_video_derivatives(self, db: Session, media_id: int, input_path: str, key, priority: int = PRIORITY_BULK):
+        """Queue the HLS ladder and previews of a video unless they exist already.
+
+        `key` is the derivative key (see storage.derivative_key); duplicates of a
+        stored blob find its outputs done and queue nothing. Returns the HLS job
+        or None.
+        """
+        hls_dir = hls_path(key)
+        hls_job = None
+        if not hls_output_complete(hls_dir):
+            hls_job = self.submit(db, media_id, "hls", input_path, hls_dir, priority=priority)
+        if not os.path.isdir(preview_path(key)):
+            self.submit(db, media_id, "preview", input_path, preview_path(key), priority=priority)
+        return hls_job
+
+    def _push(self, priority, job_id):
+        with self._cond:
+            heapq.heappush(self._queue, (priority, next(self._seq), job_id))
+            self._known.add(job_id)
+            self._cond.notify()
+
+    def _next_job_id(self):
+        with self._cond:
+            while not self._queue and not self._stopping:
+                self._cond.wait()
+            if self._stopping:
+                return None
+            job_id = heapq.heappop(self._queue)[2]
+            self._known.discard(job_id)
+            return job_id
+
+    def _poller(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._stopping, timeout=JOB_POLL_SECONDS)
+                if self._stopping:
+                    return
+            db = SessionLocal()
+            try:
+                queued = db.query(TranscodeJob.id, TranscodeJob.priority).filter(TranscodeJob.state == 'queued').all()
+            except Exception:
+                queued = []
+            finally:
+                db.close()
+            for job_id, priority in queued:
+                if job_id not in self._known:
+                    self._push(priority, job_id)
+
+    def _claim(self, db: Session, job_id: int):
+        claimed = db.query(TranscodeJob).filter(
+            TranscodeJob.id == job_id,
+            TranscodeJob.state == 'queued'
+        ).update({
+            TranscodeJob.state: 'running',
+            TranscodeJob.pid: os.getpid(),
+            TranscodeJob.started_at: datetime.utcnow()
+        }, synchronize_session=False)
+        db.commit()
+        if not claimed:
+            # Stale heap entry (priority bump) or claimed by another process
+            return None
+        return db.query(TranscodeJob).filter(TranscodeJob.id == job_id).first()
+
+    def _worker(self):
+        while True:
+            job_id = self._next_job_id()
+            if job_id is None:
+                return
+            db = SessionLocal()
+            try:
+                job = self._claim(db, job_id)
+                if job is not None:
+                    self._run(db, job)
+            finally:
+                db.close()
+
+    def _run(self, db: Session, job: TranscodeJob):
+        last_write = [0.0]
+
+        def on_progress(progress):
+            now = time.monotonic()
+            if progress < 1.0 and now - last_write[0] < PROGRESS_INTERVAL:
+                return
+            last_write[0] = now
+            # Only while still 'running': a cancelled job (e.g. its source changed) stops here
+            updated = db.query(TranscodeJob).filter(
+                TranscodeJob.id == job.id, TranscodeJob.state == 'running'
+            ).update({TranscodeJob.progress: progress}, synchronize_session=False)
+            db.commit()
+            if not updated:
+                raise JobCancelled(f"Job {job.id} was cancelled")
+
+        def on_start(proc):
+            with self._cond:
+                self._procs[job.id] = proc
+                if self._stopping:
+                    proc.kill()
+
+        started = time.monotonic()
+        values = {}  # final state; stays empty when the job was cancelled
+        TRANSCODES_RUNNING.inc()
+        try:
+            info = probe_media(job.input_path) or {}
+            if info:
+                set_media_info(db, job.media_id, info)
+            with track_processes(on_start):
+                PRESETS[job.preset](job, info, on_progress)
+        except JobCancelled:
+            db.rollback()
+        except Exception as e:
+            db.rollback()
+            with self._cond:
+                killed = self._stopping and job.id in self._procs
+            if killed:
+                # Killed by stop(); leave it 'running' so the next start requeues it
+                return
+            values[TranscodeJob.state] = 'failed'
+            if isinstance(e, subprocess.CalledProcessError) and e.stderr:
+                values[TranscodeJob.error] = e.stderr[-2000:]
+            else:
+                values[TranscodeJob.error] = str(e) or e.__class__.__name__
+        else:
+            values[TranscodeJob.state] = 'done'
+            values[TranscodeJob.progress] = 1.0
+        finally:
+            TRANSCODES_RUNNING.dec()
+            with self._cond:
+                self._procs.pop(job.id, None)
+        finished_at = datetime.utcnow()
+        updated = 0
+        if values:
+            updated = db.query(TranscodeJob).filter(
+                TranscodeJob.id == job.id, TranscodeJob.state == 'running'
+            ).update({**values, TranscodeJob.finished_at: finished_at}, synchronize_session=False)
+        if not updated:
+            # Cancelled while running: keep its state and leave the output to the job replacing it
+            db.query(TranscodeJob).filter(TranscodeJob.id == job.id).update(
+                {TranscodeJob.finished_at: finished_at}, synchronize_session=False
+            )
+        db.commit()
+        db.refresh(job)
+        TRANSCODE_DURATION.labels(job.preset, job.state).observe(time.monotonic() - started)
+        if job.state == 'failed':
+            TRANSCODE_FAILURES.labels(job.preset).inc()
+        if job.state == 'done':
+            if db.query(Media.id).filter(Media.id == job.media_id).first() is None:
+                # Media was deleted while the job ran
+                derivative_cache.discard(db, job.output_path)
+                return
+            derivative_cache.register(db, job.media_id, job.preset, job.output_path)
+            derivative_cache.evict_if_needed(db)
+
+
+transcode_scheduler = TranscodeScheduler()
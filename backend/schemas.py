@@ -1,5 +1,6 @@
 from pydantic import BaseModel
 from typing import List, Optional
+from datetime import datetime
 
 class UserCreate(BaseModel):
     username: str
@@ -16,4 +17,48 @@ class MediaOut(BaseModel):
     genre: Optional[str] = None
     tags: List[str] = []
     class Config:
-        orm_mode = True 
\ No newline at end of file
+        orm_mode = True
+
+class MediaCreate(BaseModel):
+    filename: str
+    filepath: str
+    genre: Optional[str] = None
+    tags: List[str] = []
+
+class TranscodeJobOut(BaseModel):
+    id: int
+    media_id: int
+    preset: str
+    state: str
+    priority: int
+    progress: float
+    error: Optional[str] = None
+    created_at: Optional[datetime] = None
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    class Config:
+        orm_mode = True
+
+class DownloadJobOut(BaseModel):
+    id: int
+    url: str
+    state: str
+    progress: float
+    downloaded_bytes: Optional[int] = None
+    total_bytes: Optional[int] = None
+    media_id: Optional[int] = None
+    transcode_job_id: Optional[int] = None
+    error: Optional[str] = None
+    created_at: Optional[datetime] = None
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    class Config:
+        orm_mode = True
+
+class UploadSessionOut(BaseModel):
+    id: int
+    filename: str
+    size: int
+    received_bytes: int
+    ranges: List[List[int]] = []  # received [start, end) byte ranges
+    expires_at: Optional[datetime] = None
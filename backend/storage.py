@@ -0,0 +1,204 @@
+"""Content-addressed storage for uploaded and downloaded media.
+
+    python -m backend.storage migrate
+
+Files are stored once per SHA-256 under MEDIA_ROOT/.blobs/ab/cd/<sha256><ext>
+and shared by every media row with the same content through a reference
+count. Their derivatives are keyed by the hash (`hls_<sha256>`,
+`preview_<sha256>`, `<blob>.low.mp4`), so a duplicate upload reuses finished
+transcodes. Files registered in place (library scan, /media/bulk) have no
+blob and keep derivatives keyed by media id.
+
+`migrate` moves media stored the old way, directly in MEDIA_ROOT, into the
+store along with their derivatives. Run it while the server is stopped.
+"""
+import os
+import uuid
+import hashlib
+import argparse
+import threading
+from fastapi import UploadFile
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from backend.database import SessionLocal
+from backend.models import Blob, CacheEntry, Media, ScanEntry, TranscodeJob
+from backend.crud.jobs import ACTIVE_STATES
+from backend.cache import hls_path, preview_path, delete_path, LOW_SUFFIXES
+from backend.utils.file import MEDIA_ROOT, UPLOAD_CHUNK_SIZE, save_upload_file
+
+BLOB_DIR = os.path.join(MEDIA_ROOT, ".blobs")
+# Uploads are written here first, then renamed to their hash
+INCOMING_DIR = os.path.join(BLOB_DIR, "incoming")
+
+# Serializes reference changes with the file moves they imply (per process)
+_lock = threading.Lock()
+
+
+def blob_path(sha256: str, ext: str = ""):
+    return os.path.join(BLOB_DIR, sha256[:2], sha256[2:4], sha256 + ext.lower())
+
+def file_sha256(path: str):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def derivative_key(media: Media):
+    """Blob hash for content-addressed media, the media id for files registered in place."""
+    return media.blob.sha256 if media.blob_id is not None else media.id
+
+def media_key(db: Session, media_id: int):
+    """derivative_key for a media id without loading the row; None if it does not exist."""
+    row = db.query(Media.id, Blob.sha256).outerjoin(Blob, Media.blob_id == Blob.id).filter(Media.id == media_id).first()
+    if row is None:
+        return None
+    return row.sha256 or row.id
+
+
+def store_upload(db: Session, upload_file: UploadFile, filename: str):
+    """Save an upload into the store and take a reference to its blob.
+
+    Raises UploadTooLarge like save_upload_file.
+    """
+    staged = os.path.join(INCOMING_DIR, uuid.uuid4().hex)
+    size, sha256 = save_upload_file(upload_file, staged)
+    return _link(db, staged, sha256, size, os.path.splitext(filename)[1])
+
+def store_file(db: Session, path: str, ext: str = None, sha256: str = None):
+    """Move a file into the store (or drop it if the content is already there) and take a reference.
+
+    `ext` defaults to the file's own extension; pass `sha256` if it is already known.
+    """
+    if ext is None:
+        ext = os.path.splitext(path)[1]
+    return _link(db, path, sha256 or file_sha256(path), os.path.getsize(path), ext)
+
+def _link(db: Session, source: str, sha256: str, size: int, ext: str):
+    with _lock:
+        blob = _acquire(db, sha256)
+        if blob is not None:
+            os.remove(source)
+            return blob
+        path = blob_path(sha256, ext)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(source, path)
+        blob = Blob(sha256=sha256, path=path, size=size, refcount=1)
+        db.add(blob)
+        try:
+            db.commit()
+        except IntegrityError:
+            # Another process stored the same content first
+            db.rollback()
+            blob = _acquire(db, sha256)
+            if blob is None:
+                raise
+            if blob.path != path:
+                os.remove(path)
+        db.refresh(blob)
+        return blob
+
+def _acquire(db: Session, sha256: str):
+    updated = db.query(Blob).filter(Blob.sha256 == sha256).update(
+        {Blob.refcount: Blob.refcount + 1}, synchronize_session=False
+    )
+    db.commit()
+    return db.query(Blob).filter(Blob.sha256 == sha256).first() if updated else None
+
+def release_blob(db: Session, blob_id: int, media_id: int = None):
+    """Drop one reference; returns True when it was the last one and the file was deleted.
+
+    While other media still use the blob, jobs and cache entries of `media_id`
+    are handed over to one of them so the shared derivatives stay owned.
+    """
+    with _lock:
+        db.query(Blob).filter(Blob.id == blob_id).update({Blob.refcount: Blob.refcount - 1}, synchronize_session=False)
+        blob = db.query(Blob).filter(Blob.id == blob_id).first()
+        if blob is None:
+            db.commit()
+            return False
+        if blob.refcount > 0:
+            survivor = db.query(Media.id).filter(Media.blob_id == blob_id, Media.id != media_id).first()
+            if media_id is not None and survivor is not None:
+                db.query(TranscodeJob).filter(
+                    TranscodeJob.media_id == media_id, TranscodeJob.state.in_(ACTIVE_STATES)
+                ).update({TranscodeJob.media_id: survivor.id}, synchronize_session=False)
+                db.query(CacheEntry).filter(CacheEntry.media_id == media_id).update(
+                    {CacheEntry.media_id: survivor.id}, synchronize_session=False
+                )
+            db.commit()
+            return False
+        path = blob.path
+        db.delete(blob)
+        db.commit()
+        if os.path.exists(path):
+            os.remove(path)
+        return True
+
+
+def _move(db: Session, old: str, new: str):
+    """Move a derivative and its cache entry; an existing target wins over the old copy."""
+    if not os.path.exists(old):
+        return
+    entry = db.query(CacheEntry).filter(CacheEntry.path == old).first()
+    if os.path.exists(new):
+        delete_path(old)
+        if entry is not None:
+            db.delete(entry)
+        return
+    os.replace(old, new)
+    if entry is not None:
+        if db.query(CacheEntry.id).filter(CacheEntry.path == new).first():
+            db.delete(entry)
+        else:
+            entry.path = new
+
+def migrate_legacy_files(db: Session):
+    """Move media files stored directly in MEDIA_ROOT into the store; returns counts."""
+    root = os.path.abspath(MEDIA_ROOT)
+    stats = {"moved": 0, "deduplicated": 0, "skipped": 0}
+    legacy = db.query(Media).filter(Media.blob_id.is_(None)).all()
+    for media in legacy:
+        old_path = media.filepath
+        if os.path.dirname(os.path.abspath(old_path)) != root or not os.path.isfile(old_path):
+            stats["skipped"] += 1
+            continue
+        sha256 = file_sha256(old_path)
+        existing = db.query(Blob.id).filter(Blob.sha256 == sha256).first()
+        blob = _link(db, old_path, sha256, os.path.getsize(old_path), os.path.splitext(old_path)[1])
+        stats["deduplicated" if existing else "moved"] += 1
+        moves = [(hls_path(media.id), hls_path(sha256)), (preview_path(media.id), preview_path(sha256))]
+        moves += [(old_path + suffix, blob.path + suffix) for suffix in LOW_SUFFIXES]
+        for old, new in moves:
+            _move(db, old, new)
+            db.query(TranscodeJob).filter(
+                TranscodeJob.media_id == media.id, TranscodeJob.state.in_(ACTIVE_STATES), TranscodeJob.output_path == old
+            ).update({TranscodeJob.output_path: new}, synchronize_session=False)
+        db.query(TranscodeJob).filter(
+            TranscodeJob.media_id == media.id, TranscodeJob.state.in_(ACTIVE_STATES)
+        ).update({TranscodeJob.input_path: blob.path}, synchronize_session=False)
+        # The store is not scanned; the old path is gone
+        db.query(ScanEntry).filter(ScanEntry.path == old_path).delete(synchronize_session=False)
+        media.filepath = blob.path
+        media.blob_id = blob.id
+        db.commit()
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m backend.storage", description="Content-addressed media storage.")
+    parser.add_argument("command", choices=["migrate"], help="migrate: move media stored directly in MEDIA_ROOT into the store")
+    parser.parse_args(argv)
+    db = SessionLocal()
+    try:
+        stats = migrate_legacy_files(db)
+    finally:
+        db.close()
+    print(f"Migrated media into {BLOB_DIR}: {stats}")
+
+
+if __name__ == "__main__":
+    main()
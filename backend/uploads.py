@@ -0,0 +1,286 @@
+"""Resumable chunked uploads.
+
+A client creates a session with the final size, then PUTs chunks at byte
+offsets, in any order and several at a time. Each chunk carries an
+`Upload-Checksum: sha256 <base64>` header (as in tus) and is written with
+pwrite into a sparse file preallocated to the final size; it only counts as
+received once its checksum matches. After a dropped connection the client
+asks for the received ranges and sends the rest. Sessions are stored in the
+database, so they survive restarts, and expire UPLOAD_SESSION_TTL seconds
+after their last chunk.
+"""
+import os
+import base64
+import hashlib
+import binascii
+import threading
+from datetime import datetime, timedelta
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.orm import Session
+from backend.database import SessionLocal
+from backend.models import UploadSession, UploadChunk
+from backend.crud.uploads import (
+    create_upload_session, delete_upload_session, list_expired_upload_sessions,
+    list_received_chunks, reserve_upload_chunk, claim_upload_session, release_upload_session
+)
+from backend.scheduler import _pid_alive
+from backend.storage import store_file, file_sha256, INCOMING_DIR
+from backend.utils.file import MAX_UPLOAD_SIZE, UPLOAD_CHUNK_SIZE, UploadTooLarge
+
+# Abandoned sessions are deleted this long after their last chunk
+UPLOAD_SESSION_TTL = int(os.getenv("UPLOAD_SESSION_TTL", str(24 * 3600)))
+# How often expired sessions are looked for
+UPLOAD_SWEEP_SECONDS = int(os.getenv("UPLOAD_SWEEP_SECONDS", "600"))
+
+
+class InvalidChunk(Exception):
+    pass
+
+class ChunkConflict(Exception):
+    pass
+
+class ChecksumMismatch(Exception):
+    pass
+
+class UploadIncomplete(Exception):
+    pass
+
+
+def parse_checksum(header: str):
+    """Digest bytes from an `Upload-Checksum: sha256 <base64>` header."""
+    if not header:
+        raise InvalidChunk("Upload-Checksum header is required")
+    algorithm, _, value = header.strip().partition(" ")
+    if algorithm.lower() != "sha256":
+        raise InvalidChunk("Upload-Checksum must use sha256")
+    try:
+        digest = base64.b64decode(value.strip(), validate=True)
+    except binascii.Error:
+        digest = b""
+    if len(digest) != hashlib.sha256().digest_size:
+        raise InvalidChunk("Upload-Checksum value is not a base64 sha256 digest")
+    return digest
+
+def received_ranges(chunks: list):
+    """Merge received chunks (sorted by offset) into [start, end) ranges."""
+    ranges = []
+    for chunk in chunks:
+        end = chunk.offset + chunk.length
+        if ranges and ranges[-1][1] == chunk.offset:
+            ranges[-1][1] = end
+        else:
+            ranges.append([chunk.offset, end])
+    return ranges
+
+def _pwrite_all(fd: int, data: bytes, offset: int):
+    view = memoryview(data)
+    while view:
+        written = os.pwrite(fd, view, offset)
+        view = view[written:]
+        offset += written
+
+
+class UploadSessions:
+    """Upload sessions of this server process, and the sweeper that expires abandoned ones.
+
+    Chunks are reserved in the `upload_chunk` table before their bytes are
+    written, so two requests (in any server process) can never write the same
+    range, and a chunk that fails its checksum or is cut off is dropped without
+    touching data that was already received.
+    """
+
+    def __init__(self):
+        self._thread = None
+        self._stopping = threading.Event()
+
+    def start(self):
+        if self._thread is not None:
+            return
+        db = SessionLocal()
+        try:
+            self._drop_stale_chunks(db)
+        finally:
+            db.close()
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._sweeper, name="upload-sessions", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        self._thread = None
+
+    def create(self, db: Session, user_id: int, filename: str, size: int, sha256: str = None, genre: str = None, tags: list = None):
+        """Create a session and its sparse file. Raises UploadTooLarge over MAX_UPLOAD_SIZE."""
+        if MAX_UPLOAD_SIZE and size > MAX_UPLOAD_SIZE:
+            raise UploadTooLarge(f"Upload exceeds the {MAX_UPLOAD_SIZE} byte limit")
+        session = create_upload_session(db, user_id, filename, size, sha256, genre, tags, self._expiry())
+        session.path = os.path.join(INCOMING_DIR, f"upload-{session.id}")
+        try:
+            os.makedirs(INCOMING_DIR, exist_ok=True)
+            with open(session.path, "wb") as f:
+                f.truncate(size)
+        except OSError:
+            db.rollback()
+            raise
+        db.commit()
+        db.refresh(session)
+        return session
+
+    def describe(self, db: Session, session: UploadSession):
+        ranges = received_ranges(list_received_chunks(db, session.id))
+        return {
+            "id": session.id,
+            "filename": session.filename,
+            "size": session.size,
+            "received_bytes": sum(end - start for start, end in ranges),
+            "ranges": ranges,
+            "expires_at": session.expires_at,
+        }
+
+    async def receive(self, db: Session, session: UploadSession, offset: int, length: int, digest: bytes, body):
+        """Write one chunk from the async iterator `body` at `offset`.
+
+        Raises InvalidChunk for a range outside the file or a body that does not
+        match `length`, ChunkConflict when the range overlaps a received or
+        in-flight chunk, and ChecksumMismatch when the bytes do not hash to `digest`.
+        """
+        if length <= 0 or offset + length > session.size:
+            raise InvalidChunk(f"Chunk must lie within the {session.size} byte upload")
+        chunk_id = await run_in_threadpool(self._reserve, db, session.id, offset, length)
+        try:
+            sha = hashlib.sha256()
+            buffer = bytearray()
+            written = 0
+            fd = os.open(session.path, os.O_WRONLY)
+            try:
+                async for piece in body:
+                    if written + len(buffer) + len(piece) > length:
+                        raise InvalidChunk("Chunk is longer than its Content-Length")
+                    sha.update(piece)
+                    buffer += piece
+                    if len(buffer) >= UPLOAD_CHUNK_SIZE:
+                        await run_in_threadpool(_pwrite_all, fd, bytes(buffer), offset + written)
+                        written += len(buffer)
+                        buffer.clear()
+                if buffer:
+                    await run_in_threadpool(_pwrite_all, fd, bytes(buffer), offset + written)
+                    written += len(buffer)
+            finally:
+                os.close(fd)
+            if written != length:
+                raise InvalidChunk("Chunk is shorter than its Content-Length")
+            if sha.digest() != digest:
+                raise ChecksumMismatch("Chunk checksum does not match")
+        except BaseException:
+            await run_in_threadpool(self._release_chunk, db, chunk_id)
+            raise
+        await run_in_threadpool(self._accept, db, session.id, chunk_id)
+
+    def complete(self, db: Session, session: UploadSession):
+        """Move a fully received upload into the store and delete the session; returns the blob.
+
+        Raises UploadIncomplete while ranges are missing and ChecksumMismatch
+        (after deleting the session) when the file does not match its declared hash.
+        """
+        if not self._claim(db, session.id):
+            raise UploadIncomplete("Upload is already being completed")
+        try:
+            ranges = received_ranges(list_received_chunks(db, session.id))
+            if ranges != [[0, session.size]]:
+                missing = session.size - sum(end - start for start, end in ranges)
+                raise UploadIncomplete(f"{missing} bytes have not been received yet")
+            with open(session.path, "rb+") as f:
+                os.fsync(f.fileno())
+            sha256 = file_sha256(session.path)
+            if session.sha256 and sha256 != session.sha256.lower():
+                self.discard(db, session)
+                raise ChecksumMismatch("Uploaded file does not match the declared sha256")
+            blob = store_file(db, session.path, os.path.splitext(session.filename)[1], sha256)
+            delete_upload_session(db, session)
+            return blob
+        except BaseException:
+            # Let the client retry; a no-op once the session is gone
+            db.rollback()
+            release_upload_session(db, session.id)
+            raise
+
+    def discard(self, db: Session, session: UploadSession):
+        path = session.path
+        delete_upload_session(db, session)
+        if path and os.path.exists(path):
+            os.remove(path)
+
+    def expire(self, db: Session):
+        """Delete sessions past their expiry; returns how many were removed."""
+        self._drop_stale_chunks(db)
+        removed = 0
+        for session in list_expired_upload_sessions(db, datetime.utcnow()):
+            writing = db.query(UploadChunk.id).filter(
+                UploadChunk.session_id == session.id, UploadChunk.state == 'writing'
+            ).first()
+            if writing is None and not self._completing(session):
+                self.discard(db, session)
+                removed += 1
+        return removed
+
+    def _claim(self, db: Session, session_id: int):
+        """Claim completion of a session for this process, like the scheduler claims jobs."""
+        if claim_upload_session(db, session_id, os.getpid()):
+            return True
+        holder = db.query(UploadSession.pid).filter(
+            UploadSession.id == session_id, UploadSession.state == 'completing'
+        ).scalar()
+        if holder is None or holder == os.getpid() or _pid_alive(holder):
+            return False
+        # The process completing it went away; start over
+        return claim_upload_session(db, session_id, os.getpid(), holder=holder)
+
+    def _completing(self, session: UploadSession):
+        return session.state == 'completing' and (session.pid == os.getpid() or _pid_alive(session.pid))
+
+    def _expiry(self):
+        return datetime.utcnow() + timedelta(seconds=UPLOAD_SESSION_TTL)
+
+    def _reserve(self, db: Session, session_id: int, offset: int, length: int):
+        chunk, existing = reserve_upload_chunk(db, session_id, offset, length, os.getpid(), self._expiry())
+        if existing is not None:
+            what = "was already received" if existing.state == 'received' else "is being written"
+            raise ChunkConflict(f"Bytes {existing.offset}-{existing.offset + existing.length - 1} {what}")
+        return chunk.id
+
+    def _accept(self, db: Session, session_id: int, chunk_id: int):
+        db.query(UploadChunk).filter(UploadChunk.id == chunk_id).update(
+            {UploadChunk.state: 'received', UploadChunk.pid: None}, synchronize_session=False
+        )
+        db.query(UploadSession).filter(UploadSession.id == session_id).update(
+            {UploadSession.expires_at: self._expiry()}, synchronize_session=False
+        )
+        db.commit()
+
+    def _release_chunk(self, db: Session, chunk_id: int):
+        db.rollback()
+        db.query(UploadChunk).filter(UploadChunk.id == chunk_id).delete(synchronize_session=False)
+        db.commit()
+
+    def _drop_stale_chunks(self, db: Session):
+        """Forget chunks whose writer died mid-request (their bytes are rewritten on retry)."""
+        running = self._thread is not None
+        for chunk in db.query(UploadChunk).filter(UploadChunk.state == 'writing').all():
+            if running and chunk.pid == os.getpid():
+                continue
+            if not _pid_alive(chunk.pid):
+                db.delete(chunk)
+        db.commit()
+
+    def _sweeper(self):
+        while not self._stopping.wait(UPLOAD_SWEEP_SECONDS):
+            db = SessionLocal()
+            try:
+                self.expire(db)
+            except Exception:
+                db.rollback()
+            finally:
+                db.close()
+
+
+upload_sessions = UploadSessions()
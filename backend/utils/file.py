@@ -1,9 +1,69 @@
 import os
+import hashlib
+import tempfile
 from fastapi import UploadFile
 
+MEDIA_ROOT = os.getenv("MEDIA_ROOT", "media")
+# Size of each read/write when copying an upload to disk
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+# Per-upload size cap in bytes; 0 disables the limit
+MAX_UPLOAD_SIZE = int(os.getenv("MAX_UPLOAD_SIZE", "0"))
+
+# Read once at import: os.umask can only be queried by setting it, which is not thread-safe
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
 def ensure_media_root(media_root: str):
     os.makedirs(media_root, exist_ok=True)
 
-def save_upload_file(upload_file: UploadFile, destination: str):
-    with open(destination, "wb") as buffer:
-        buffer.write(upload_file.file.read()) 
\ No newline at end of file
+def disk_usage(path: str):
+    """Total size in bytes of a file or directory tree."""
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+def save_upload_file(upload_file: UploadFile, destination: str, max_size: int = MAX_UPLOAD_SIZE, chunk_size: int = UPLOAD_CHUNK_SIZE):
+    """Stream an upload to disk in fixed-size chunks and return (size, sha256 hexdigest).
+
+    The data is written to a temp file next to the destination and renamed into
+    place once complete, so readers never see a partial file.
+    """
+    directory = os.path.dirname(destination) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix=".upload-", suffix=".part", dir=directory)
+    # mkstemp creates 0600; give the file the usual umask-based mode so a proxy
+    # worker running as another user (FILE_DELIVERY=nginx) can read it
+    os.fchmod(fd, 0o666 & ~_UMASK)
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with os.fdopen(fd, "wb") as buffer:
+            while True:
+                chunk = upload_file.file.read(chunk_size)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if max_size and size > max_size:
+                    raise UploadTooLarge(f"Upload exceeds the {max_size} byte limit")
+                digest.update(chunk)
+                buffer.write(chunk)
+            buffer.flush()
+            os.fsync(buffer.fileno())
+        os.replace(tmp_path, destination)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return size, digest.hexdigest()
@@ -0,0 +1,250 @@
+import os
+import re
+import stat
+import secrets
+import mimetypes
+from email.utils import formatdate, parsedate_to_datetime
+from urllib.parse import quote
+from fastapi import Request
+from fastapi.responses import Response, StreamingResponse
+from backend.utils.file import MEDIA_ROOT
+
+READ_CHUNK_SIZE = 64 * 1024
+# Who sends file bodies: 'app' streams them from Python; 'nginx' answers with
+# X-Accel-Redirect and 'sendfile' with X-Sendfile, so the reverse proxy sends the bytes
+FILE_DELIVERY = os.getenv("FILE_DELIVERY", "app")
+# nginx `internal` location that aliases MEDIA_ROOT (used with FILE_DELIVERY=nginx)
+ACCEL_REDIRECT_PREFIX = os.getenv("ACCEL_REDIRECT_PREFIX", "/_protected_media/")
+# More ranges than this in one request is treated as abuse and answered with the full body
+MAX_RANGES = 16
+
+MEDIA_TYPES = {
+    ".m3u8": "application/vnd.apple.mpegurl",
+    ".ts": "video/mp2t",
+    ".mp4": "video/mp4",
+    ".mkv": "video/x-matroska",
+    ".mov": "video/quicktime",
+    ".mp3": "audio/mpeg",
+    ".aac": "audio/aac",
+    ".flac": "audio/flac",
+    ".heic": "image/heic",
+    ".vtt": "text/vtt",
+}
+
+_RANGE_RE = re.compile(r"^\s*(\d*)\s*-\s*(\d*)\s*$")
+
+
+def guess_media_type(path: str):
+    ext = os.path.splitext(path)[1].lower()
+    return MEDIA_TYPES.get(ext) or mimetypes.guess_type(path)[0] or "application/octet-stream"
+
+def make_etag(st: os.stat_result):
+    """Strong validator built from inode, size and mtime."""
+    return f'"{st.st_ino:x}-{st.st_size:x}-{st.st_mtime_ns:x}"'
+
+def _etag_matches(header: str, etag: str, weak: bool):
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        if weak:
+            candidate = candidate[2:] if candidate.startswith("W/") else candidate
+        if candidate == etag:
+            return True
+    return False
+
+def _not_modified(request: Request, etag: str, mtime: float):
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return _etag_matches(if_none_match, etag, weak=True)
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+def _precondition_failed(request: Request, etag: str, mtime: float):
+    if_match = request.headers.get("if-match")
+    if if_match is not None:
+        # If-Match requires the strong comparison function
+        return not _etag_matches(if_match, etag, weak=False)
+    if_unmodified_since = request.headers.get("if-unmodified-since")
+    if if_unmodified_since:
+        try:
+            return int(mtime) > parsedate_to_datetime(if_unmodified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+def _if_range_allows(request: Request, etag: str, last_modified: str):
+    if_range = request.headers.get("if-range")
+    if if_range is None:
+        return True
+    if_range = if_range.strip()
+    if if_range.startswith('"'):
+        # If-Range requires the strong comparison function
+        return if_range == etag
+    return if_range == last_modified
+
+def parse_range_header(header: str, size: int):
+    """Parse a `bytes=` Range header into a sorted list of merged (start, end) pairs.
+
+    Returns None when the header is missing or malformed (serve the full body)
+    and an empty list when no range is satisfiable (416).
+    """
+    if not header or "=" not in header:
+        return None
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes":
+        return None
+    ranges = []
+    for part in spec.split(","):
+        match = _RANGE_RE.match(part)
+        if not match:
+            return None
+        first, last = match.groups()
+        if first == "" and last == "":
+            return None
+        if first == "":
+            # Suffix range: the last N bytes
+            length = int(last)
+            if length == 0 or size == 0:
+                # Nothing to serve from an empty file
+                continue
+            ranges.append((max(size - length, 0), size - 1))
+            continue
+        start = int(first)
+        if last and int(last) < start:
+            return None
+        if start >= size:
+            continue
+        end = int(last) if last else size - 1
+        ranges.append((start, min(end, size - 1)))
+    if len(ranges) > MAX_RANGES:
+        return None
+    ranges.sort()
+    merged = []
+    for start, end in ranges:
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+def _read_range(path: str, start: int, end: int):
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = f.read(min(READ_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+def _read_multipart(path: str, parts):
+    for header, start, end in parts:
+        yield header
+        yield from _read_range(path, start, end)
+        yield b"\r\n"
+
+def _content_disposition(filename: str):
+    quoted = quote(filename)
+    if quoted != filename:
+        return f"attachment; filename*=utf-8''{quoted}"
+    return f'attachment; filename="{filename}"'
+
+def offload_headers(path: str, delivery: str = None):
+    """Headers handing `path` to the reverse proxy, or None to serve it from the app.
+
+    Only files under MEDIA_ROOT can be offloaded; the proxy location maps onto it.
+    """
+    delivery = delivery or FILE_DELIVERY
+    if delivery == "app":
+        return None
+    real_path = os.path.realpath(path)
+    relative = os.path.relpath(real_path, os.path.realpath(MEDIA_ROOT))
+    if relative == os.pardir or relative.startswith(os.pardir + os.sep):
+        return None
+    if delivery == "nginx":
+        return {"x-accel-redirect": ACCEL_REDIRECT_PREFIX.rstrip("/") + "/" + quote(relative.replace(os.sep, "/"))}
+    if delivery == "sendfile":
+        return {"x-sendfile": real_path}
+    raise ValueError(f"Unknown FILE_DELIVERY mode: {delivery}")
+
+def send_file(request: Request, path: str, filename: str = None, media_type: str = None):
+    """Serve a file with ETag/Last-Modified validators, conditional GET and byte ranges (RFC 7232/7233).
+
+    With FILE_DELIVERY set to a proxy mode, the body, ranges and HEAD are left to
+    the proxy, and only metadata headers are sent from here; preconditions (412)
+    and revalidation (304) are still answered by the app.
+    """
+    st = os.stat(path)
+    if not stat.S_ISREG(st.st_mode):
+        raise FileNotFoundError(path)
+    size = st.st_size
+    media_type = media_type or guess_media_type(path)
+    etag = make_etag(st)
+    last_modified = formatdate(st.st_mtime, usegmt=True)
+    headers = {
+        "accept-ranges": "bytes",
+        "etag": etag,
+        "last-modified": last_modified,
+    }
+    if filename:
+        headers["content-disposition"] = _content_disposition(filename)
+    head = request.method == "HEAD"
+
+    if _precondition_failed(request, etag, st.st_mtime):
+        return Response(status_code=412, headers=headers)
+    if _not_modified(request, etag, st.st_mtime):
+        return Response(status_code=304, headers=headers)
+
+    offload = offload_headers(path)
+    if offload:
+        # The proxy generates its own validators and ranges from the same file
+        headers.update(offload)
+        return Response(status_code=200, headers=headers, media_type=media_type)
+
+    ranges = None
+    if not head and _if_range_allows(request, etag, last_modified):
+        ranges = parse_range_header(request.headers.get("range"), size)
+
+    if ranges == []:
+        headers["content-range"] = f"bytes */{size}"
+        return Response(status_code=416, headers=headers)
+
+    if not ranges:
+        headers["content-length"] = str(size)
+        if head:
+            return Response(status_code=200, headers=headers, media_type=media_type)
+        return StreamingResponse(_read_range(path, 0, size - 1), headers=headers, media_type=media_type)
+
+    if len(ranges) == 1:
+        start, end = ranges[0]
+        headers["content-range"] = f"bytes {start}-{end}/{size}"
+        headers["content-length"] = str(end - start + 1)
+        return StreamingResponse(_read_range(path, start, end), status_code=206, headers=headers, media_type=media_type)
+
+    boundary = secrets.token_hex(16)
+    parts = []
+    length = 0
+    for start, end in ranges:
+        part_header = (
+            f"--{boundary}\r\n"
+            f"Content-Type: {media_type}\r\n"
+            f"Content-Range: bytes {start}-{end}/{size}\r\n\r\n"
+        ).encode("latin-1")
+        parts.append((part_header, start, end))
+        length += len(part_header) + (end - start + 1) + 2
+    closing = f"--{boundary}--\r\n".encode("latin-1")
+    length += len(closing)
+    headers["content-length"] = str(length)
+
+    def body():
+        yield from _read_multipart(path, parts)
+        yield closing
+
+    return StreamingResponse(body(), status_code=206, headers=headers, media_type=f"multipart/byteranges; boundary={boundary}")
@@ -0,0 +1,130 @@
+import os
+import asyncio
+import hashlib
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from backend.utils.file import MEDIA_ROOT
+
+# Worker processes decoding and resizing photos (Pillow holds the GIL for much of the work)
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", "2"))
+# Rendered variants, sharded by key: MEDIA_ROOT/.images/ab/ab12....jpg
+IMAGE_CACHE_DIR = os.path.join(MEDIA_ROOT, ".images")
+IMAGE_MAX_DIMENSION = 4096
+IMAGE_DEFAULT_QUALITY = 80
+
+IMAGE_FORMATS = {
+    "jpeg": ("JPEG", ".jpg"),
+    "webp": ("WEBP", ".webp"),
+}
+
+# EXIF orientation -> Image.Transpose name
+_ORIENTATION = {2: "FLIP_LEFT_RIGHT", 3: "ROTATE_180", 4: "FLIP_TOP_BOTTOM", 5: "TRANSPOSE", 6: "ROTATE_270", 7: "TRANSVERSE", 8: "ROTATE_90"}
+
+
+def _open_image(path: str):
+    from PIL import Image
+    if path.lower().endswith(".heic"):
+        try:
+            import pyheif
+        except ImportError:
+            raise RuntimeError("pyheif is required to decode HEIC images.")
+        heif_file = pyheif.read(path)
+        return Image.frombytes(
+            heif_file.mode, heif_file.size, heif_file.data,
+            "raw", heif_file.mode, heif_file.stride, 1
+        )
+    return Image.open(path)
+
+def render_image(src_path: str, dest_path: str, width: int = None, height: int = None, fmt: str = "jpeg", quality: int = IMAGE_DEFAULT_QUALITY):
+    """Decode an image, fit it inside width x height (never upscaling) and encode it.
+
+    Runs in the image worker processes. JPEGs are decoded at a reduced DCT
+    scale when the target is much smaller than the original.
+    """
+    try:
+        from PIL import Image, UnidentifiedImageError
+    except ImportError:
+        raise RuntimeError("Pillow is required for image variants.")
+    try:
+        img = _open_image(src_path)
+        orientation = img.getexif().get(0x0112, 1)
+        box_w, box_h = width or IMAGE_MAX_DIMENSION * 4, height or IMAGE_MAX_DIMENSION * 4
+        if orientation in (5, 6, 7, 8):
+            # Stored sideways: the box applies to the rotated picture
+            box_w, box_h = box_h, box_w
+        if width or height:
+            img.draft("RGB", (box_w, box_h))
+            img.thumbnail((box_w, box_h), Image.Resampling.LANCZOS, reducing_gap=3.0)
+        else:
+            img.load()
+    except UnidentifiedImageError:
+        raise ValueError("Cannot decode image")
+    if orientation in _ORIENTATION:
+        img = img.transpose(getattr(Image.Transpose, _ORIENTATION[orientation]))
+    pil_format, _ = IMAGE_FORMATS[fmt]
+    if pil_format == "JPEG" and img.mode not in ("RGB", "L"):
+        img = img.convert("RGB")
+    elif img.mode not in ("RGB", "RGBA", "L"):
+        img = img.convert("RGBA" if "A" in img.mode or "transparency" in img.info else "RGB")
+    os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+    tmp_path = f"{dest_path}.{os.getpid()}.tmp"
+    options = {"quality": quality}
+    if pil_format == "JPEG":
+        options["progressive"] = True
+    else:
+        options["method"] = 4
+    img.save(tmp_path, format=pil_format, **options)
+    os.replace(tmp_path, dest_path)
+    return dest_path
+
+
+def variant_path(source_etag: str, width: int, height: int, fmt: str, quality: int):
+    """Cache location of a rendered variant.
+
+    The key covers the source's validator (inode, size, mtime) and the render
+    parameters, so a changed original never hits a stale variant.
+    """
+    key = hashlib.sha256(f"{source_etag}|{width}|{height}|{fmt}|{quality}".encode()).hexdigest()
+    return os.path.join(IMAGE_CACHE_DIR, key[:2], key + IMAGE_FORMATS[fmt][1])
+
+
+class ImageRenderer:
+    """Process pool for render_image with de-duplication of identical requests."""
+
+    def __init__(self, workers: int = IMAGE_WORKERS):
+        self.workers = workers
+        self._pool = None
+        # Re-entrant: a future that is already done runs _forget inside render()
+        self._lock = threading.RLock()
+        self._pending = {}  # dest_path -> Future
+
+    def _executor(self):
+        if self._pool is None:
+            # spawn: forking a server process that runs threads is unsafe
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._pool
+
+    async def render(self, src_path: str, dest_path: str, width: int, height: int, fmt: str, quality: int):
+        """Render a variant in a worker process unless the same one is already being rendered."""
+        with self._lock:
+            future = self._pending.get(dest_path)
+            if future is None:
+                future = self._executor().submit(render_image, src_path, dest_path, width, height, fmt, quality)
+                self._pending[dest_path] = future
+                future.add_done_callback(lambda f: self._forget(dest_path, f))
+        return await asyncio.wrap_future(future)
+
+    def _forget(self, dest_path: str, future):
+        with self._lock:
+            if self._pending.get(dest_path) is future:
+                del self._pending[dest_path]
+
+    def stop(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+
+
+image_renderer = ImageRenderer()
@@ -0,0 +1,20 @@
+import json
+import base64
+
+class InvalidCursor(ValueError):
+    pass
+
+def encode_cursor(data: dict):
+    """Opaque, URL-safe cursor for keyset pagination."""
+    raw = json.dumps(data, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        raise InvalidCursor("Invalid cursor")
+    if not isinstance(data, dict):
+        raise InvalidCursor("Invalid cursor")
+    return data
@@ -0,0 +1,107 @@
+import os
+import math
+import shutil
+from backend.utils.transcoding import probe_media, run_ffmpeg
+
+# Widths of the still thumbnails written next to the full-size poster
+THUMBNAIL_WIDTHS = [int(w) for w in os.getenv("THUMBNAIL_WIDTHS", "160,320,640").split(",")]
+# Poster frame position as a fraction of the duration (skips black intros)
+POSTER_POSITION = 0.1
+# One scrub-preview tile per this many seconds, at most SPRITE_MAX_TILES tiles
+SPRITE_INTERVAL = int(os.getenv("SPRITE_INTERVAL", "10"))
+SPRITE_MAX_TILES = 100
+SPRITE_COLUMNS = 10
+SPRITE_TILE_WIDTH = 160
+
+POSTER_NAME = "poster.jpg"
+SPRITE_IMAGE = "sprites.jpg"
+SPRITE_VTT = "sprites.vtt"
+
+
+def thumbnail_name(width: int):
+    return f"thumb_{width}.jpg"
+
+def _even(value: float):
+    return max(2, int(round(value / 2)) * 2)
+
+def _timestamp(seconds: float):
+    hours, rest = divmod(seconds, 3600)
+    minutes, secs = divmod(rest, 60)
+    return f"{int(hours):02d}:{int(minutes):02d}:{secs:06.3f}"
+
+def sprite_layout(duration: float, interval: int = SPRITE_INTERVAL):
+    """Return (interval, tiles, columns, rows) covering `duration` seconds."""
+    interval = max(interval, math.ceil(duration / SPRITE_MAX_TILES))
+    tiles = max(1, math.ceil(duration / interval))
+    columns = min(tiles, SPRITE_COLUMNS)
+    return interval, tiles, columns, math.ceil(tiles / columns)
+
+def extract_stills(input_path: str, output_dir: str, info: dict):
+    """Write the poster and every thumbnail size from one decoded keyframe."""
+    position = (info.get("duration") or 0) * POSTER_POSITION
+    widths = [w for w in THUMBNAIL_WIDTHS if not info.get("width") or w < info["width"]]
+    n = len(widths) + 1
+    graph = f"[0:v]split={n}[poster]" + "".join(f"[t{i}]" for i in range(len(widths)))
+    graph += "".join(f";[t{i}]scale={w}:-2[s{i}]" for i, w in enumerate(widths))
+    cmd = [
+        "ffmpeg",
+        # Input seeking lands on the keyframe before `position`; decoding only
+        # keyframes means no frames are decoded just to be thrown away.
+        "-skip_frame", "nokey", "-ss", f"{position:.3f}", "-noaccurate_seek",
+        "-i", input_path,
+        "-filter_complex", graph,
+        "-map", "[poster]", "-frames:v", "1", "-q:v", "3", "-y", os.path.join(output_dir, POSTER_NAME)
+    ]
+    for i, w in enumerate(widths):
+        cmd += ["-map", f"[s{i}]", "-frames:v", "1", "-q:v", "4", "-y", os.path.join(output_dir, thumbnail_name(w))]
+    run_ffmpeg(cmd)
+
+def extract_sprites(input_path: str, output_dir: str, info: dict, on_progress=None):
+    """Write a tiled sprite sheet and the WebVTT file mapping time ranges to tiles."""
+    duration = info.get("duration") or 0
+    interval, tiles, columns, rows = sprite_layout(duration)
+    width = SPRITE_TILE_WIDTH
+    if info.get("width") and info.get("height"):
+        height = _even(width * info["height"] / info["width"])
+    else:
+        height = _even(width * 9 / 16)
+    cmd = [
+        "ffmpeg",
+        "-skip_frame", "nokey",
+        "-i", input_path,
+        "-an", "-sn",
+        "-vf", f"fps=1/{interval},scale={width}:{height},tile={columns}x{rows}",
+        "-frames:v", "1", "-q:v", "5",
+        "-y", os.path.join(output_dir, SPRITE_IMAGE)
+    ]
+    run_ffmpeg(cmd, input_path, on_progress)
+    lines = ["WEBVTT", ""]
+    for i in range(tiles):
+        start = i * interval
+        end = min(start + interval, duration) if duration else start + interval
+        x, y = (i % columns) * width, (i // columns) * height
+        lines += [f"{_timestamp(start)} --> {_timestamp(end)}", f"{SPRITE_IMAGE}#xywh={x},{y},{width},{height}", ""]
+    with open(os.path.join(output_dir, SPRITE_VTT), "w") as f:
+        f.write("\n".join(lines))
+
+def generate_previews(input_path: str, output_dir: str, info: dict = None, on_progress=None):
+    """Create the poster, thumbnails and scrub-preview sprites for a video.
+
+    Everything is written to a temporary directory that replaces `output_dir`
+    once complete, so readers never see a partial set.
+    """
+    info = info or probe_media(input_path) or {}
+    if not info.get("video_codec") and not info.get("width"):
+        raise ValueError("No video stream to take previews from")
+    tmp_dir = output_dir + ".part"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    try:
+        extract_stills(input_path, tmp_dir, info)
+        extract_sprites(input_path, tmp_dir, info, on_progress)
+        shutil.rmtree(output_dir, ignore_errors=True)
+        os.replace(tmp_dir, output_dir)
+    except Exception:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+    return output_dir
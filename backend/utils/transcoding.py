@@ -1,15 +1,205 @@
 import subprocess
+import threading
+import json
 import os
+import shutil
+import tempfile
+from collections import deque
+from contextlib import contextmanager
 
-def transcode_media(input_path: str, output_path: str, bitrate: str = "800k", resolution: str = "640x360"):
+def _parse_ladder(spec: str):
+    ladder = []
+    for entry in spec.split(","):
+        height, video_kbps, audio_kbps = entry.strip().split(":")
+        ladder.append({"name": f"{height}p", "height": int(height), "video_kbps": int(video_kbps), "audio_kbps": int(audio_kbps)})
+    return sorted(ladder, key=lambda r: r["height"])
+
+# Adaptive-bitrate rendition ladder as "height:video_kbps:audio_kbps,..."
+HLS_LADDER = _parse_ladder(os.getenv("HLS_LADDER", "240:400:64,480:1400:96,720:2800:128,1080:5000:192"))
+HLS_SEGMENT_SECONDS = 4
+HLS_MASTER_PLAYLIST = "master.m3u8"
+# Stream-copy HLS-compatible sources as the top rendition instead of re-encoding it
+HLS_STREAM_COPY = os.getenv("HLS_STREAM_COPY", "1") == "1"
+
+# Codecs that can be segmented into MPEG-TS and played by HLS clients as they are
+HLS_VIDEO_CODECS = ("h264",)
+HLS_VIDEO_PIX_FMTS = ("yuv420p", "yuvj420p")
+HLS_AUDIO_CODECS = ("aac", "mp3")
+
+def probe_duration(input_path: str):
+    """Return the media duration in seconds using ffprobe, or None if unknown."""
+    cmd = [
+        "ffprobe", "-v", "error",
+        "-show_entries", "format=duration",
+        "-of", "default=noprint_wrappers=1:nokey=1",
+        input_path
+    ]
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+        return float(result.stdout.strip())
+    except (OSError, subprocess.CalledProcessError, ValueError):
+        return None
+
+def _int_or_none(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+def probe_media(input_path: str):
+    """Return container, codec and stream information for a media file using ffprobe, or None if it cannot be probed."""
+    cmd = [
+        "ffprobe", "-v", "error",
+        "-show_streams", "-show_format",
+        "-of", "json",
+        input_path
+    ]
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+        data = json.loads(result.stdout)
+    except (OSError, subprocess.CalledProcessError, ValueError):
+        return None
+    video = next((st for st in data.get("streams", []) if st.get("codec_type") == "video"), None)
+    audio = next((st for st in data.get("streams", []) if st.get("codec_type") == "audio"), None)
+    fmt = data.get("format", {})
+    try:
+        duration = float(fmt.get("duration"))
+    except (TypeError, ValueError):
+        duration = None
+    return {
+        "container": fmt.get("format_name"),
+        "duration": duration,
+        "bitrate": _int_or_none(fmt.get("bit_rate")),
+        "video_codec": video.get("codec_name") if video else None,
+        "audio_codec": audio.get("codec_name") if audio else None,
+        "width": video.get("width") if video else None,
+        "height": video.get("height") if video else None,
+        "pix_fmt": video.get("pix_fmt") if video else None,
+        "video_profile": video.get("profile") if video else None,
+        "has_audio": audio is not None,
+    }
+
+def hls_copy_compatible(info: dict):
+    """Return (copy_video, copy_audio): which streams can be segmented without re-encoding."""
+    if not info or not info.get("video_codec"):
+        return False, False
+    profile = (info.get("video_profile") or "").lower()
+    copy_video = (
+        info["video_codec"] in HLS_VIDEO_CODECS
+        and info.get("pix_fmt") in HLS_VIDEO_PIX_FMTS
+        # 10-bit and 4:2:2/4:4:4 H.264 profiles are not decodable by most players
+        and not any(p in profile for p in ("high 10", "4:2:2", "4:4:4"))
+    )
+    copy_audio = info.get("audio_codec") in HLS_AUDIO_CODECS
+    return copy_video, copy_audio
+
+def select_renditions(ladder: list, source_height: int = None):
+    """Keep the ladder rungs that do not upscale the source; always keep at least one."""
+    if not source_height:
+        return list(ladder)
+    renditions = [r for r in ladder if r["height"] <= source_height]
+    if not renditions:
+        smallest = dict(ladder[0], height=source_height - source_height % 2)
+        smallest["name"] = f"{smallest['height']}p"
+        renditions = [smallest]
+    return renditions
+
+# Per-thread callback told about each process run_ffmpeg starts; see track_processes
+_tracking = threading.local()
+
+@contextmanager
+def track_processes(on_start):
+    """Call `on_start(proc)` with every ffmpeg process run_ffmpeg starts on this thread.
+
+    Lets the transcode scheduler kill the children of its running jobs when it stops.
+    """
+    previous = getattr(_tracking, "on_start", None)
+    _tracking.on_start = on_start
+    try:
+        yield
+    finally:
+        _tracking.on_start = previous
+
+def run_ffmpeg(cmd: list, input_path: str = None, on_progress=None):
+    """Run an ffmpeg command, reporting progress (0.0-1.0) parsed from `-progress` output.
+
+    Raises CalledProcessError carrying the tail of ffmpeg's stderr on failure.
+    An exception raised by `on_progress` kills ffmpeg and propagates.
+    """
+    duration = probe_duration(input_path) if on_progress and input_path else None
+    cmd = [cmd[0], "-progress", "pipe:1", "-nostats"] + cmd[1:]
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    on_start = getattr(_tracking, "on_start", None)
+    if on_start is not None:
+        on_start(proc)
+    # Drain stderr in the background so a chatty ffmpeg cannot block on a full pipe
+    stderr_tail = deque(maxlen=20)
+    drain = threading.Thread(target=stderr_tail.extend, args=(proc.stderr,), daemon=True)
+    drain.start()
+    try:
+        for line in proc.stdout:
+            if on_progress is None:
+                continue
+            key, _, value = line.strip().partition("=")
+            if key == "out_time_us" and duration:
+                try:
+                    progress = min(max(int(value), 0) / 1_000_000 / duration, 1.0)
+                except ValueError:
+                    continue
+                on_progress(progress)
+            elif key == "progress" and value == "end":
+                on_progress(1.0)
+    except BaseException:
+        # on_progress aborted the encode (e.g. the job was cancelled)
+        proc.kill()
+        proc.wait()
+        drain.join()
+        raise
+    proc.wait()
+    drain.join()
+    if proc.returncode != 0:
+        raise subprocess.CalledProcessError(proc.returncode, cmd, stderr="".join(stderr_tail))
+
+def transcode_media(input_path: str, output_path: str, bitrate: str = "800k", resolution: str = "640x360", on_progress=None):
     """Transcode video/audio to lower bitrate/resolution using ffmpeg."""
+    cmd = ["ffmpeg", "-i", input_path]
+    if resolution:
+        cmd += ["-b:v", bitrate, "-s", resolution]
+    else:
+        # Audio-only output
+        cmd += ["-b:a", bitrate]
+    cmd += ["-y", output_path]
+    run_ffmpeg(cmd, input_path, on_progress)
+
+def live_transcode_command(input_path: str, audio_only: bool = False):
+    """ffmpeg command writing a low-bitrate stream to stdout as it encodes.
+
+    Video becomes fragmented MP4, which players can start on before the end
+    of the file is known; audio becomes MP3.
+    """
+    cmd = ["ffmpeg", "-nostdin", "-loglevel", "error", "-i", input_path]
+    if audio_only:
+        return cmd + ["-vn", "-c:a", "libmp3lame", "-b:a", "64k", "-f", "mp3", "pipe:1"]
+    return cmd + [
+        "-map", "0:v:0", "-map", "0:a:0?",
+        "-vf", "scale=-2:240",
+        "-c:v", "libx264", "-preset", "veryfast",
+        "-b:v", "500k", "-maxrate", "500k", "-bufsize", "1000k",
+        "-c:a", "aac", "-b:a", "96k",
+        "-movflags", "frag_keyframe+empty_moov+default_base_moof",
+        "-f", "mp4", "pipe:1"
+    ]
+
+def remux_media(input_path: str, output_path: str, on_progress=None):
+    """Copy the first video and audio streams into a new container without re-encoding."""
     cmd = [
         "ffmpeg", "-i", input_path,
-        "-b:v", bitrate,
-        "-s", resolution,
+        "-map", "0:v:0?", "-map", "0:a:0?",
+        "-c", "copy",
+        "-movflags", "+faststart",
         "-y", output_path
     ]
-    subprocess.run(cmd, check=True)
+    run_ffmpeg(cmd, input_path, on_progress)
 
 def convert_heic_to_jpeg(input_path: str, output_path: str):
     """Convert HEIC image to JPEG using pyheif and Pillow."""
@@ -26,20 +216,149 @@ def convert_heic_to_jpeg(input_path: str, output_path: str):
         raise RuntimeError("pyheif and Pillow are required for HEIC conversion.")
 
 
-def transcode_to_hls(input_path: str, output_dir: str, playlist_name: str = "playlist.m3u8", bitrate: str = "500k", resolution: str = "426x240"):
-    """Transcode a video to HLS (m3u8 + ts segments) using ffmpeg."""
-    os.makedirs(output_dir, exist_ok=True)
-    playlist_path = os.path.join(output_dir, playlist_name)
-    cmd = [
-        "ffmpeg", "-i", input_path,
-        "-vf", f"scale={resolution}",
-        "-c:v", "libx264",
-        "-b:v", bitrate,
-        "-c:a", "aac",
-        "-hls_time", "4",
+def transcode_to_hls(input_path: str, output_dir: str, ladder: list = None, on_progress=None, info: dict = None):
+    """Transcode a video to an adaptive-bitrate HLS ladder using ffmpeg.
+
+    The source is decoded once and split into every rendition in a single pass.
+    Each rendition is written to its own sub-directory (`240p/playlist.m3u8`,
+    `240p/segment_000.ts`, ...) and referenced from `master.m3u8`.
+
+    When the source video is already HLS-compatible it is stream-copied as the
+    top rendition and only the rungs below its resolution are encoded. Its
+    segments are cut on the source's keyframes, so they can exceed
+    HLS_SEGMENT_SECONDS; audio is copied too when compatible.
+    """
+    info = info or probe_media(input_path) or {}
+    copy_video, copy_audio = hls_copy_compatible(info)
+    source_height = info.get("height")
+    renditions = select_renditions(ladder or HLS_LADDER, source_height)
+    source = None
+    if HLS_STREAM_COPY and copy_video:
+        source = {"name": f"{source_height}p" if source_height else "source", "height": source_height}
+        renditions = [r for r in renditions if source_height and r["height"] < source_height]
+    has_audio = info.get("has_audio", True)
+    work_dir = _start_hls_output(output_dir)
+    for r in renditions + ([source] if source else []):
+        os.makedirs(os.path.join(work_dir, r["name"]), exist_ok=True)
+
+    n = len(renditions)
+    cmd = ["ffmpeg", "-i", input_path]
+    if n:
+        split = f"[0:v]split={n}" + "".join(f"[s{i}]" for i in range(n))
+        scales = [f"[s{i}]scale=-2:{r['height']}[v{i}]" for i, r in enumerate(renditions)]
+        cmd += ["-filter_complex", ";".join([split] + scales)]
+    stream_map = []
+    for i, r in enumerate(renditions):
+        cmd += [
+            "-map", f"[v{i}]",
+            f"-c:v:{i}", "libx264",
+            f"-b:v:{i}", f"{r['video_kbps']}k",
+            f"-maxrate:v:{i}", f"{r['video_kbps']}k",
+            f"-bufsize:v:{i}", f"{r['video_kbps'] * 2}k",
+            # Keyframes on segment boundaries keep the renditions switchable
+            f"-force_key_frames:v:{i}", f"expr:gte(t,n_forced*{HLS_SEGMENT_SECONDS})",
+            f"-sc_threshold:v:{i}", "0",
+        ]
+        entry = f"v:{i}"
+        if has_audio:
+            cmd += ["-map", "0:a:0", f"-c:a:{i}", "aac", f"-b:a:{i}", f"{r['audio_kbps']}k"]
+            entry += f",a:{i}"
+        stream_map.append(f"{entry},name:{r['name']}")
+    if source:
+        cmd += ["-map", "0:v:0", f"-c:v:{n}", "copy"]
+        entry = f"v:{n}"
+        if has_audio:
+            cmd += ["-map", "0:a:0"]
+            cmd += [f"-c:a:{n}", "copy"] if copy_audio else [f"-c:a:{n}", "aac", f"-b:a:{n}", f"{HLS_LADDER[-1]['audio_kbps']}k"]
+            entry += f",a:{n}"
+        stream_map.append(f"{entry},name:{source['name']}")
+    cmd += [
+        "-f", "hls",
+        "-hls_time", str(HLS_SEGMENT_SECONDS),
         "-hls_playlist_type", "vod",
-        "-hls_segment_filename", os.path.join(output_dir, "segment_%03d.ts"),
-        "-y", playlist_path
     ]
-    subprocess.run(cmd, check=True)
-    return playlist_path 
\ No newline at end of file
+    if not source:
+        # Copied segments start on the source's keyframes, which need not be IDR frames
+        cmd += ["-hls_flags", "independent_segments"]
+    cmd += [
+        "-hls_segment_filename", os.path.join(work_dir, "%v", "segment_%03d.ts"),
+        "-master_pl_name", HLS_MASTER_PLAYLIST,
+        "-var_stream_map", " ".join(stream_map),
+        "-y", os.path.join(work_dir, "%v", "playlist.m3u8")
+    ]
+    with _hls_output(work_dir, output_dir):
+        run_ffmpeg(cmd, input_path, on_progress)
+        if source:
+            _write_master_playlist(work_dir, renditions, source, info)
+    return os.path.join(output_dir, HLS_MASTER_PLAYLIST)
+
+def _write_master_playlist(work_dir: str, renditions: list, source: dict, info: dict):
+    """Replace ffmpeg's master playlist for a ladder topped by a stream-copied rendition.
+
+    ffmpeg only writes BANDWIDTH when it knows the stream bitrates, which stream
+    copy often does not, so the source's entry comes from the probe instead.
+    """
+    width, height = info.get("width"), source["height"]
+    lines = ["#EXTM3U", "#EXT-X-VERSION:3"]
+    for r in renditions:
+        stream_inf = f"#EXT-X-STREAM-INF:BANDWIDTH={(r['video_kbps'] + r['audio_kbps']) * 1000}"
+        if width and height:
+            # scale=-2 keeps the aspect ratio with an even width
+            stream_inf += f",RESOLUTION={round(width * r['height'] / height / 2) * 2}x{r['height']}"
+        lines += [stream_inf, f"{r['name']}/playlist.m3u8"]
+    stream_inf = f"#EXT-X-STREAM-INF:BANDWIDTH={info.get('bitrate') or 5_000_000}"
+    if width and height:
+        stream_inf += f",RESOLUTION={width}x{height}"
+    lines += [stream_inf, f"{source['name']}/playlist.m3u8"]
+    with open(os.path.join(work_dir, HLS_MASTER_PLAYLIST), "w") as f:
+        f.write("\n".join(lines) + "\n")
+
+def hls_output_complete(output_dir: str):
+    """True when `output_dir` holds a master playlist whose renditions were all encoded to the end.
+
+    Also rejects partial output left by jobs that ran before encodes went
+    through a work directory.
+    """
+    try:
+        with open(os.path.join(output_dir, HLS_MASTER_PLAYLIST)) as f:
+            variants = [line.strip() for line in f if line.strip() and not line.startswith("#")]
+        if not variants:
+            return False
+        for variant in variants:
+            with open(os.path.join(output_dir, variant)) as f:
+                if "#EXT-X-ENDLIST" not in f.read():
+                    return False
+    except OSError:
+        return False
+    return True
+
+def _start_hls_output(output_dir: str):
+    """Fresh work directory for an HLS encode into `output_dir`.
+
+    Unique per encode: a cancelled job still shutting down must not share it
+    with the job that replaces it.
+    """
+    parent = os.path.dirname(output_dir) or "."
+    os.makedirs(parent, exist_ok=True)
+    return tempfile.mkdtemp(dir=parent, prefix=os.path.basename(output_dir) + ".part.")
+
+@contextmanager
+def _hls_output(work_dir: str, output_dir: str):
+    """Move a finished encode from `work_dir` into `output_dir`; discard it on failure.
+
+    ffmpeg writes the master playlist early, so encoding in place would leave a
+    master behind a failed or killed job and make partial output look finished.
+    Renditions are moved first and the master last; other entries in
+    `output_dir` (the just-in-time rendition) are left alone.
+    """
+    try:
+        yield
+        os.makedirs(output_dir, exist_ok=True)
+        names = sorted(os.listdir(work_dir), key=lambda name: name == HLS_MASTER_PLAYLIST)
+        for name in names:
+            target = os.path.join(output_dir, name)
+            if os.path.isdir(target):
+                shutil.rmtree(target)
+            os.replace(os.path.join(work_dir, name), target)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
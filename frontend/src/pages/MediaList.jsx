@@ -24,29 +24,54 @@ function getMediaIcon(type) {
   return <MovieIcon fontSize="large" />;
 }
 
+const PAGE_SIZE = 60;
+
 export default function MediaList() {
   const [media, setMedia] = useState([]);
+  const [genres, setGenres] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
   const [loading, setLoading] = useState(true);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [search, setSearch] = useState('');
   const [genre, setGenre] = useState('');
 
+  // One page at a time; the server returns the cursor of the next page in X-Next-Cursor
+  async function fetchPage(after) {
+    const params = { limit: PAGE_SIZE };
+    if (genre) params.genre = genre;
+    if (after) params.after = after;
+    const res = await api.get('/media', { params });
+    setNextCursor(res.headers['x-next-cursor'] || null);
+    return res.data;
+  }
+
   useEffect(() => {
     async function fetchMedia() {
       setLoading(true);
       try {
-        const res = await api.get('/media');
-        setMedia(res.data);
+        const items = await fetchPage(null);
+        setMedia(items);
+        setGenres(prev => Array.from(new Set([...prev, ...items.map(m => m.genre).filter(Boolean)])));
       } finally {
         setLoading(false);
       }
     }
     fetchMedia();
-  }, []);
+  }, [genre]);
+
+  async function loadMore() {
+    setLoadingMore(true);
+    try {
+      const items = await fetchPage(nextCursor);
+      setMedia(prev => [...prev, ...items]);
+      setGenres(prev => Array.from(new Set([...prev, ...items.map(m => m.genre).filter(Boolean)])));
+    } finally {
+      setLoadingMore(false);
+    }
+  }
 
-  const genres = Array.from(new Set(media.map(m => m.genre).filter(Boolean)));
   const filtered = media.filter(item =>
-    (!search || item.filename.toLowerCase().includes(search.toLowerCase())) &&
-    (!genre || item.genre === genre)
+    !search || item.filename.toLowerCase().includes(search.toLowerCase())
   );
 
   return (
@@ -91,7 +116,7 @@ export default function MediaList() {
           const type = getMediaType(item.filename);
           let thumb = null;
           if (type === 'image') {
-            thumb = `http://localhost:8000/media/stream/${item.id}`;
+            thumb = `http://localhost:8000/media/${item.id}/image?w=480&h=360&format=webp`;
           }
           return (
             <Grid item xs={12} sm={6} md={4} lg={3} key={item.id}>
@@ -118,6 +143,13 @@ export default function MediaList() {
           );
         })}
       </Grid>
+      {!loading && nextCursor && (
+        <Box display="flex" justifyContent="center" mt={4}>
+          <Button variant="outlined" onClick={loadMore} disabled={loadingMore}>
+            {loadingMore ? 'Loading...' : 'Load more'}
+          </Button>
+        </Box>
+      )}
     </Box>
   );
 } 
\ No newline at end of file
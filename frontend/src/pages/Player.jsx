@@ -45,10 +45,14 @@ export default function Player() {
     async function fetchMedia() {
       setLoading(true);
       try {
-        const res = await api.get('/media');
-        const item = res.data.find(m => m.id === parseInt(id));
+        const res = await api.get(`/media/${id}`);
+        const item = res.data;
         setMedia(item);
-        setRelated(res.data.filter(m => m.id !== parseInt(id) && (m.genre === item.genre || m.tags.some(t => item.tags.includes(t)))));
+        // Related: items sharing the genre or a tag, one small page per filter
+        const filters = [item.genre && { genre: item.genre }, ...item.tags.map(tag => ({ tag }))].filter(Boolean);
+        const pages = await Promise.all(filters.map(params => api.get('/media', { params: { ...params, limit: 12 } })));
+        const seen = new Set([item.id]);
+        setRelated(pages.flatMap(page => page.data).filter(m => !seen.has(m.id) && seen.add(m.id)));
         // Fetch file info
         if (item) {
           const statRes = await api.get(`/media/stat/${item.id}`);
@@ -129,6 +133,7 @@ export default function Player() {
         ],
         settings: ['quality', 'speed', 'loop'],
         keyboard: { focused: true, global: true },
+        previewThumbnails: { enabled: true, src: `/media/${media.id}/sprites.vtt` },
       });
       return () => {
         hls.destroy();
@@ -203,10 +208,10 @@ export default function Player() {
                       <Typography mt={2}>Processing video for streaming... Please wait.</Typography>
                     </Box>
                   ) : hlsReady ? (
-                    <video ref={videoRef} controls style={{ maxWidth: '100%', height: 'auto', display: 'block', margin: '0 auto' }} />
+                    <video ref={videoRef} poster={`/media/${media.id}/poster`} controls style={{ maxWidth: '100%', height: 'auto', display: 'block', margin: '0 auto' }} />
                   ) : null
                 ) : (
-                  <video src={src} controls style={{ maxWidth: '100%', height: 'auto', display: 'block', margin: '0 auto' }} />
+                  <video src={src} poster={`/media/${media.id}/poster`} controls style={{ maxWidth: '100%', height: 'auto', display: 'block', margin: '0 auto' }} />
                 )}
               </Box>
             </Box>
@@ -245,7 +250,7 @@ export default function Player() {
                 <Grid item xs={12} sm={6} md={3} key={item.id} sx={{ minWidth: 220 }}>
                   <Card sx={{ bgcolor: 'background.paper', borderRadius: 2, boxShadow: 2 }}>
                     {getMediaType(item.filename) === 'image' ? (
-                      <CardMedia component="img" height="120" image={`/media/stream/${item.id}`} alt={item.filename} sx={{ objectFit: 'cover' }} />
+                      <CardMedia component="img" height="120" image={`/media/${item.id}/image?w=320&h=240&format=webp`} alt={item.filename} sx={{ objectFit: 'cover' }} />
                     ) : (
                       <Box height={120} display="flex" alignItems="center" justifyContent="center" bgcolor="#222">
                         <Typography variant="h3">{getMediaType(item.filename).toUpperCase()}</Typography>
@@ -0,0 +1,148 @@
+"""Shared fixtures. The app reads its settings at import time, so the
+environment is pointed at a throwaway database and media root before any
+backend module is imported.
+"""
+import os
+import json
+import shutil
+import sys
+import tempfile
+from urllib.parse import urlencode
+
+_ROOT = tempfile.mkdtemp(prefix="stream-server-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_ROOT, 'test.db')}"
+os.environ["MEDIA_ROOT"] = os.path.join(_ROOT, "media")
+os.environ["AUDIT_LOG_MODE"] = "sync"
+os.environ["PROFILER_ENABLED"] = "0"
+os.environ["FILE_DELIVERY"] = "app"
+
+import pytest
+from sqlalchemy import text
+from fastapi.testclient import TestClient
+from backend.database import engine, SessionLocal
+from backend.models import Base, User
+from backend.auth.hashing import get_password_hash
+from backend.utils.file import MEDIA_ROOT
+import backend.crud.search as search
+from backend.scheduler import transcode_scheduler
+from backend.auth.principals import principal_cache
+
+ADMIN_PASSWORD = "admin-password"
+
+
+@pytest.fixture
+def db():
+    """A session on an empty schema and an empty MEDIA_ROOT."""
+    with engine.begin() as conn:
+        conn.execute(text("DROP TABLE IF EXISTS media_fts"))
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    search._fts_enabled = None
+    # Job ids queued in memory by an earlier test would point at rows of the new schema
+    with transcode_scheduler._cond:
+        transcode_scheduler._queue.clear()
+        transcode_scheduler._known.clear()
+    # Tokens minted in the same second are identical across tests
+    principal_cache.clear()
+    shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+    os.makedirs(MEDIA_ROOT)
+    session = SessionLocal()
+    yield session
+    session.close()
+
+
+@pytest.fixture
+def admin(db):
+    user = User(username="admin", hashed_password=get_password_hash(ADMIN_PASSWORD), role="admin", is_approved=1)
+    db.add(user)
+    db.commit()
+    return user
+
+
+@pytest.fixture
+def client(admin):
+    from backend.main import app
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+@pytest.fixture
+def auth_headers(client):
+    response = client.post("/login", data={"username": "admin", "password": ADMIN_PASSWORD})
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+@pytest.fixture
+def server(admin):
+    """The app under uvicorn on a local port, for tests that need real sockets and streamed bodies."""
+    from backend.main import app
+    from backend.bench.harness import BenchServer
+    with BenchServer(app) as running:
+        yield running
+
+
+@pytest.fixture
+def server_token(server):
+    body = urlencode({"username": "admin", "password": ADMIN_PASSWORD})
+    _, _, data = server.client().request(
+        "POST", "/login", body=body, headers={"Content-Type": "application/x-www-form-urlencoded"}, keep_body=True
+    )
+    return json.loads(data)["access_token"]
+
+
+_FFMPEG_STUB = r'''#!{python}
+# ffmpeg/ffprobe stand-in for the tests. STUB_FFMPEG_FAIL=1 makes ffmpeg exit
+# with an error after writing part of its output, like a crashed encode.
+import json, os, sys
+args = sys.argv[1:]
+if os.path.basename(sys.argv[0]) == "ffprobe":
+    print(json.dumps({{"streams": [{{"codec_type": "video", "codec_name": "hevc", "width": 1280, "height": 720}}],
+                      "format": {{"format_name": "mov,mp4", "duration": "8.0"}}}}))
+    sys.exit(0)
+fail = os.environ.get("STUB_FFMPEG_FAIL") == "1"
+out = args[-1]
+
+def finished():
+    # What run_ffmpeg's -progress pipe:1 sees at the end of an encode
+    if "-progress" in args:
+        print("progress=end", flush=True)
+    sys.exit(0)
+
+if "-var_stream_map" in args:
+    work_dir = os.path.dirname(os.path.dirname(out))
+    names = [entry.split("name:")[1] for entry in args[args.index("-var_stream_map") + 1].split()]
+    master = args[args.index("-master_pl_name") + 1]
+    with open(os.path.join(work_dir, master), "w") as f:
+        f.write("#EXTM3U\n" + "".join(f"#EXT-X-STREAM-INF:BANDWIDTH=1\n{{name}}/playlist.m3u8\n" for name in names))
+    if fail:
+        sys.exit(1)
+    for name in names:
+        with open(os.path.join(work_dir, name, "segment_000.ts"), "wb") as f:
+            f.write(b"ts")
+        with open(os.path.join(work_dir, name, "playlist.m3u8"), "w") as f:
+            f.write("#EXTM3U\n#EXTINF:4.0,\nsegment_000.ts\n#EXT-X-ENDLIST\n")
+    finished()
+if out == "pipe:1":
+    if fail:
+        sys.exit(1)
+    sys.stdout.buffer.write(b"x" * 65536)
+    sys.exit(0)
+with open(out, "wb") as f:
+    f.write(b"x" * 100)
+if fail:
+    sys.exit(1)
+finished()
+'''
+
+
+@pytest.fixture
+def stub_ffmpeg(tmp_path, monkeypatch):
+    """Put stand-in ffmpeg/ffprobe binaries first on PATH; returns their directory."""
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    for name in ("ffmpeg", "ffprobe"):
+        path = bin_dir / name
+        path.write_text(_FFMPEG_STUB.format(python=sys.executable))
+        path.chmod(0o755)
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+    return bin_dir
@@ -0,0 +1,26 @@
+import logging
+from datetime import datetime
+from backend.audit import AuditSink
+from backend.models import AuditLog
+
+
+def _entry(action, timestamp=None):
+    return {"user_id": 1, "username": "admin", "action": action, "target_type": "media", "target_id": 1,
+            "timestamp": timestamp or datetime.utcnow(), "details": None}
+
+
+def test_failed_batch_is_logged_and_written_row_by_row(db, caplog):
+    sink = AuditSink(mode="async")
+    sink.start()
+    try:
+        sink.record(db, _entry("first"))
+        sink.record(db, _entry("broken", timestamp="not a timestamp"))
+        sink.record(db, _entry("second"))
+        with caplog.at_level(logging.ERROR, logger="backend.audit"):
+            sink.flush(timeout=10)
+    finally:
+        sink.stop()
+    assert sorted(action for action, in db.query(AuditLog.action)) == ["first", "second"]
+    messages = [record.getMessage() for record in caplog.records]
+    assert any("retrying them one by one" in message for message in messages)
+    assert any("Dropped audit entry" in message and "broken" in message for message in messages)
@@ -0,0 +1,31 @@
+import time
+from sqlalchemy import text
+from backend.auth.principals import principal_cache
+from backend.models import User
+
+_ADMIN_ONLY = "/admin/users/unapproved"
+
+
+def test_demotion_applies_to_cached_principals(client, db, auth_headers):
+    assert client.get(_ADMIN_ONLY, headers=auth_headers).status_code == 200
+    db.query(User).filter(User.username == "admin").update({"role": "user"})
+    db.commit()
+    assert client.get(_ADMIN_ONLY, headers=auth_headers).status_code == 403
+
+
+def test_deactivation_applies_to_cached_principals(client, db, admin, auth_headers):
+    assert client.get("/me", headers=auth_headers).status_code == 200
+    admin.is_approved = 0
+    db.commit()
+    assert client.get("/me", headers=auth_headers).status_code == 401
+
+
+def test_changes_outside_the_orm_apply_within_the_ttl(client, db, auth_headers, monkeypatch):
+    monkeypatch.setattr(principal_cache, "ttl", 0.2)
+    assert client.get("/me", headers=auth_headers).status_code == 200
+    db.execute(text("UPDATE user SET is_approved = 0 WHERE username = 'admin'"))
+    db.commit()
+    # Still served from the cache until the entry expires
+    assert client.get("/me", headers=auth_headers).status_code == 200
+    time.sleep(0.3)
+    assert client.get("/me", headers=auth_headers).status_code == 401
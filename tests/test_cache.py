@@ -0,0 +1,71 @@
+import os
+from datetime import datetime, timedelta
+from backend.cache import derivative_cache, hls_path
+from backend.models import CacheEntry, Media, TranscodeJob
+from backend.utils.file import MEDIA_ROOT
+
+SHA = "ab" * 32
+
+
+def _media(db, filename):
+    media = Media(filename=filename, filepath=f"/x/{filename}")
+    db.add(media)
+    db.commit()
+    return media
+
+
+def _old_entry(db, media_id, kind, path):
+    if kind == "hls":
+        os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, "segment_000.ts") if kind == "hls" else path, "wb") as f:
+        f.write(b"x" * 1024)
+    entry = derivative_cache.register(db, media_id, kind, path)
+    entry.last_access = datetime.utcnow() - timedelta(days=1)
+    db.commit()
+    return entry
+
+
+def test_shared_output_in_use_by_another_duplicates_job(db):
+    first, second = _media(db, "a.mp4"), _media(db, "b.mp4")
+    entry = _old_entry(db, first.id, "hls", hls_path(SHA))
+    # The running transcode was queued through the other media row
+    db.add(TranscodeJob(media_id=second.id, preset="hls", state="running", input_path="/x/b.mp4", output_path=entry.path))
+    db.commit()
+    assert derivative_cache.in_use(db, entry)
+    derivative_cache.evict_if_needed(db, max_bytes=1)
+    assert os.path.isdir(entry.path)
+    assert db.query(CacheEntry).count() == 1
+
+
+def test_recently_streamed_low_file_is_kept(db):
+    media = _media(db, "c.mp4")
+    entry = _old_entry(db, media.id, "low", os.path.join(os.path.dirname(hls_path(SHA)), "c.low.mp4"))
+    derivative_cache.hit("low", entry.path)
+    assert derivative_cache.in_use(db, entry)
+    derivative_cache.evict_if_needed(db, max_bytes=1)
+    assert os.path.exists(entry.path)
+
+
+def test_idle_low_file_is_evicted(db):
+    media = _media(db, "d.mp4")
+    entry = _old_entry(db, media.id, "low", os.path.join(os.path.dirname(hls_path(SHA)), "d.low.mp4"))
+    assert not derivative_cache.in_use(db, entry)
+    derivative_cache.evict_if_needed(db, max_bytes=1)
+    assert not os.path.exists(entry.path)
+
+
+def test_scan_indexes_low_files_in_the_blob_store_and_subdirectories(db):
+    blob_source = os.path.join(MEDIA_ROOT, ".blobs", "ab", "ab", SHA + ".mp3")
+    library_source = os.path.join(MEDIA_ROOT, "music", "song.flac")
+    for path in (blob_source + ".low.mp3", library_source + ".low.mp3"):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(b"x" * 10)
+    first = Media(filename="a.mp3", filepath=blob_source)
+    duplicate = Media(filename="b.mp3", filepath=blob_source)
+    in_place = Media(filename="music/song.flac", filepath=library_source)
+    db.add_all([first, duplicate, in_place])
+    db.commit()
+    derivative_cache.scan(db)
+    entries = {(entry.media_id, entry.path) for entry in db.query(CacheEntry).filter(CacheEntry.kind == "low")}
+    assert entries == {(first.id, blob_source + ".low.mp3"), (in_place.id, library_source + ".low.mp3")}
@@ -0,0 +1,102 @@
+import os
+import sys
+import pytest
+import backend.downloads as downloads
+import backend.api.media as media_api
+from backend.auth.hashing import get_password_hash
+from backend.downloads import DownloadManager, build_command, parse_progress
+from backend.models import DownloadJob, Media, TranscodeJob, User
+
+_YTDLP_STUB = r'''#!{python}
+# yt-dlp stand-in: prints the progress/filepath lines requested by build_command.
+# A URL ending in /fail exits with an error instead.
+import os, sys
+args = sys.argv[1:]
+url = args[-1]
+if url.endswith("/fail"):
+    print("ERROR: [generic] Unable to download webpage: HTTP Error 404")
+    sys.exit(1)
+output_dir = os.path.dirname(args[args.index("-o") + 1])
+print("[generic] Extracting URL: " + url)
+print("[progress] 0 NA 100")
+print("[progress] 40 100 NA")
+print("[progress] 100 100 NA")
+path = os.path.join(output_dir, "Clip [abc123].mp4")
+with open(path, "wb") as f:
+    f.write(b"x" * 100)
+print("[filepath] " + path)
+'''
+
+
+@pytest.fixture
+def stub_ytdlp(tmp_path, monkeypatch):
+    path = tmp_path / "yt-dlp"
+    path.write_text(_YTDLP_STUB.format(python=sys.executable))
+    path.chmod(0o755)
+    monkeypatch.setattr(downloads, "YTDLP_BINARY", str(path))
+    monkeypatch.setattr(downloads, "PROGRESS_INTERVAL", 0)
+    return path
+
+
+def _run(db, admin, url):
+    """Queue and run one download on the calling thread."""
+    manager = DownloadManager(workers=0)
+    job = manager.submit(db, url, "best", "clips", ["a", "b"], admin.id)
+    claimed = manager._claim(db, job.id)
+    manager._run(db, claimed)
+    db.refresh(claimed)
+    return claimed
+
+
+def test_parse_progress():
+    assert parse_progress("[progress] 40 100 NA") == (40, 100)
+    assert parse_progress("[progress] 0 NA 250.0") == (0, 250)
+    assert parse_progress("[progress] NA NA NA") is None
+    assert parse_progress("[progress] 40 100") is None
+
+
+def test_download_is_added_to_the_catalog(db, admin, stub_ytdlp):
+    job = _run(db, admin, "https://example.com/watch")
+    assert job.state == 'done'
+    assert job.progress == 1.0
+    assert (job.downloaded_bytes, job.total_bytes) == (100, 100)
+    media = db.query(Media).filter(Media.id == job.media_id).one()
+    assert media.filename == "Clip [abc123].mp4"
+    assert media.uploader_id == admin.id
+    assert os.path.isfile(media.filepath) and job.filepath == media.filepath
+    # Videos get their HLS ladder queued
+    transcode = db.query(TranscodeJob).filter(TranscodeJob.id == job.transcode_job_id).one()
+    assert (transcode.media_id, transcode.preset) == (media.id, "hls")
+
+
+def test_failed_download_records_the_error(db, admin, stub_ytdlp):
+    job = _run(db, admin, "https://example.com/fail")
+    assert job.state == 'failed'
+    assert "HTTP Error 404" in job.error
+    assert job.media_id is None
+    assert db.query(Media).count() == 0
+    assert db.query(DownloadJob).filter(DownloadJob.state.in_(('queued', 'running'))).count() == 0
+
+
+def test_url_is_never_read_as_an_option():
+    command = build_command("-x--exec=touch pwned", "best", "/tmp/out")
+    assert command[-2:] == ["--", "-x--exec=touch pwned"]
+
+
+def test_same_url_from_two_users_gets_two_jobs(client, db, admin, auth_headers, monkeypatch):
+    other = User(username="other", hashed_password=get_password_hash("other-password"), role="user", is_approved=1)
+    db.add(other)
+    db.commit()
+    token = client.post("/login", data={"username": "other", "password": "other-password"}).json()["access_token"]
+    other_headers = {"Authorization": f"Bearer {token}"}
+    # Jobs stay queued: this manager has no workers
+    monkeypatch.setattr(media_api, "download_manager", DownloadManager(workers=0))
+    url = "https://example.com/watch"
+    first = client.post("/media/download", json={"url": url, "genre": "a"}, headers=auth_headers).json()["job_id"]
+    again = client.post("/media/download", json={"url": url}, headers=auth_headers).json()["job_id"]
+    second = client.post("/media/download", json={"url": url, "genre": "b", "tags": ["t"]},
+                         headers=other_headers).json()["job_id"]
+    assert again == first and second != first
+    assert client.get(f"/media/downloads/{second}", headers=other_headers).status_code == 200
+    job = db.query(DownloadJob).filter(DownloadJob.id == second).one()
+    assert (job.user_id, job.genre, job.tags) == (other.id, "b", "t")
@@ -0,0 +1,65 @@
+import os
+import sys
+import time
+import pytest
+import backend.hls_ondemand as hls_ondemand
+from backend.hls_ondemand import OnDemandHLS, SegmentUnavailable
+
+_JIT_FFMPEG_STUB = r'''#!{python}
+# Just-in-time ffmpeg stand-in: writes two segments from -start_number, a moment
+# apart, then keeps running for a while like an encoder ahead of its clients.
+import os, sys, time
+args = sys.argv[1:]
+pattern = args[args.index("-hls_segment_filename") + 1]
+start = int(args[args.index("-start_number") + 1])
+for index in (start, start + 1):
+    time.sleep(0.3)
+    path = pattern.replace("%03d", f"{{index:03d}}")
+    with open(path + ".tmp", "wb") as f:
+        f.write(b"ts")
+    os.replace(path + ".tmp", path)
+time.sleep(2)
+'''
+
+
+@pytest.fixture
+def jit(tmp_path, monkeypatch):
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    ffmpeg = bin_dir / "ffmpeg"
+    ffmpeg.write_text(_JIT_FFMPEG_STUB.format(python=sys.executable))
+    ffmpeg.chmod(0o755)
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+    monkeypatch.setattr(hls_ondemand, "probe_media", lambda path: {"duration": 40.0, "height": 720})
+    on_demand = OnDemandHLS()
+    yield on_demand
+    on_demand.stop()
+
+
+def test_segment_request_waits_for_the_encoder(jit, tmp_path):
+    started = time.monotonic()
+    path = jit.segment("/x/a.mp4", str(tmp_path / "a"), 3)
+    assert os.path.isfile(path) and path.endswith("segment_003.ts")
+    assert time.monotonic() - started < 5
+    # The next segment comes from the same encoder
+    assert jit.segment("/x/a.mp4", str(tmp_path / "a"), 4).endswith("segment_004.ts")
+    assert jit.active() == 1
+
+
+def test_encoders_are_capped(jit, tmp_path, monkeypatch):
+    monkeypatch.setattr(hls_ondemand, "HLS_ON_DEMAND_MAX_ENCODERS", 1)
+    jit.segment("/x/a.mp4", str(tmp_path / "a"), 0)
+    with pytest.raises(SegmentUnavailable):
+        jit.segment("/x/b.mp4", str(tmp_path / "b"), 0)
+    # A seek on the item already encoding replaces its encoder
+    assert jit.segment("/x/a.mp4", str(tmp_path / "a"), 8).endswith("segment_008.ts")
+
+
+def test_probe_cache_is_bounded(jit, monkeypatch):
+    probed = []
+    monkeypatch.setattr(hls_ondemand, "HLS_ON_DEMAND_PROBE_CACHE", 2)
+    monkeypatch.setattr(hls_ondemand, "probe_media", lambda path: probed.append(path) or {"duration": 8.0})
+    for path in ("/x/a.mp4", "/x/b.mp4", "/x/a.mp4", "/x/c.mp4", "/x/a.mp4", "/x/b.mp4"):
+        jit.segment_count(path)
+    # a stays cached as the most recently used entry; b was dropped for c
+    assert probed == ["/x/a.mp4", "/x/b.mp4", "/x/c.mp4", "/x/b.mp4"]
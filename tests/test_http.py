@@ -0,0 +1,162 @@
+import os
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+import backend.utils.http as http
+from backend.utils.file import MEDIA_ROOT
+
+
+@pytest.fixture
+def files(tmp_path):
+    """A file inside MEDIA_ROOT, one outside it, and an app serving either by name."""
+    os.makedirs(os.path.join(MEDIA_ROOT, "hls", "ab cd"), exist_ok=True)
+    inside = os.path.join(MEDIA_ROOT, "hls", "ab cd", "segment_000.ts")
+    outside = str(tmp_path / "outside.mp4")
+    for path in (inside, outside):
+        with open(path, "wb") as f:
+            f.write(b"0123456789")
+    app = FastAPI()
+
+    @app.get("/file/{name}")
+    def get_file(name: str, request: Request):
+        return http.send_file(request, inside if name == "inside" else outside)
+
+    return TestClient(app), inside, outside
+
+
+def test_nginx_redirects_to_the_internal_location(files, monkeypatch):
+    client, inside, _ = files
+    monkeypatch.setattr(http, "FILE_DELIVERY", "nginx")
+    monkeypatch.setattr(http, "ACCEL_REDIRECT_PREFIX", "/_protected_media/")
+    response = client.get("/file/inside")
+    assert response.status_code == 200
+    assert response.headers["x-accel-redirect"] == "/_protected_media/hls/ab%20cd/segment_000.ts"
+    assert response.content == b""
+    assert response.headers["etag"] == http.make_etag(os.stat(inside))
+
+
+def test_sendfile_names_the_real_path(files, monkeypatch):
+    client, inside, _ = files
+    monkeypatch.setattr(http, "FILE_DELIVERY", "sendfile")
+    response = client.get("/file/inside")
+    assert response.headers["x-sendfile"] == os.path.realpath(inside)
+    assert response.content == b""
+
+
+@pytest.mark.parametrize("delivery", ["nginx", "sendfile"])
+def test_conditional_requests_are_answered_by_the_app(files, monkeypatch, delivery):
+    client, inside, _ = files
+    monkeypatch.setattr(http, "FILE_DELIVERY", delivery)
+    etag = http.make_etag(os.stat(inside))
+    not_modified = client.get("/file/inside", headers={"If-None-Match": etag})
+    assert not_modified.status_code == 304
+    failed = client.get("/file/inside", headers={"If-Match": '"something-else"'})
+    assert failed.status_code == 412
+    for response in (not_modified, failed):
+        assert "x-accel-redirect" not in response.headers
+        assert "x-sendfile" not in response.headers
+
+
+@pytest.mark.parametrize("delivery", ["nginx", "sendfile"])
+def test_files_outside_media_root_are_served_by_the_app(files, monkeypatch, delivery):
+    client, _, _ = files
+    monkeypatch.setattr(http, "FILE_DELIVERY", delivery)
+    response = client.get("/file/outside", headers={"Range": "bytes=2-4"})
+    assert response.status_code == 206
+    assert response.content == b"234"
+    assert "x-accel-redirect" not in response.headers
+    assert "x-sendfile" not in response.headers
+
+
+@pytest.mark.parametrize("header, size, expected", [
+    ("bytes=0-4", 10, [(0, 4)]),
+    ("bytes=-3", 10, [(7, 9)]),
+    ("bytes=-30", 10, [(0, 9)]),
+    ("bytes=6-", 10, [(6, 9)]),
+    ("bytes=8-20", 10, [(8, 9)]),
+    ("bytes=5-7, 0-2, 3-4", 10, [(0, 7)]),
+    ("bytes=0-3,2-5,8-9", 10, [(0, 5), (8, 9)]),
+    ("bytes=10-12", 10, []),
+    ("bytes=-0", 10, []),
+    ("bytes=-5", 0, []),
+    ("bytes=0-", 0, []),
+    (None, 10, None),
+    ("items=0-4", 10, None),
+    ("bytes=4-2", 10, None),
+    ("bytes=a-b", 10, None),
+    ("bytes=-", 10, None),
+    ("bytes=" + ",".join(f"{i}-{i}" for i in range(0, 2 * (http.MAX_RANGES + 1), 2)), 100, None),
+])
+def test_parse_range_header(header, size, expected):
+    assert http.parse_range_header(header, size) == expected
+
+
+@pytest.fixture
+def app_file(tmp_path):
+    """The app serving a 10-byte file and an empty one."""
+    path = tmp_path / "file.bin"
+    path.write_bytes(b"0123456789")
+    empty = tmp_path / "empty.bin"
+    empty.write_bytes(b"")
+    app = FastAPI()
+
+    @app.api_route("/file/{name}", methods=["GET", "HEAD"])
+    def get_file(name: str, request: Request):
+        return http.send_file(request, str(path if name == "full" else empty))
+
+    client = TestClient(app)
+    return client, http.make_etag(os.stat(path)), client.get("/file/full").headers["last-modified"]
+
+
+def test_single_range(app_file):
+    client, _, _ = app_file
+    response = client.get("/file/full", headers={"Range": "bytes=2-4"})
+    assert response.status_code == 206
+    assert response.headers["content-range"] == "bytes 2-4/10"
+    assert response.headers["content-length"] == "3"
+    assert response.content == b"234"
+
+
+def test_unsatisfiable_range(app_file):
+    client, _, _ = app_file
+    response = client.get("/file/full", headers={"Range": "bytes=20-30"})
+    assert response.status_code == 416
+    assert response.headers["content-range"] == "bytes */10"
+    empty = client.get("/file/empty", headers={"Range": "bytes=-5"})
+    assert empty.status_code == 416
+    assert empty.headers["content-range"] == "bytes */0"
+
+
+def test_if_range(app_file):
+    client, etag, last_modified = app_file
+    fresh = client.get("/file/full", headers={"Range": "bytes=0-1", "If-Range": etag})
+    assert (fresh.status_code, fresh.content) == (206, b"01")
+    dated = client.get("/file/full", headers={"Range": "bytes=0-1", "If-Range": last_modified})
+    assert dated.status_code == 206
+    # A changed validator gets the whole current file instead of a range of it
+    for stale in ('"0-0-0"', "Thu, 01 Jan 1970 00:00:00 GMT"):
+        response = client.get("/file/full", headers={"Range": "bytes=0-1", "If-Range": stale})
+        assert (response.status_code, response.content) == (200, b"0123456789")
+
+
+def test_multipart_byteranges(app_file):
+    client, _, _ = app_file
+    response = client.get("/file/full", headers={"Range": "bytes=0-1,5-6"})
+    assert response.status_code == 206
+    media_type, _, boundary = response.headers["content-type"].partition("; boundary=")
+    assert media_type == "multipart/byteranges"
+    assert int(response.headers["content-length"]) == len(response.content)
+    parts = response.content.split(f"--{boundary}".encode())
+    assert parts[0] == b"" and parts[-1] == b"--\r\n"
+    assert [part.split(b"\r\n\r\n", 1)[1] for part in parts[1:-1]] == [b"01\r\n", b"56\r\n"]
+    assert b"Content-Range: bytes 5-6/10" in parts[2]
+
+
+def test_head(app_file):
+    client, etag, _ = app_file
+    response = client.head("/file/full", headers={"Range": "bytes=0-1"})
+    assert response.status_code == 200
+    assert response.headers["content-length"] == "10"
+    assert response.headers["etag"] == etag
+    assert response.headers["accept-ranges"] == "bytes"
+    assert response.content == b""
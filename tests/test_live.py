@@ -0,0 +1,57 @@
+import os
+import time
+from types import SimpleNamespace
+import pytest
+import backend.live as live
+from backend.database import SessionLocal
+from backend.live import live_transcoder
+from backend.models import Media, TranscodeJob
+from backend.utils.file import MEDIA_ROOT
+
+
+@pytest.fixture
+def video(db):
+    path = os.path.join(MEDIA_ROOT, "a.mp4")
+    with open(path, "wb") as f:
+        f.write(b"x" * 100)
+    media = Media(filename="a.mp4", filepath=path)
+    db.add(media)
+    db.commit()
+    return media
+
+
+@pytest.fixture
+def one_encoder(monkeypatch):
+    monkeypatch.setattr(live, "LIVE_MAX_ENCODERS", 1)
+    yield
+    with live_transcoder._lock:
+        live_transcoder._encoders.pop("/elsewhere.low.mp4", None)
+
+
+def test_live_stream_below_the_cap(client, video, stub_ffmpeg, one_encoder):
+    response = client.get(f"/media/stream/{video.id}?quality=low")
+    assert response.status_code == 200
+    assert response.headers["x-transcode"] == "live"
+    assert response.content == b"x" * 65536
+
+
+def test_at_the_cap_requests_are_queued(client, db, video, stub_ffmpeg, one_encoder):
+    with live_transcoder._lock:
+        live_transcoder._encoders["/elsewhere.low.mp4"] = SimpleNamespace(killed=False)
+    response = client.get(f"/media/stream/{video.id}?quality=low")
+    assert response.status_code == 202
+    job = db.query(TranscodeJob).filter(TranscodeJob.id == response.json()["job_id"]).one()
+    assert (job.media_id, job.preset) == (video.id, "low")
+    assert client.head(f"/media/stream/{video.id}?quality=low").status_code == 202
+    # The queued encode runs on the scheduler's workers
+    deadline = time.monotonic() + 10
+    while True:
+        check = SessionLocal()
+        try:
+            state = check.query(TranscodeJob.state).filter(TranscodeJob.id == job.id).scalar()
+        finally:
+            check.close()
+        if state not in ('queued', 'running') or time.monotonic() > deadline:
+            break
+        time.sleep(0.05)
+    assert state == 'done'
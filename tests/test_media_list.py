@@ -0,0 +1,22 @@
+from backend.crud.media import create_media_bulk
+
+
+def test_listing_is_paged_by_default(client, db, auth_headers):
+    ids = create_media_bulk(db, [{"filename": f"clip{i:03d}.mp4", "filepath": f"/x/clip{i:03d}.mp4"} for i in range(105)])
+    first = client.get("/media", headers=auth_headers)
+    assert first.status_code == 200
+    assert [item["id"] for item in first.json()] == ids[:100]
+    cursor = first.headers["x-next-cursor"]
+    rest = client.get("/media", params={"after": cursor}, headers=auth_headers)
+    assert [item["id"] for item in rest.json()] == ids[100:]
+    assert "x-next-cursor" not in rest.headers
+    assert client.get("/media", params={"limit": 1001}, headers=auth_headers).status_code == 422
+
+
+def test_single_item(client, db, auth_headers):
+    media_id, = create_media_bulk(db, [{"filename": "a.mp4", "filepath": "/x/a.mp4", "genre": "travel", "tags": ["beach"]}])
+    item = client.get(f"/media/{media_id}", headers=auth_headers).json()
+    assert (item["filename"], item["genre"], item["tags"]) == ("a.mp4", "travel", ["beach"])
+    assert client.get("/media/999", headers=auth_headers).status_code == 404
+    # Fixed routes are not shadowed by /media/{media_id}
+    assert client.get("/media/jobs", headers=auth_headers).status_code == 200
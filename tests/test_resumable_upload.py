@@ -0,0 +1,109 @@
+import time
+import threading
+import pytest
+import backend.crud.uploads as crud_uploads
+import backend.uploads as uploads
+from backend.crud.uploads import get_upload_session
+from backend.database import SessionLocal
+from backend.models import Blob, UploadChunk
+from backend.uploads import UploadSessions, ChunkConflict, UploadIncomplete, upload_sessions
+
+
+def test_complete_requires_every_byte(db, admin):
+    session = upload_sessions.create(db, admin.id, "a.bin", 10)
+    # Lengths add up to the size, but bytes 8-9 are missing
+    db.add_all([
+        UploadChunk(session_id=session.id, offset=0, length=6, state='received'),
+        UploadChunk(session_id=session.id, offset=4, length=4, state='received'),
+    ])
+    db.commit()
+    with pytest.raises(UploadIncomplete):
+        upload_sessions.complete(db, session)
+
+
+def test_overlapping_reservations_from_two_processes(db, admin, monkeypatch):
+    session_id = upload_sessions.create(db, admin.id, "a.bin", 10).id
+    find_overlapping_chunk = crud_uploads.find_overlapping_chunk
+
+    def slow_find(*args):
+        # Widen the window between the overlap check and the insert
+        found = find_overlapping_chunk(*args)
+        time.sleep(0.3)
+        return found
+
+    monkeypatch.setattr(crud_uploads, "find_overlapping_chunk", slow_find)
+    results = []
+
+    def reserve(offset):
+        # A separate UploadSessions stands in for another server process
+        sessions, own_db = UploadSessions(), SessionLocal()
+        try:
+            results.append(sessions._reserve(own_db, session_id, offset, 6))
+        except ChunkConflict as e:
+            results.append(e)
+        finally:
+            own_db.close()
+
+    threads = [threading.Thread(target=reserve, args=(offset,)) for offset in (0, 4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sum(isinstance(result, ChunkConflict) for result in results) == 1
+    assert db.query(UploadChunk).filter(UploadChunk.session_id == session_id).count() == 1
+
+
+def _received(db, session):
+    with open(session.path, "wb") as f:
+        f.write(b"0123456789")
+    db.add(UploadChunk(session_id=session.id, offset=0, length=10, state='received'))
+    db.commit()
+
+
+def test_completion_is_claimed_once_across_processes(db, admin, monkeypatch):
+    session_id = upload_sessions.create(db, admin.id, "a.bin", 10).id
+    _received(db, get_upload_session(db, session_id))
+    file_sha256 = uploads.file_sha256
+
+    def slow_sha256(path):
+        # Keep the first completion going while the second one starts
+        time.sleep(0.3)
+        return file_sha256(path)
+
+    monkeypatch.setattr(uploads, "file_sha256", slow_sha256)
+    results = []
+
+    def complete():
+        # A separate UploadSessions stands in for another server process
+        sessions, own_db = UploadSessions(), SessionLocal()
+        try:
+            results.append(sessions.complete(own_db, get_upload_session(own_db, session_id)).sha256)
+        except UploadIncomplete as e:
+            results.append(e)
+        finally:
+            own_db.close()
+
+    threads = [threading.Thread(target=complete) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sum(isinstance(result, UploadIncomplete) for result in results) == 1
+    assert db.query(Blob).count() == 1
+    assert get_upload_session(db, session_id) is None
+
+
+def test_failed_completion_can_be_retried(db, admin):
+    session = upload_sessions.create(db, admin.id, "a.bin", 10)
+    with pytest.raises(UploadIncomplete):
+        upload_sessions.complete(db, session)
+    _received(db, session)
+    assert upload_sessions.complete(db, session) is not None
+
+
+def test_completion_left_by_a_dead_process_is_taken_over(db, admin, monkeypatch):
+    session = upload_sessions.create(db, admin.id, "a.bin", 10)
+    _received(db, session)
+    assert crud_uploads.claim_upload_session(db, session.id, 4242)
+    monkeypatch.setattr(uploads, "_pid_alive", lambda pid: pid != 4242)
+    assert upload_sessions.complete(db, session) is not None
@@ -0,0 +1,71 @@
+import os
+from backend.cache import derivative_cache, hls_path
+from backend.crud.jobs import get_active_job
+from backend.crud.media import set_media_info
+from backend.database import SessionLocal
+from backend.models import CacheEntry, Media, ScanEntry
+from backend.scan import scan_library
+from backend.scheduler import transcode_scheduler
+from backend.utils.transcoding import hls_output_complete
+from backend.utils.file import MEDIA_ROOT
+
+
+def _write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def test_scanning_a_subdirectory_keeps_the_rest_of_the_index(db):
+    _write(os.path.join(MEDIA_ROOT, "a", "one.mp3"), b"x")
+    _write(os.path.join(MEDIA_ROOT, "b", "two.mp3"), b"x")
+    scan_library(db, os.path.join(MEDIA_ROOT, "a"), workers=2)
+    scan_library(db, os.path.join(MEDIA_ROOT, "b"), workers=2)
+    stats = scan_library(db, os.path.join(MEDIA_ROOT, "a"), workers=2)
+    assert (stats["unchanged"], stats["missing"]) == (1, 0)
+    assert db.query(ScanEntry).count() == 2
+    # A full scan still notices files that went away
+    os.remove(os.path.join(MEDIA_ROOT, "b", "two.mp3"))
+    assert scan_library(db, MEDIA_ROOT, workers=2)["missing"] == 1
+
+
+def test_changed_file_is_probed_and_transcoded_again(db):
+    path = os.path.join(MEDIA_ROOT, "clip.mp4")
+    _write(path, b"old")
+    scan_library(db, MEDIA_ROOT, workers=2)
+    media = db.query(Media).filter(Media.filepath == path).one()
+    first_job = get_active_job(db, media.id, "hls")
+    set_media_info(db, media.id, {"container": "mov,mp4", "duration": 8.0, "height": 720})
+    _write(os.path.join(hls_path(media.id), "master.m3u8"), b"#EXTM3U\n")
+    derivative_cache.register(db, media.id, "hls", hls_path(media.id))
+    _write(path, b"new content")
+    stats = scan_library(db, MEDIA_ROOT, workers=2)
+    assert stats["changed"] == 1
+    db.refresh(media)
+    assert media.probed_at is None and media.duration is None
+    assert not os.path.exists(hls_path(media.id))
+    job = get_active_job(db, media.id, "hls")
+    assert job is not None and job.id != first_job.id
+
+
+def test_job_running_on_the_old_content_is_superseded(db, stub_ffmpeg):
+    path = os.path.join(MEDIA_ROOT, "clip.mp4")
+    _write(path, b"old")
+    scan_library(db, MEDIA_ROOT, workers=2)
+    media = db.query(Media).filter(Media.filepath == path).one()
+    worker_db = SessionLocal()
+    try:
+        running = transcode_scheduler._claim(worker_db, get_active_job(db, media.id, "hls").id)
+        _write(path, b"new content")
+        scan_library(db, MEDIA_ROOT, workers=2)
+        replacement = get_active_job(db, media.id, "hls")
+        assert replacement is not None and replacement.id != running.id
+        # The old encode reaches its end after the scan and must not publish or register anything
+        transcode_scheduler._run(worker_db, running)
+        assert running.state == 'cancelled'
+    finally:
+        worker_db.close()
+    assert not hls_output_complete(hls_path(media.id))
+    assert db.query(CacheEntry).filter(CacheEntry.path == hls_path(media.id)).count() == 0
+    db.refresh(replacement)
+    assert replacement.state == 'queued'
@@ -0,0 +1,142 @@
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+from sqlalchemy.exc import IntegrityError
+from backend.auth.hashing import get_password_hash
+from backend.database import SessionLocal
+from backend.models import Media, TranscodeJob, User
+import backend.scheduler as scheduler
+from backend.scheduler import transcode_scheduler
+from backend.utils.file import MEDIA_ROOT
+
+
+def _media(db, filename):
+    media = Media(filename=filename, filepath=f"/x/{filename}")
+    db.add(media)
+    db.commit()
+    return media
+
+
+def _finished_job(media_id, preset, output_path):
+    """A job another process queued and finished while this one was inserting."""
+    other = SessionLocal()
+    try:
+        job = TranscodeJob(media_id=media_id, preset=preset, input_path="/x/in", output_path=output_path,
+                           priority=0, state='done', progress=1.0, finished_at=datetime.utcnow())
+        other.add(job)
+        other.commit()
+        return job.id
+    finally:
+        other.close()
+
+
+def test_submit_retries_when_the_winning_job_already_finished(db, monkeypatch):
+    media = _media(db, "a.mp4")
+    create_job = scheduler.create_job
+    calls = []
+
+    def losing_once(*args):
+        calls.append(args)
+        if len(calls) == 1:
+            _finished_job(media.id, "low", "/x/a.low.mp4")
+            raise IntegrityError("INSERT", {}, Exception("UNIQUE constraint failed"))
+        return create_job(*args)
+
+    monkeypatch.setattr(scheduler, "create_job", losing_once)
+    job = transcode_scheduler.submit(db, media.id, "low", "/x/a.mp4", "/x/a.low.mp4")
+    assert job is not None and job.state == 'queued'
+    assert len(calls) == 2
+
+
+def test_submit_returns_the_finished_job_when_every_insert_loses(db, monkeypatch):
+    media = _media(db, "a.mp4")
+    done_id = _finished_job(media.id, "low", "/x/a.low.mp4")
+
+    def always_losing(*args):
+        raise IntegrityError("INSERT", {}, Exception("UNIQUE constraint failed"))
+
+    monkeypatch.setattr(scheduler, "create_job", always_losing)
+    job = transcode_scheduler.submit(db, media.id, "low", "/x/a.mp4", "/x/a.low.mp4")
+    assert job.id == done_id and job.state == 'done'
+
+
+def test_trigger_hls_without_a_job_is_not_a_server_error(client, db, monkeypatch):
+    media = _media(db, "a.mp4")
+    monkeypatch.setattr(transcode_scheduler, "submit", lambda *args, **kwargs: None)
+    response = client.post(f"/media/hls/{media.id}/trigger")
+    assert response.status_code == 200
+    assert response.json()["job_id"] is None
+
+
+_SLOW_FFMPEG_STUB = r'''#!{python}
+# ffmpeg stand-in that starts writing its output and then runs until killed
+import sys, time
+with open(sys.argv[-1], "wb") as f:
+    f.write(b"x")
+time.sleep(60)
+'''
+
+
+def _low_job(db, media):
+    job = transcode_scheduler.submit(db, media.id, "low", media.filepath, os.path.join(MEDIA_ROOT, f"{media.filename}.low.mp4"))
+    return job, os.path.splitext(job.output_path)[0] + f".part.{job.id}.mp4"
+
+
+def test_stop_kills_running_ffmpeg(db, tmp_path, monkeypatch):
+    ffmpeg = tmp_path / "ffmpeg"
+    ffmpeg.write_text(_SLOW_FFMPEG_STUB.format(python=sys.executable))
+    ffmpeg.chmod(0o755)
+    monkeypatch.setenv("PATH", f"{tmp_path}{os.pathsep}{os.environ['PATH']}")
+    monkeypatch.setattr(scheduler, "probe_media", lambda path: {})
+    monkeypatch.setattr(scheduler, "set_media_info", lambda *args: None)
+    pool = scheduler.TranscodeScheduler(workers=0)
+    job, part = _low_job(db, _media(db, "a.mp4"))
+    worker_db = SessionLocal()
+    try:
+        running = pool._claim(worker_db, job.id)
+        worker = threading.Thread(target=pool._run, args=(worker_db, running))
+        worker.start()
+        deadline = time.monotonic() + 10
+        while not pool._procs and time.monotonic() < deadline:
+            time.sleep(0.05)
+        proc = pool._procs[job.id]
+        pool.stop()
+        worker.join(timeout=10)
+    finally:
+        worker_db.close()
+    assert not worker.is_alive() and proc.poll() is not None
+    assert not os.path.exists(part)
+    # Left for the next start to requeue
+    db.refresh(job)
+    assert job.state == 'running'
+
+
+def test_failed_low_encode_leaves_no_partial_file(db, stub_ffmpeg, monkeypatch):
+    monkeypatch.setenv("STUB_FFMPEG_FAIL", "1")
+    pool = scheduler.TranscodeScheduler(workers=0)
+    job, part = _low_job(db, _media(db, "a.mp4"))
+    pool._run(db, pool._claim(db, job.id))
+    db.refresh(job)
+    assert job.state == 'failed'
+    assert not os.path.exists(part) and not os.path.exists(job.output_path)
+
+
+def test_users_only_see_jobs_of_their_own_media(client, db, admin, auth_headers):
+    other = User(username="other", hashed_password=get_password_hash("other-password"), role="user", is_approved=1)
+    db.add(other)
+    db.commit()
+    token = client.post("/login", data={"username": "other", "password": "other-password"}).json()["access_token"]
+    other_headers = {"Authorization": f"Bearer {token}"}
+    mine = Media(filename="mine.mp4", filepath="/x/mine.mp4", uploader_id=other.id)
+    theirs = Media(filename="theirs.mp4", filepath="/x/theirs.mp4", uploader_id=admin.id)
+    db.add_all([mine, theirs])
+    db.commit()
+    my_job, _ = _low_job(db, mine)
+    their_job, _ = _low_job(db, theirs)
+    assert [job["id"] for job in client.get("/media/jobs", headers=other_headers).json()] == [my_job.id]
+    assert client.get(f"/media/jobs/{my_job.id}", headers=other_headers).status_code == 200
+    assert client.get(f"/media/jobs/{their_job.id}", headers=other_headers).status_code == 404
+    assert len(client.get("/media/jobs", headers=auth_headers).json()) == 2
+    assert client.get(f"/media/jobs/{my_job.id}", headers=auth_headers).status_code == 200
@@ -0,0 +1,37 @@
+from sqlalchemy import text
+from backend.database import engine
+from backend.models import Media
+from backend.crud.media import create_media, update_media
+from backend.crud.search import ensure_search_index, search_media_ids
+import backend.crud.search as search
+
+
+def _fts_exists(db):
+    return db.execute(text("SELECT 1 FROM sqlite_master WHERE name = 'media_fts'")).first() is not None
+
+
+def test_index_is_created_on_its_own_connection(db):
+    create_media(db, "before.mp4", "/x/before.mp4", None, [], None)
+    assert ensure_search_index(engine)
+    assert _fts_exists(db)
+    create_media(db, "holiday video.mp4", "/x/holiday.mp4", "travel", ["beach"], None)
+    assert search_media_ids(db, "holi") == [db.query(Media.id).filter(Media.filename == "holiday video.mp4").scalar()]
+    assert len(search_media_ids(db, "before")) == 1
+
+
+def test_create_media_without_index_does_not_build_it(db):
+    media = create_media(db, "clip.mp4", "/x/clip.mp4", "genre", ["tag"], None)
+    assert db.query(Media).count() == 1
+    assert not _fts_exists(db)
+    # LIKE fallback still finds it
+    assert search_media_ids(db, "clip") == [media.id]
+
+
+def test_without_fts5_first_upload_is_kept(db, admin, monkeypatch):
+    monkeypatch.setattr(search, "_CREATE_FTS", "CREATE VIRTUAL TABLE media_fts USING no_such_module(filename)")
+    assert not ensure_search_index(engine)
+    create_media(db, "first.mp4", "/x/first.mp4", "genre", ["a", "b"], None)
+    second = create_media(db, "second.mp4", "/x/second.mp4", None, [], None)
+    update_media(db, second.id, {"filepath": "/y/second.mp4"}, admin)
+    assert {m.filename for m in db.query(Media)} == {"first.mp4", "second.mp4"}
+    assert search_media_ids(db, "second") == [second.id]
@@ -0,0 +1,72 @@
+import os
+import pytest
+import subprocess
+from backend.cache import hls_path
+from backend.models import Media, TranscodeJob
+from backend.scheduler import transcode_scheduler
+import backend.utils.transcoding as transcoding
+from backend.utils.transcoding import HLS_MASTER_PLAYLIST, hls_output_complete, transcode_to_hls
+
+# Not stream-copyable, so the full ladder is encoded
+INFO = {"video_codec": "hevc", "height": 480, "width": 854, "has_audio": False}
+
+
+def _work_dirs(output_dir):
+    parent, name = os.path.split(output_dir)
+    return [entry for entry in os.listdir(parent) if entry.startswith(name + ".part")]
+
+
+def test_ladder_is_published_when_complete(db, stub_ffmpeg):
+    output_dir = hls_path(1)
+    os.makedirs(os.path.join(output_dir, "jit"))
+    transcode_to_hls("/x/in.mkv", output_dir, info=INFO)
+    assert hls_output_complete(output_dir)
+    assert sorted(os.listdir(output_dir)) == ["240p", "480p", "jit", HLS_MASTER_PLAYLIST]
+    assert not _work_dirs(output_dir)
+
+
+def test_failed_ladder_leaves_no_master(db, stub_ffmpeg, monkeypatch):
+    output_dir = hls_path(2)
+    os.makedirs(os.path.join(output_dir, "jit"))
+    monkeypatch.setenv("STUB_FFMPEG_FAIL", "1")
+    with pytest.raises(subprocess.CalledProcessError):
+        transcode_to_hls("/x/in.mkv", output_dir, info=INFO)
+    assert os.listdir(output_dir) == ["jit"]
+    assert not _work_dirs(output_dir)
+    assert not hls_output_complete(output_dir)
+
+
+def test_partial_output_is_queued_again(db):
+    media = Media(filename="partial.mkv", filepath="/x/partial.mkv")
+    db.add(media)
+    db.commit()
+    output_dir = hls_path(media.id)
+    os.makedirs(os.path.join(output_dir, "480p"))
+    # Left by a killed encode from before work directories were used
+    with open(os.path.join(output_dir, HLS_MASTER_PLAYLIST), "w") as f:
+        f.write("#EXTM3U\n#EXT-X-STREAM-INF:BANDWIDTH=1\n480p/playlist.m3u8\n")
+    with open(os.path.join(output_dir, "480p", "playlist.m3u8"), "w") as f:
+        f.write("#EXTM3U\n#EXTINF:4.0,\nsegment_000.ts\n")
+    job = transcode_scheduler.queue_video_derivatives(db, media.id, media.filepath, media.id)
+    assert job is not None and job.preset == "hls"
+    assert db.query(TranscodeJob).filter(TranscodeJob.output_path == output_dir).count() == 1
+
+
+def test_copied_source_tops_the_encoded_ladder(db, stub_ffmpeg, monkeypatch):
+    commands = []
+    run_ffmpeg = transcoding.run_ffmpeg
+    monkeypatch.setattr(transcoding, "run_ffmpeg", lambda cmd, *args: commands.append(cmd) or run_ffmpeg(cmd, *args))
+    monkeypatch.setattr(transcoding, "HLS_STREAM_COPY", True)
+    info = {"video_codec": "h264", "pix_fmt": "yuv420p", "audio_codec": "aac",
+            "height": 720, "width": 1280, "bitrate": 3_000_000}
+    output_dir = hls_path(3)
+    transcode_to_hls("/x/in.mp4", output_dir, info=info)
+    assert hls_output_complete(output_dir)
+    cmd = commands[0]
+    # One pass: two encoded rungs and the copied source
+    assert cmd[cmd.index("-var_stream_map") + 1] == "v:0,a:0,name:240p v:1,a:1,name:480p v:2,a:2,name:720p"
+    assert cmd[cmd.index("-c:v:2") + 1] == "copy" and cmd[cmd.index("-c:a:2") + 1] == "copy"
+    with open(os.path.join(output_dir, HLS_MASTER_PLAYLIST)) as f:
+        master = f.read()
+    assert "BANDWIDTH=464000,RESOLUTION=426x240\n240p/playlist.m3u8" in master
+    assert "BANDWIDTH=3000000,RESOLUTION=1280x720\n720p/playlist.m3u8" in master
@@ -0,0 +1,61 @@
+import os
+import stat
+import tracemalloc
+from backend.database import SessionLocal
+from backend.models import Blob
+from backend.utils.file import _UMASK
+
+MB = 1024 * 1024
+UPLOAD_MB = 256
+# Python-level allocations allowed while the whole upload is in flight
+MEMORY_BOUND = 32 * MB
+
+
+def _multipart(filename: str, size: int, boundary: str = "test-boundary-41c2"):
+    block = os.urandom(MB)
+    head = (
+        f"--{boundary}\r\n"
+        f'Content-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+        "Content-Type: application/octet-stream\r\n\r\n"
+    ).encode()
+    tail = f"\r\n--{boundary}--\r\n".encode()
+
+    def body():
+        yield head
+        for offset in range(0, size, MB):
+            yield block[:size - offset]
+        yield tail
+
+    headers = {
+        "Content-Type": f"multipart/form-data; boundary={boundary}",
+        "Content-Length": str(len(head) + size + len(tail)),
+    }
+    return body(), headers
+
+
+def test_large_upload_memory_stays_bounded(server, server_token):
+    size = UPLOAD_MB * MB
+    body, headers = _multipart("large.bin", size)
+    tracemalloc.start()
+    try:
+        status, _, _ = server.client().request(
+            "POST", "/media/upload", body=body, headers={**headers, "Authorization": f"Bearer {server_token}"}
+        )
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert status == 200
+    assert peak < MEMORY_BOUND, f"peak traced memory {peak / MB:.1f} MiB"
+    db = SessionLocal()
+    try:
+        blob = db.query(Blob).one()
+    finally:
+        db.close()
+    assert os.path.getsize(blob.path) == size
+
+
+def test_stored_upload_is_readable_by_other_users(client, auth_headers):
+    response = client.post("/media/upload", files={"file": ("small.bin", b"x" * 1000)}, headers=auth_headers)
+    assert response.status_code == 200
+    mode = stat.S_IMODE(os.stat(response.json()["filepath"]).st_mode)
+    assert mode == 0o666 & ~_UMASK